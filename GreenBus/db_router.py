@@ -0,0 +1,164 @@
+"""
+Routes the read-only customer views to read replicas.
+
+``ReplicaMiddleware`` marks requests for the views named in
+``REPLICA_READ_VIEWS`` as replica-safe; ``ReplicaRouter`` then sends their
+reads to one of ``DATABASE_REPLICAS`` in round-robin, skipping replicas that
+are down or lag behind. Everything else, and every write, uses ``default``.
+
+Each worker checks a replica at most every ``REPLICA_CHECK_SECONDS`` as it
+picks it: a replica that cannot be reached, or that has not replayed the
+primary's writes for more than ``REPLICA_MAX_LAG_SECONDS``, is skipped for
+``REPLICA_RETRY_SECONDS``. A query that fails on a replica marks it down at
+once.
+
+After a successful call to one of ``PRIMARY_PIN_VIEWS`` the client (keyed by
+its Authorization header, session or address) is pinned to the primary for
+``REPLICA_PIN_SECONDS`` so it reads its own booking instead of a lagging
+replica. Pins live in the default cache, so ``CACHES`` must point at a cache
+shared by all workers (``GREENBUS_CACHE_URL``); ``check_pin_cache`` warns
+otherwise.
+"""
+import hashlib
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import OperationalError, connections
+
+_read_alias = ContextVar("read_alias", default=None)
+
+
+class ReplicaPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._down_until = {}
+        self._checked_at = {}
+
+    @property
+    def aliases(self):
+        return getattr(settings, "DATABASE_REPLICAS", [])
+
+    def choose(self):
+        """Next healthy replica in round-robin order, or ``None`` to read from the primary."""
+        aliases = self.aliases
+        if not aliases:
+            return None
+        start = next(self._counter)
+        for offset in range(len(aliases)):
+            alias = aliases[(start + offset) % len(aliases)]
+            if self._healthy(alias):
+                return alias
+        return None
+
+    def _healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            down_until = self._down_until.get(alias)
+            if down_until is not None and down_until > now:
+                return False
+            due = now - self._checked_at.get(alias, float("-inf")) >= getattr(settings, "REPLICA_CHECK_SECONDS", 5)
+            if due:
+                # Claimed under the lock, so one thread checks while the others go on with the last result.
+                self._checked_at[alias] = now
+        if not due:
+            return down_until is None
+        return self._probe(alias)
+
+    def _probe(self, alias):
+        try:
+            lag = self._lag(alias)
+        except OperationalError:
+            self.mark_down(alias)
+            return False
+        if lag is not None and lag > getattr(settings, "REPLICA_MAX_LAG_SECONDS", 10):
+            self.mark_down(alias)
+            return False
+        with self._lock:
+            self._down_until.pop(alias, None)
+        return True
+
+    def _lag(self, alias):
+        """Seconds the replica is behind the primary; ``None`` if it is not a standby (as in tests)."""
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                "SELECT CASE WHEN NOT pg_is_in_recovery() THEN NULL "
+                "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+            )
+            return cursor.fetchone()[0]
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._down_until[alias] = time.monotonic() + getattr(settings, "REPLICA_RETRY_SECONDS", 30)
+
+
+replicas = ReplicaPool()
+
+
+def check_pin_cache(app_configs, **kwargs):
+    if getattr(settings, "DATABASE_REPLICAS", []) and isinstance(caches["default"], (LocMemCache, DummyCache)):
+        return [checks.Warning(
+            "Read replicas are configured but the default cache is not shared between processes, "
+            "so primary pins only hold within the worker that served the write.",
+            hint="Set GREENBUS_CACHE_URL to a Redis server shared by all workers.",
+            id="GreenBus.W001",
+        )]
+    return []
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+def _pin_key(request):
+    identity = (request.META.get("HTTP_AUTHORIZATION")
+                or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+                or request.META.get("REMOTE_ADDR", ""))
+    return "db-pin:" + hashlib.sha256(identity.encode()).hexdigest()
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.replica_alias = None
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.set(None)
+
+        match = request.resolver_match
+        if match and match.url_name in settings.PRIMARY_PIN_VIEWS and response.status_code < 400:
+            cache.set(_pin_key(request), True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.resolver_match.url_name in settings.REPLICA_READ_VIEWS and replicas.aliases:
+            if not cache.get(_pin_key(request)):
+                request.replica_alias = replicas.choose()
+        _read_alias.set(request.replica_alias)
+        return None
+
+    def process_exception(self, request, exception):
+        if request.replica_alias and isinstance(exception, OperationalError):
+            replicas.mark_down(request.replica_alias)
+        return None
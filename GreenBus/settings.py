@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -51,6 +52,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'GreenBus.db_router.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,18 +83,91 @@ CHANNEL_LAYERS = {
 }
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-'rest_framework.authentication.TokenAuthentication',
-            'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'GreenBus_App.authentication.ClaimsJWTAuthentication',
+        'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'GreenBus_App.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    # Reverse proxies in front of the app; X-Forwarded-For is only trusted that many hops deep, so
+    # per-address throttles key on the address the outermost proxy saw. 0 uses REMOTE_ADDR alone.
+    'NUM_PROXIES': int(os.environ.get('GREENBUS_NUM_PROXIES', '0')),
+    # Token buckets (GreenBus_App.throttling): capacity / refill period per client.
+    'DEFAULT_THROTTLE_RATES': {
+        'search_user': '30/min',
+        'search_ip': '120/min',
+        'booking_user': '10/min',
+        'booking_ip': '60/min',
+        'seats_ip': '60/min',
+        'autocomplete_ip': '600/min',
+    },
+}
+# Work done by GreenBus.asgi before a worker serves requests (see GreenBus.warmup).
+WARMUP_ENABLED = os.environ.get('GREENBUS_WARMUP', '1') != '0'
+WARMUP_STEPS = [
+    'GreenBus.warmup.compile_urls',
+    'GreenBus.warmup.build_serializer_fields',
+    'GreenBus.warmup.open_database_connections',
+    'GreenBus.warmup.load_indexes',
+]
+
+# Render and parse JSON with orjson when it is installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+        'GreenBus_App.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ]
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = [
+        'GreenBus_App.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ]
+
+# Route customer_book_seat through per-bus batching workers (GreenBus_App.booking_queue) during flash sales.
+BOOKING_ADMISSION = {
+    'ENABLED': os.environ.get('GREENBUS_BOOKING_QUEUE') == '1',
+    'QUEUE_SIZE': 200,
+    'BATCH_SIZE': 50,
+}
+# Booking side effects are stored in the outbox and delivered by `manage.py relay_outbox` (GreenBus_App.outbox).
+# The relay must share the channel layer with the ASGI workers to reach websocket clients.
+OUTBOX = {
+    'SINKS': ['GreenBus_App.outbox.ChannelLayerSink', 'GreenBus_App.notifications.NotificationSink',
+              'GreenBus_App.availability.AvailabilitySink'],
+    'BATCH_SIZE': 200,
+    'POLL_SECONDS': 0.5,
+    'MAX_ATTEMPTS': 10,
 }
+if os.environ.get('GREENBUS_OUTBOX_FILE'):
+    OUTBOX['SINKS'].append('GreenBus_App.outbox.FileSink')
+    OUTBOX['FILE_PATH'] = os.environ['GREENBUS_OUTBOX_FILE']
+# Customer notifications queued by the outbox relay and sent by `manage.py send_notifications`.
+NOTIFICATIONS = {
+    'BACKEND': os.environ.get('GREENBUS_NOTIFICATION_BACKEND', 'GreenBus_App.notifications.ConsoleBackend'),
+    'WORKERS': 4,
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_SECONDS': 30,
+    'FILE_PATH': os.environ.get('GREENBUS_NOTIFICATION_FILE'),
+}
+# Seconds a calendar day stays cached per stop pair (GreenBus_App.availability); refreshes invalidate it sooner.
+AVAILABILITY_CACHE_SECONDS = 300
+# Minutes a customer has to pay for seats the waitlist held for them (GreenBus_App.waitlist).
+WAITLIST_HOLD_MINUTES = 15
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': False,
+    'TOKEN_OBTAIN_SERIALIZER': 'GreenBus_App.authentication.GreenBusTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'GreenBus_App.authentication.GreenBusTokenRefreshSerializer',
 }
 
 
@@ -110,6 +185,56 @@ DATABASES = {
     }
 }
 
+# Pool connections with psycopg 3 when psycopg_pool is installed; otherwise keep persistent connections.
+# CONN_HEALTH_CHECKS makes the pool check each connection as it is handed out.
+try:
+    import psycopg_pool
+except ImportError:
+    psycopg_pool = None
+
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+if psycopg_pool:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('GREENBUS_DB_POOL_MIN', 2)),
+            'max_size': int(os.environ.get('GREENBUS_DB_POOL_MAX', 20)),
+            'max_idle': 300,    # seconds before an idle connection above min_size is closed
+            'timeout': 10,      # seconds a request waits for a free connection
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = 300
+
+# Read replicas as "host:port,host:port"; each gets the primary's credentials and database name.
+DATABASE_REPLICAS = []
+for index, address in enumerate(filter(None, os.environ.get('GREENBUS_DB_REPLICAS', '').split(','))):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica_{index + 1}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'PORT': port or '5432', 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['GreenBus.db_router.ReplicaRouter']
+# URL names of read-only views whose queries may go to a replica.
+REPLICA_READ_VIEWS = {'get-available-seats', 'customer_search_buses', 'get-bus-routes', 'customer_view_tickets'}
+# URL names of booking writes after which the client reads from the primary for REPLICA_PIN_SECONDS.
+PRIMARY_PIN_VIEWS = {'customer_book_seat', 'cancel-ticket', 'customer_make_payment'}
+REPLICA_PIN_SECONDS = 10
+# Each worker re-checks a replica this often; one that is unreachable or lags more than
+# REPLICA_MAX_LAG_SECONDS is skipped for REPLICA_RETRY_SECONDS.
+REPLICA_CHECK_SECONDS = 5
+REPLICA_MAX_LAG_SECONDS = 10
+REPLICA_RETRY_SECONDS = 30
+
+# Primary pins, token revocations and calendar versions must be seen by every worker, so production
+# points this at a shared Redis; the per-process default only suits a single worker. Throttle buckets
+# are not cached: each worker process enforces its own share of the rates (see throttling.py).
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+if os.environ.get('GREENBUS_CACHE_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['GREENBUS_CACHE_URL'],
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
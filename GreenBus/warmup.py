@@ -0,0 +1,75 @@
+"""
+Warm-up run by ``GreenBus.asgi`` before a worker accepts traffic.
+
+Each step in ``settings.WARMUP_STEPS`` is a dotted path to a callable. It
+does work that the first requests on a fresh worker would otherwise pay
+for. A failing step is logged and skipped, so a worker still starts, for
+example while the database is unreachable. Set ``GREENBUS_WARMUP=0`` to skip
+the warm-up entirely.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """Run the configured steps; returns ``{step: milliseconds}`` (``None`` for steps that failed)."""
+    timings = {}
+    if not getattr(settings, "WARMUP_ENABLED", True):
+        return timings
+    for path in getattr(settings, "WARMUP_STEPS", []):
+        started = time.perf_counter()
+        try:
+            import_string(path)()
+        except Exception:
+            logger.exception("Warm-up step %s failed", path)
+            timings[path] = None
+        else:
+            timings[path] = round((time.perf_counter() - started) * 1000, 1)
+    # Connections opened here belong to the startup thread; request threads open their own.
+    close_old_connections()
+    logger.info("Warm-up finished: %s", timings)
+    return timings
+
+
+def compile_urls():
+    """Populate the resolver's reverse tables and compile every URL pattern's regex."""
+    resolver = get_resolver()
+    resolver.reverse_dict  # noqa: B018 - populates the resolver caches
+
+    def compile_patterns(patterns):
+        for pattern in patterns:
+            pattern.pattern.regex  # noqa: B018 - compiled lazily on first access
+            if isinstance(pattern, URLResolver):
+                compile_patterns(pattern.url_patterns)
+            elif isinstance(pattern, URLPattern):
+                pattern.lookup_str  # noqa: B018
+
+    compile_patterns(resolver.url_patterns)
+
+
+def build_serializer_fields():
+    """Import the API and build each viewset's serializer fields, filling the model ``_meta`` caches."""
+    from GreenBus_App.urls import router
+
+    for _, viewset, _ in router.registry:
+        viewset.serializer_class().fields  # noqa: B018
+
+
+def open_database_connections():
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def load_indexes():
+    from GreenBus_App.journey_planner import planner
+    from GreenBus_App.stop_index import stop_index
+
+    planner.rebuild()
+    stop_index.rebuild()
@@ -1,12 +1,325 @@
-from django.contrib import admin
+from collections import defaultdict
 
-from GreenBus_App.models import UserModel, PaymentModel, TicketModel, BusModel, CompanyModel, RouteModel
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-# Register your models here.
-admin.site.register(UserModel)
-admin.site.register(PaymentModel)
-admin.site.register(TicketModel)
-admin.site.register(BusModel)
-admin.site.register(CompanyModel)
-admin.site.register(RouteModel)
+from GreenBus_App import availability, outbox, rollups
+from GreenBus_App.journey_planner import planner
+from GreenBus_App.models import UserModel, PaymentModel, TicketModel, BusModel, CompanyModel, RouteModel, StopModel, \
+    ArchivedBusModel, ArchivedTicketModel, ArchivedPaymentModel, BusDayRollup, SegmentDayRollup, WaitlistModel, \
+    OutboxEvent, NotificationModel
 
+
+class EstimatedCountPaginator(Paginator):
+    """Uses the planner's row estimate instead of ``COUNT(*)`` for unfiltered changelists of large tables."""
+
+    estimate_above = 100_000
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                               [connection.ops.quote_name(self.object_list.model._meta.db_table)])
+                row = cursor.fetchone()
+            if row and row[0] > self.estimate_above:
+                return row[0]
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist defaults for tables that grow with bookings.
+
+    Searches only use exact lookups on indexed columns: each ``(lookup, cast)`` in
+    ``search_lookups`` is tried with the search term, instead of ``icontains`` scans.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    search_lookups = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = Q()
+        for lookup, cast in self.search_lookups:
+            try:
+                condition |= Q(**{lookup: cast(search_term)})
+            except ValueError:
+                continue
+        return (queryset.filter(condition) if condition else queryset.none()), False
+
+
+def parse_seats(value):
+    return sorted({int(seat) for seat in value.replace(" ", "").split(",") if seat})
+
+
+def mark_tickets_paid(tickets):
+    """Mark the tickets' latest payment Paid, creating the missing ones, in a fixed number of queries."""
+    latest = PaymentModel.objects.filter(ticket=OuterRef("ticketId")).order_by("-id")
+    with transaction.atomic():
+        # Tickets are locked before their payments are read, as make_payment does, so a payment made
+        # meanwhile is either seen here or waits and then finds the ticket paid.
+        ticket_ids = list(TicketModel.objects.select_for_update().filter(ticketId__in=tickets.values("ticketId"))
+                          .order_by("ticketId").values_list("ticketId", flat=True))
+        unpaid = list(
+            TicketModel.objects.filter(ticketId__in=ticket_ids)
+            .annotate(latest_status=Subquery(latest.values("paymentStatus")[:1]),
+                      latest_id=Subquery(latest.values("id")[:1]))
+            .filter(Q(latest_status__isnull=True) | Q(latest_status="Pending"))
+            .values_list("ticketId", "customer_id", "latest_id", "bus_id", "ticketPrice")
+        )
+        if not unpaid:
+            return 0
+        rollups.record_payments(TicketModel.objects.filter(ticketId__in=[row[0] for row in unpaid]))
+        PaymentModel.objects.filter(id__in=[payment_id for _, _, payment_id, _, _ in unpaid if payment_id]) \
+            .update(paymentStatus="Paid")
+        created = PaymentModel.objects.bulk_create(
+            PaymentModel(customer_id=customer_id, ticket_id=ticket_id, paymentStatus="Paid")
+            for ticket_id, customer_id, payment_id, _, _ in unpaid if payment_id is None
+        )
+        created_ids = {payment.ticket_id: payment.id for payment in created}
+        # Like waitlist.confirm_hold: a paid hold is a confirmed booking.
+        WaitlistModel.objects.filter(ticket_id__in=[row[0] for row in unpaid], status="Held") \
+            .update(status="Confirmed")
+        outbox.publish(*(
+            outbox.payment_paid(bus_id, ticket_id, customer_id, payment_id or created_ids[ticket_id], price)
+            for ticket_id, customer_id, payment_id, bus_id, price in unpaid
+        ))
+    return len(unpaid)
+
+
+class BlockSeatsForm(ActionForm):
+    seats = forms.CharField(required=False, label="Seats",
+                            help_text="Comma-separated seat numbers for “Block seats”, e.g. 1,2,15.")
+
+
+@admin.register(BusModel)
+class BusAdmin(LargeTableAdmin):
+    list_display = ("busNo", "busCompany", "date", "boardingTime", "fromWhere", "toWhere", "totalSeats",
+                    "perSeatPrice")
+    list_select_related = ("busCompany",)
+    list_filter = ("boardingTime",)
+    date_hierarchy = "date"
+    autocomplete_fields = ("busCompany",)
+    search_fields = ("busNo",)
+    search_help_text = "Exact bus number."
+    search_lookups = (("busNo", int),)
+    action_form = BlockSeatsForm
+    actions = ("block_seats", "cancel_trips")
+
+    @admin.action(description="Block seats on selected buses")
+    def block_seats(self, request, queryset):
+        try:
+            seats = parse_seats(request.POST.get("seats", ""))
+        except ValueError:
+            seats = None
+        if not seats or seats[0] < 1:
+            self.message_user(request, "Enter the seat numbers to block, e.g. 1,2,15.", messages.ERROR)
+            return
+        bus_ids = list(queryset.values_list("id", flat=True))
+        BusModel.objects.filter(id__in=bus_ids).update(
+            blockedSeats=RawSQL('ARRAY(SELECT DISTINCT seat FROM unnest(array_cat("blockedSeats", %s::integer[])) '
+                                'AS seat WHERE seat <= "totalSeats" ORDER BY seat)', (seats,)),
+            availableSeats=RawSQL('ARRAY(SELECT seat FROM unnest("availableSeats") AS seat '
+                                  'WHERE seat <> ALL(%s::integer[]) ORDER BY seat)', (seats,)),
+            seatVersion=F("seatVersion") + 1,
+        )
+        for bus_id in bus_ids:
+            planner.mark_dirty(bus_id)
+        availability.refresh(bus_ids)
+        self.message_user(request, f"Blocked seats {seats} on {len(bus_ids)} bus(es).", messages.SUCCESS)
+
+    @admin.action(description="Cancel trip: cancel all tickets and close booking")
+    def cancel_trips(self, request, queryset):
+        with transaction.atomic():
+            bus_ids = list(BusModel.objects.select_for_update().filter(id__in=queryset.values("id"))
+                           .values_list("id", flat=True))
+            rollups.record_trip_cancellations(bus_ids)
+            tickets = defaultdict(list)
+            for bus_id, ticket_id, customer_id in (TicketModel.objects.select_for_update().filter(bus_id__in=bus_ids)
+                                                   .order_by("ticketId")
+                                                   .values_list("bus_id", "ticketId", "customer_id")):
+                tickets[bus_id].append((ticket_id, customer_id))
+            # Waiting entries can never be filled now and Held ones lose their ticket; both are closed,
+            # locked after the tickets as in waitlist.expire_holds.
+            entries = list(WaitlistModel.objects.select_for_update(of=("self",)).select_related("ticket")
+                           .filter(bus_id__in=bus_ids, status__in=["Waiting", "Held"]))
+            for entry in entries:
+                entry.status, entry.holdExpiresAt = "Cancelled", None
+            WaitlistModel.objects.filter(id__in=[entry.id for entry in entries]) \
+                .update(status="Cancelled", holdExpiresAt=None)
+            outbox.publish(*(outbox.trip_cancelled(bus_id, tickets[bus_id]) for bus_id in bus_ids), *(
+                outbox.waitlist_update(outbox.WAITLIST_CANCELLED, entry,
+                                       "The operator cancelled this trip, so your waitlist request is closed.")
+                for entry in entries
+            ))
+            cancelled = TicketModel.objects.filter(bus_id__in=bus_ids).delete()[1].get(TicketModel._meta.label, 0)
+            RouteModel.objects.filter(bus_id__in=bus_ids).update(bookedSeats=[])
+            BusModel.objects.filter(id__in=bus_ids).update(
+                blockedSeats=RawSQL('ARRAY(SELECT generate_series(1, "totalSeats"))', ()),
+                bookedSeats=[], availableSeats=[], seatVersion=F("seatVersion") + 1,
+            )
+        for bus_id in bus_ids:
+            planner.mark_dirty(bus_id)
+        self.message_user(request, f"Cancelled {len(bus_ids)} trip(s) and {cancelled} ticket(s).", messages.SUCCESS)
+
+
+@admin.register(RouteModel)
+class RouteAdmin(LargeTableAdmin):
+    list_display = ("bus", "stopName", "stopOrder")
+    list_select_related = ("bus",)
+    raw_id_fields = ("bus",)
+    search_fields = ("stopName",)
+    search_help_text = "Exact bus number or stop name."
+    search_lookups = (("bus__busNo", int), ("stop__stopName", str))
+
+
+@admin.register(TicketModel)
+class TicketAdmin(LargeTableAdmin):
+    list_display = ("ticketId", "bus", "customer", "fromStop", "toStop", "seatNumbers", "ticketPrice", "bookingDate")
+    list_select_related = ("bus", "customer__user")
+    raw_id_fields = ("bus", "customer")
+    search_fields = ("ticketId",)
+    search_help_text = "Exact ticket id, bus number or customer username."
+    search_lookups = (("ticketId", int), ("bus__busNo", int), ("customer__user__username", str))
+    actions = ("mark_paid",)
+
+    @admin.action(description="Mark selected tickets as paid")
+    def mark_paid(self, request, queryset):
+        paid = mark_tickets_paid(queryset)
+        self.message_user(request, f"Marked {paid} ticket(s) as paid.", messages.SUCCESS)
+
+
+@admin.register(PaymentModel)
+class PaymentAdmin(LargeTableAdmin):
+    list_display = ("id", "ticket", "customer", "paymentStatus")
+    list_select_related = ("ticket__bus", "customer__user")
+    list_filter = ("paymentStatus",)
+    raw_id_fields = ("ticket", "customer")
+    search_fields = ("ticket__ticketId",)
+    search_help_text = "Exact ticket id or customer username."
+    search_lookups = (("ticket_id", int), ("customer__user__username", str))
+    actions = ("mark_paid",)
+
+    @admin.action(description="Mark tickets of selected payments as paid")
+    def mark_paid(self, request, queryset):
+        paid = mark_tickets_paid(TicketModel.objects.filter(ticketId__in=queryset.values("ticket_id")))
+        self.message_user(request, f"Marked {paid} ticket(s) as paid.", messages.SUCCESS)
+
+
+@admin.register(WaitlistModel)
+class WaitlistAdmin(LargeTableAdmin):
+    list_display = ("id", "bus", "customer", "fromStop", "toStop", "seatCount", "status", "ticket", "holdExpiresAt")
+    list_select_related = ("bus", "customer__user")
+    list_filter = ("status",)
+    raw_id_fields = ("bus", "customer", "ticket")
+    search_fields = ("bus__busNo",)
+    search_help_text = "Exact bus number or customer username."
+    search_lookups = (("bus__busNo", int), ("customer__user__username", str))
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(LargeTableAdmin):
+    list_display = ("id", "eventType", "busId", "createdAt", "publishedAt", "attempts")
+    list_filter = ("eventType",)
+    search_fields = ("busId",)
+    search_help_text = "Exact bus id."
+    search_lookups = (("busId", int),)
+    actions = ("retry_now",)
+
+    @admin.action(description="Retry selected events now")
+    def retry_now(self, request, queryset):
+        retried = queryset.filter(publishedAt__isnull=True).update(attempts=0)
+        self.message_user(request, f"Queued {retried} event(s) again.", messages.SUCCESS)
+
+
+@admin.register(NotificationModel)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ("id", "kind", "customer", "ticketId", "status", "attempts", "nextAttemptAt", "sentAt")
+    list_select_related = ("customer__user",)
+    list_filter = ("status", "kind")
+    raw_id_fields = ("customer",)
+    search_fields = ("ticketId",)
+    search_help_text = "Exact ticket id or customer username."
+    search_lookups = (("ticketId", int), ("customer__user__username", str))
+    actions = ("retry_now",)
+
+    @admin.action(description="Retry selected notifications now")
+    def retry_now(self, request, queryset):
+        retried = queryset.exclude(status="Sent").update(status="Pending", attempts=0, nextAttemptAt=timezone.now())
+        self.message_user(request, f"Queued {retried} notification(s) again.", messages.SUCCESS)
+
+
+@admin.register(UserModel)
+class UserModelAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "is_customer")
+    list_select_related = ("user",)
+    list_filter = ("is_customer",)
+    raw_id_fields = ("user",)
+    search_fields = ("user__username",)
+    search_help_text = "Exact username."
+    search_lookups = (("user__username", str),)
+
+
+@admin.register(CompanyModel)
+class CompanyAdmin(admin.ModelAdmin):
+    list_display = ("busCompany",)
+    search_fields = ("busCompany",)
+
+
+@admin.register(StopModel)
+class StopAdmin(admin.ModelAdmin):
+    list_display = ("stopName",)
+    search_fields = ("^stopName",)
+
+
+@admin.register(ArchivedBusModel)
+class ArchivedBusAdmin(LargeTableAdmin):
+    list_display = ("busNo", "busCompany", "date", "boardingTime", "fromWhere", "toWhere", "archivedAt")
+    list_select_related = ("busCompany",)
+    search_fields = ("busId",)
+    search_help_text = "Exact bus id."
+    search_lookups = (("busId", int),)
+
+
+@admin.register(ArchivedTicketModel)
+class ArchivedTicketAdmin(LargeTableAdmin):
+    list_display = ("ticketId", "bus", "customer", "fromStop", "toStop", "seatNumbers", "ticketPrice",
+                    "paymentStatus")
+    list_select_related = ("bus", "customer__user")
+    raw_id_fields = ("bus", "customer")
+    search_fields = ("ticketId",)
+    search_help_text = "Exact ticket id."
+    search_lookups = (("ticketId", int),)
+
+
+@admin.register(ArchivedPaymentModel)
+class ArchivedPaymentAdmin(LargeTableAdmin):
+    list_display = ("paymentId", "ticket", "customer", "paymentStatus")
+    list_select_related = ("ticket__bus", "customer__user")
+    raw_id_fields = ("ticket", "customer")
+
+
+@admin.register(BusDayRollup)
+class BusDayRollupAdmin(LargeTableAdmin):
+    list_display = ("busNo", "busCompany", "date", "seatsSold", "seatSegments", "bookedRevenue", "paidRevenue",
+                    "cancellations")
+    list_select_related = ("busCompany",)
+    date_hierarchy = "date"
+
+
+@admin.register(SegmentDayRollup)
+class SegmentDayRollupAdmin(LargeTableAdmin):
+    list_display = ("busId", "fromStop", "toStop", "busCompany", "date", "seatsSold", "totalSeats")
+    list_select_related = ("busCompany",)
+    date_hierarchy = "date"
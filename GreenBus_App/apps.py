@@ -1,7 +1,14 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class GreenbusAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'GreenBus_App'
 
+    def ready(self):
+        import GreenBus_App.signals  # noqa: F401
+        from GreenBus.db_router import check_pin_cache
+
+        checks.register(check_pin_cache, checks.Tags.caches)
+
@@ -0,0 +1,72 @@
+"""
+Moves completed trips, their tickets and payments into the archive tables.
+
+Buses are archived in id order, one batch per transaction, so the live
+tables that booking and search hit only hold upcoming journeys. Rows keep
+their original ids so tickets stay addressable after they are archived.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from GreenBus_App.models import (
+    ArchivedBusModel, ArchivedPaymentModel, ArchivedTicketModel, BusModel, PaymentModel, RouteModel, TicketModel,
+)
+
+
+def archive_completed_trips(before=None, batch_size=500, max_batches=None):
+    """Archive every bus dated before ``before`` (default: today). Returns the number of buses archived."""
+    before = before or timezone.localdate()
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(before, batch_size)
+        if not count:
+            break
+        archived += count
+        batches += 1
+    return archived
+
+
+@transaction.atomic
+def archive_batch(before, batch_size):
+    buses = list(BusModel.objects.select_for_update(skip_locked=True)
+                 .filter(date__lt=before).order_by("id")[:batch_size])
+    if not buses:
+        return 0
+    bus_ids = [bus.id for bus in buses]
+
+    stops = defaultdict(list)
+    for bus_id, stop_name in (RouteModel.objects.filter(bus_id__in=bus_ids)
+                              .order_by("bus_id", "stopOrder").values_list("bus_id", "stopName")):
+        stops[bus_id].append(stop_name)
+
+    archived_buses = ArchivedBusModel.objects.bulk_create(
+        ArchivedBusModel(busId=bus.id, busNo=bus.busNo, busCompany_id=bus.busCompany_id, totalSeats=bus.totalSeats,
+                         fromWhere=bus.fromWhere, toWhere=bus.toWhere, perSeatPrice=bus.perSeatPrice,
+                         boardingTime=bus.boardingTime, date=bus.date, stops=stops[bus.id])
+        for bus in buses
+    )
+    archived_bus_ids = {archived.busId: archived.id for archived in archived_buses}
+
+    payments = list(PaymentModel.objects.filter(ticket__bus_id__in=bus_ids).order_by("id"))
+    latest_status = {payment.ticket_id: payment.paymentStatus for payment in payments}
+
+    ArchivedTicketModel.objects.bulk_create(
+        ArchivedTicketModel(ticketId=ticket.ticketId, customer_id=ticket.customer_id,
+                            bus_id=archived_bus_ids[ticket.bus_id], seatNumbers=ticket.seatNumbers,
+                            fromStop=ticket.fromStop, toStop=ticket.toStop, fromStopOrder=ticket.fromStopOrder,
+                            toStopOrder=ticket.toStopOrder, ticketPrice=ticket.ticketPrice,
+                            bookingDate=ticket.bookingDate,
+                            paymentStatus=latest_status.get(ticket.ticketId, "Pending"))
+        for ticket in TicketModel.objects.filter(bus_id__in=bus_ids).iterator(chunk_size=2000)
+    )
+    ArchivedPaymentModel.objects.bulk_create(
+        ArchivedPaymentModel(paymentId=payment.id, customer_id=payment.customer_id, ticket_id=payment.ticket_id,
+                             paymentStatus=payment.paymentStatus)
+        for payment in payments
+    )
+
+    # Deleting the buses cascades to their routes, tickets and payments.
+    BusModel.objects.filter(id__in=bus_ids).delete()
+    return len(bus_ids)
@@ -0,0 +1,146 @@
+"""
+JWT authentication that builds ``request.user`` from signed claims instead of the database.
+
+Tokens issued by ``GreenBusRefreshToken`` carry the user's profile id,
+customer flag and staff flags, so authenticated requests need no user or
+profile query. Changing any of these, deactivating or deleting the user, or
+changing their profile records a revocation time in the cache; tokens issued
+before it are rejected until they expire. Both times keep sub-second
+precision, so a token issued right after a revocation, e.g. on the login that
+follows a privilege change, is not caught by it.
+
+``GreenBusTokenRefreshSerializer`` rejects revoked refresh tokens and reads the
+claims of the new access token from the database, so a refresh never renews
+privileges the user has lost.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from GreenBus_App.models import UserModel
+
+
+def _revocation_key(user_id):
+    return f"jwt-revoked:{user_id}"
+
+
+def revoke_user_tokens(user_id):
+    """Reject every access and refresh token issued to ``user_id`` up to now."""
+    lifetime = max(settings.SIMPLE_JWT["ACCESS_TOKEN_LIFETIME"], settings.SIMPLE_JWT["REFRESH_TOKEN_LIFETIME"])
+    cache.set(_revocation_key(user_id), time.time(), timeout=int(lifetime.total_seconds()) + 1)
+
+
+def is_revoked(token):
+    revoked_at = cache.get(_revocation_key(token[api_settings.USER_ID_CLAIM]))
+    return revoked_at is not None and token.get("iat", 0) <= revoked_at
+
+
+def user_claims(user):
+    profile = UserModel.objects.filter(user=user).values("id", "is_customer").first()
+    return {
+        "profile_id": profile["id"] if profile else None,
+        "is_customer": bool(profile and profile["is_customer"]),
+        "is_staff": user.is_staff,
+        "is_superuser": user.is_superuser,
+    }
+
+
+class PreciseIssuedAtMixin:
+    """Stores ``iat`` with sub-second precision; JWT NumericDates may be fractional."""
+
+    def set_iat(self, claim="iat", at_time=None):
+        self.payload[claim] = (at_time or self.current_time).timestamp()
+
+
+class GreenBusAccessToken(PreciseIssuedAtMixin, AccessToken):
+    pass
+
+
+class GreenBusRefreshToken(PreciseIssuedAtMixin, RefreshToken):
+    access_token_class = GreenBusAccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
+
+
+class GreenBusTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = GreenBusRefreshToken
+
+
+class GreenBusTokenRefreshSerializer(TokenRefreshSerializer):
+    """Issues access tokens with the user's current claims instead of those copied from the refresh token."""
+
+    token_class = GreenBusRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        if is_revoked(refresh):
+            raise AuthenticationFailed("Token has been revoked.", code="token_revoked")
+
+        user = get_user_model().objects.filter(
+            **{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+        for claim, value in user_claims(user).items():
+            refresh[claim] = value
+
+        data = {"access": str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data["refresh"] = str(refresh)
+        return data
+
+
+class ClaimsUser(TokenUser):
+    """Stateless user whose ``profile_id`` and ``is_customer`` come from the token."""
+
+    @cached_property
+    def profile_id(self):
+        return self.token.get("profile_id")
+
+    @cached_property
+    def is_customer(self):
+        return self.token.get("is_customer", False)
+
+    @cached_property
+    def is_superuser(self):
+        return self.token.get("is_superuser", False)
+
+    @cached_property
+    def profile(self):
+        if self.profile_id is None:
+            raise UserModel.DoesNotExist("User has no profile.")
+        return UserModel.objects.get(id=self.profile_id)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        # Tokens issued before the claims were added still authenticate against the database.
+        if "is_customer" not in validated_token:
+            return super().get_user(validated_token)
+
+        if is_revoked(validated_token):
+            raise AuthenticationFailed("Token has been revoked.", code="token_revoked")
+        return ClaimsUser(validated_token)
+
+
+def get_profile_id(user):
+    """The ``UserModel`` id of an authenticated user, read from token claims when available."""
+    if isinstance(user, ClaimsUser):
+        return user.profile_id
+    return UserModel.objects.filter(user=user).values_list("id", flat=True).first()
@@ -0,0 +1,175 @@
+"""
+Fare and availability calendar for a pair of stops.
+
+``JourneyAvailability`` keeps one row per trip and ordered pair of stops on its
+route. Each row holds the trip's fare and the seats free over that whole
+journey. A month's calendar is then one aggregate over an index range, not a
+fleet search per day.
+
+``refresh`` recomputes the rows of the given buses from their tickets with
+``load_inventories``, under the bus row locks, so refreshes of one bus apply
+in order. It is called from three places:
+- the outbox relay, through ``AvailabilitySink``, for booking, cancellation
+  and trip events, one bus at a time once the relay's batch has committed;
+- the signals, for route and trip edits;
+- ``manage.py rebuild_availability``, for backfills.
+
+Calendar days are cached per stop pair and day under a version token of the
+same stop pair and day. ``refresh`` replaces the tokens of the journeys its
+buses had or now have once it commits, so a booking on one route leaves the
+cached days of every other stop pair alone. Tokens expire with the entries
+they version; a lost token only makes the next read recompute its day.
+"""
+import time
+from datetime import timedelta
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+
+from GreenBus_App import outbox
+from GreenBus_App.inventory import load_inventories
+from GreenBus_App.models import BusModel, JourneyAvailability
+
+MAX_CALENDAR_DAYS = 62
+
+
+def cache_seconds():
+    return getattr(settings, "AVAILABILITY_CACHE_SECONDS", 300)
+
+
+def journey_rows(bus, inventory):
+    """Unsaved rows for every ordered pair of first stop occurrences on the bus's route."""
+    names = inventory.stop_names
+    rows = []
+    for start in sorted(set(inventory.positions.values())):
+        occupied = 0
+        for end in range(start + 1, len(names)):
+            occupied |= inventory.segments[end - 1]
+            if inventory.positions[names[end]] != end:
+                continue
+            free = inventory.all_seats & ~(occupied | inventory.blocked)
+            rows.append(JourneyAvailability(bus_id=bus.id, fromStop=names[start], toStop=names[end], date=bus.date,
+                                            perSeatPrice=bus.perSeatPrice, freeSeats=free.bit_count(),
+                                            seatVersion=bus.seatVersion))
+    return rows
+
+
+def refresh(bus_ids):
+    """Recompute the rows of ``bus_ids``; returns how many were written."""
+    bus_ids = sorted(set(bus_ids))
+    if not bus_ids:
+        return 0
+    with transaction.atomic():
+        buses = list(BusModel.objects.select_for_update().filter(id__in=bus_ids).order_by("id")
+                     .only("id", "totalSeats", "blockedSeats", "perSeatPrice", "date", "seatVersion"))
+        touched = journeys(bus_ids)
+
+        inventories = load_inventories(buses)
+        rows = [row for bus in buses for row in journey_rows(bus, inventories[bus.id])]
+        touched.update((row.fromStop, row.toStop, row.date) for row in rows)
+        # Replacing the rows also drops journeys an edit took off the route; readers see the old rows until commit.
+        JourneyAvailability.objects.filter(bus_id__in=bus_ids).delete()
+        JourneyAvailability.objects.bulk_create(rows)
+        transaction.on_commit(lambda: forget_journeys(touched))
+    return len(rows)
+
+
+def refresh_each(bus_ids):
+    """``refresh`` the buses one transaction at a time, in id order; returns the number of rows written."""
+    return sum(refresh([bus_id]) for bus_id in sorted(bus_ids))
+
+
+def rebuild(date_from=None, date_to=None, batch_size=500):
+    """``refresh`` every trip dated in the range, ``batch_size`` buses per transaction; returns the number of trips."""
+    buses = BusModel.objects.order_by("id")
+    if date_from:
+        buses = buses.filter(date__gte=date_from)
+    if date_to:
+        buses = buses.filter(date__lte=date_to)
+    rebuilt = last_id = 0
+    while True:
+        bus_ids = list(buses.filter(id__gt=last_id).values_list("id", flat=True)[:batch_size])
+        if not bus_ids:
+            return rebuilt
+        refresh(bus_ids)
+        last_id = bus_ids[-1]
+        rebuilt += len(bus_ids)
+
+
+def journeys(bus_ids):
+    """``(fromStop, toStop, date)`` of the stored rows of ``bus_ids``, the keys their calendar days are cached by."""
+    return set(JourneyAvailability.objects.filter(bus_id__in=bus_ids).values_list("fromStop", "toStop", "date"))
+
+
+def _pair(from_stop, to_stop):
+    return f"{quote(from_stop)}:{quote(to_stop)}"
+
+
+def _version_key(from_stop, to_stop, day):
+    return f"availability-version:{_pair(from_stop, to_stop)}:{day}"
+
+
+def forget_journeys(journeys):
+    """Invalidate the cached calendar days of ``(fromStop, toStop, date)`` journeys."""
+    if journeys:
+        cache.set_many({_version_key(*journey): time.time_ns() for journey in journeys}, timeout=cache_seconds())
+
+
+def _day_versions(from_stop, to_stop, days):
+    keys = {day: _version_key(from_stop, to_stop, day) for day in days}
+    found = cache.get_many(keys.values())
+    missing = {key: time.time_ns() for key in keys.values() if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=cache_seconds())
+    return {day: found.get(key, missing.get(key)) for day, key in keys.items()}
+
+
+def calendar(from_stop, to_stop, date_from, date_to):
+    """
+    One entry per day from ``date_from`` to ``date_to``: trips between the stops, the lowest fare among
+    trips with a free seat (``None`` if there is none) and the most seats free on a single trip.
+    """
+    days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    versions = _day_versions(from_stop, to_stop, days)
+    pair = _pair(from_stop, to_stop)
+    keys = {day: f"availability-calendar:{pair}:{day}:{versions[day]}" for day in days}
+    found = cache.get_many(keys.values())
+
+    missing = [day for day in days if keys[day] not in found]
+    if missing:
+        computed = {day: {"date": day, "trips": 0, "minPrice": None, "maxFreeSeats": 0} for day in missing}
+        for row in (JourneyAvailability.objects
+                    .filter(fromStop=from_stop, toStop=to_stop, date__range=(missing[0], missing[-1]))
+                    .values("date")
+                    .annotate(trips=Count("*"), minPrice=Min("perSeatPrice", filter=Q(freeSeats__gt=0)),
+                              maxFreeSeats=Max("freeSeats"))
+                    .order_by()):
+            if row["date"] in computed:
+                computed[row["date"]] = row
+        entries = {keys[day]: entry for day, entry in computed.items()}
+        cache.set_many(entries, timeout=cache_seconds())
+        found.update(entries)
+    return [found[keys[day]] for day in days]
+
+
+class AvailabilitySink:
+    """Outbox sink that refreshes the availability rows of the buses whose seats changed."""
+
+    EVENT_TYPES = {outbox.TICKET_BOOKED, outbox.TICKET_CANCELLED, outbox.TRIP_CANCELLED}
+
+    def __init__(self, options):
+        self.bus_ids = set()
+
+    def send(self, event):
+        if event.eventType in self.EVENT_TYPES:
+            self.bus_ids.add(event.busId)
+
+    def flush(self):
+        bus_ids, self.bus_ids = self.bus_ids, set()
+        # After the relay commits, one bus per transaction, so the relay's batch does not wait on bus locks
+        # and no bus stays locked for longer than its own refresh. A failed refresh leaves the rows stale
+        # until the bus's next event or rebuild_availability, like the refreshes of the model signals.
+        transaction.on_commit(lambda: refresh_each(bus_ids), robust=True)
@@ -0,0 +1,225 @@
+"""
+Admission control for flash-sale bookings.
+
+With ``BOOKING_ADMISSION["ENABLED"]`` set, ``customer_book_seat`` hands each
+booking to a per-bus worker thread instead of taking the bus row lock
+itself. The worker drains its queue in micro-batches: it locks the bus
+once, checks every request of the batch against an in-memory seat
+inventory, writes all accepted tickets with one bulk insert, commits and
+then answers the waiting requests. A full queue is rejected immediately so
+the view can return 429 instead of piling up on database connections.
+
+Workers are per process; with several processes each one serialises its
+own share of the requests and the bus row lock orders the batches.
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from GreenBus_App import outbox, rollups
+from GreenBus_App.inventory import SeatInventory, mask_to_seats, seat_mask
+from GreenBus_App.models import BusModel, RouteModel, TicketModel
+
+DEFAULTS = {
+    "ENABLED": False,
+    "QUEUE_SIZE": 200,       # waiting bookings per bus before new ones get 429
+    "BATCH_SIZE": 50,        # bookings committed per transaction
+    "IDLE_SECONDS": 30,      # an idle worker exits after this long
+    "TIMEOUT_SECONDS": 15,   # how long a request waits for its batch
+}
+
+
+def admission_settings():
+    return {**DEFAULTS, **getattr(settings, "BOOKING_ADMISSION", {})}
+
+
+NOT_ENOUGH_SEATS = "Fewer than {} seats are free on this journey. Join the waitlist to get them when they free up."
+
+
+def invalid_seats(seat_numbers, total_seats):
+    """The numbers in ``seat_numbers`` that are not seats of a bus with ``total_seats`` seats."""
+    return [seat for seat in seat_numbers if type(seat) is not int or not 1 <= seat <= total_seats]
+
+
+class QueueFull(Exception):
+    pass
+
+
+class BookingRejected(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BookingRequest:
+    __slots__ = ("profile_id", "seat_numbers", "seat_count", "from_stop", "to_stop", "future")
+
+    def __init__(self, profile_id, seat_numbers, from_stop, to_stop, seat_count=None):
+        """Without ``seat_numbers``, ``seat_count`` seats are assigned by ``SeatInventory.allocate``."""
+        self.profile_id = profile_id
+        self.seat_numbers = seat_numbers
+        self.seat_count = seat_count
+        self.from_stop = from_stop
+        self.to_stop = to_stop
+        self.future = Future()
+
+
+class BusBookingWorker(threading.Thread):
+    def __init__(self, bus_id, admission):
+        super().__init__(name=f"booking-bus-{bus_id}", daemon=True)
+        self.bus_id = bus_id
+        self.admission = admission
+        self.options = admission_settings()
+        self.requests = queue.Queue(maxsize=self.options["QUEUE_SIZE"])
+
+    def run(self):
+        try:
+            while True:
+                try:
+                    first = self.requests.get(timeout=self.options["IDLE_SECONDS"])
+                except queue.Empty:
+                    if self.admission.retire(self):
+                        return
+                    continue
+                batch = [first]
+                while len(batch) < self.options["BATCH_SIZE"]:
+                    try:
+                        batch.append(self.requests.get_nowait())
+                    except queue.Empty:
+                        break
+                self.process(batch)
+                close_old_connections()
+        finally:
+            close_old_connections()
+
+    def process(self, batch):
+        try:
+            accepted = self._book(batch)
+        except BusModel.DoesNotExist:
+            for request in batch:
+                request.future.set_exception(BookingRejected("Bus not found.", 404))
+            return
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        for request, ticket in accepted:
+            request.future.set_result(ticket)
+
+    @transaction.atomic
+    def _book(self, batch):
+        bus = BusModel.objects.select_for_update().select_related("busCompany").get(id=self.bus_id)
+        route_stops = list(bus.routes.order_by("stopOrder"))
+        inventory = SeatInventory.for_routes(bus, route_stops)
+
+        accepted = []
+        for request in batch:
+            # A bad request is answered on its own; the rest of the batch still books.
+            try:
+                interval, mask = self._admit(request, inventory)
+            except Exception as e:
+                request.future.set_exception(e)
+                continue
+            inventory.book(*interval, mask)
+            accepted.append((request, interval))
+
+        if not accepted:
+            return []
+
+        tickets = create_tickets(bus, route_stops, inventory, [
+            (request.profile_id, request.seat_numbers, request.from_stop, request.to_stop, interval)
+            for request, interval in accepted
+        ])
+
+        outbox.publish(*(outbox.ticket_booked(ticket, mask_to_seats(inventory.occupied(start, end)))
+                         for (_, (start, end)), ticket in zip(accepted, tickets)))
+        return [(request, ticket) for (request, _), ticket in zip(accepted, tickets)]
+
+    def _admit(self, request, inventory):
+        """The segment interval and seat mask ``request`` books; raises ``BookingRejected`` if it cannot."""
+        if request.from_stop not in inventory.positions or request.to_stop not in inventory.positions:
+            raise BookingRejected("Invalid stops selected.")
+        interval = inventory.interval(request.from_stop, request.to_stop)
+        if interval is None:
+            raise BookingRejected("Invalid journey selection.")
+
+        if not request.seat_numbers:
+            mask = inventory.allocate(*interval, request.seat_count)
+            if not mask:
+                raise BookingRejected(NOT_ENOUGH_SEATS.format(request.seat_count))
+            request.seat_numbers = mask_to_seats(mask)
+
+        invalid = invalid_seats(request.seat_numbers, inventory.total_seats)
+        if invalid:
+            raise BookingRejected(f"Seats {invalid} do not exist on this bus.")
+        mask = seat_mask(request.seat_numbers)
+        already_booked = mask_to_seats(mask & inventory.occupied(*interval))
+        if already_booked:
+            raise BookingRejected(f"Seats {already_booked} are already booked.")
+        blocked = mask_to_seats(mask & inventory.blocked)
+        if blocked:
+            raise BookingRejected(f"Seats {blocked} are blocked and cannot be booked.")
+        return interval, mask
+
+
+def create_tickets(bus, route_stops, inventory, bookings):
+    """
+    Insert tickets already booked into ``inventory`` and sync the bus's seat arrays and rollups.
+
+    ``bookings`` are ``(profile_id, seat_numbers, from_stop, to_stop, (start, end))`` tuples. The
+    caller holds the bus row lock; ``route_stops`` are its routes in stop order.
+    """
+    tickets = TicketModel.objects.bulk_create(
+        TicketModel(customer_id=profile_id, bus=bus, seatNumbers=seat_numbers, fromStop=from_stop, toStop=to_stop,
+                    fromStopRef_id=route_stops[start].stop_id, toStopRef_id=route_stops[end].stop_id,
+                    fromStopOrder=route_stops[start].stopOrder, toStopOrder=route_stops[end].stopOrder,
+                    ticketPrice=len(seat_numbers) * bus.perSeatPrice)
+        for profile_id, seat_numbers, from_stop, to_stop, (start, end) in bookings
+    )
+
+    rollups.record_bookings(bus, route_stops, tickets)
+
+    for position, stop in enumerate(route_stops[:-1]):
+        stop.bookedSeats = sorted(set(stop.bookedSeats) | set(mask_to_seats(inventory.segments[position])))
+    RouteModel.objects.bulk_update(route_stops[:-1], ["bookedSeats"])
+    bus.update_seat_status()
+    return tickets
+
+
+class BookingAdmission:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = {}
+
+    def enabled(self):
+        return admission_settings()["ENABLED"]
+
+    def submit(self, bus_id, profile_id, seat_numbers, from_stop, to_stop, seat_count=None):
+        """Queue a booking for its bus's worker and wait for the batch; raises ``QueueFull`` when saturated."""
+        request = BookingRequest(profile_id, seat_numbers, from_stop, to_stop, seat_count)
+        with self._lock:
+            worker = self._workers.get(bus_id)
+            if worker is None:
+                worker = self._workers[bus_id] = BusBookingWorker(bus_id, self)
+                worker.start()
+            try:
+                worker.requests.put_nowait(request)
+            except queue.Full:
+                raise QueueFull() from None
+        return request.future.result(timeout=worker.options["TIMEOUT_SECONDS"])
+
+    def retire(self, worker):
+        """Remove an idle worker unless a request slipped in after its last poll."""
+        with self._lock:
+            if not worker.requests.empty():
+                return False
+            self._workers.pop(worker.bus_id, None)
+            return True
+
+
+admission = BookingAdmission()
@@ -1,8 +1,12 @@
 import json
+from urllib.parse import parse_qs
 
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 
+from GreenBus_App.authentication import ClaimsJWTAuthentication, get_profile_id
 from GreenBus_App.models import BusModel
 
 
@@ -34,3 +38,33 @@ class SeatUpdateConsumer(AsyncWebsocketConsumer):
     async def seat_update(self, event):
         # Send seat update message to WebSocket clients
         await self.send(text_data=json.dumps(event["data"]))
+
+
+class CustomerNotificationConsumer(AsyncWebsocketConsumer):
+    """Per-customer events such as waitlist holds; authenticates with an access token in ``?token=``."""
+
+    async def connect(self):
+        token = parse_qs(self.scope["query_string"].decode()).get("token", [""])[0]
+        profile_id = await self.authenticate(token)
+        if not profile_id:
+            await self.close(code=4401)
+            return
+        self.group_name = f"customer_{profile_id}"
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    @database_sync_to_async
+    def authenticate(self, token):
+        authentication = ClaimsJWTAuthentication()
+        try:
+            user = authentication.get_user(authentication.get_validated_token(token.encode()))
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            return None
+        return get_profile_id(user)
+
+    async def waitlist_update(self, event):
+        await self.send(text_data=json.dumps(event["data"]))
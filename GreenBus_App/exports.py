@@ -0,0 +1,116 @@
+"""
+Ticket and revenue exports for operators.
+
+Each row is a ticket joined with its bus, company and latest payment status,
+read with ``iterator(chunk_size=...)`` so Postgres streams it through a
+server-side cursor. Archived tickets follow the live ones. The writers turn
+rows into CSV or JSON lines one chunk at a time, so an export of any size
+holds only one chunk in memory whether it goes to an HTTP response or a file.
+The HTTP response streams them through ``aexport_lines``, because under ASGI
+Django buffers a synchronous streaming iterator whole before sending it.
+"""
+import csv
+
+from asgiref.sync import sync_to_async
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from rest_framework.settings import api_settings
+
+from GreenBus_App.models import ArchivedTicketModel, PaymentModel, TicketModel
+
+EXPORT_COLUMNS = ("ticketId", "archived", "bookingDate", "travelDate", "busId", "busNo", "busCompany", "fromStop",
+                  "toStop", "seatNumbers", "seatCount", "ticketPrice", "paymentStatus", "customer")
+EXPORT_FORMATS = ("csv", "jsonl")
+CHUNK_SIZE = 2000
+
+
+def ticket_export_rows(date_from=None, date_to=None, company_id=None, chunk_size=CHUNK_SIZE):
+    """Export rows as dicts keyed by ``EXPORT_COLUMNS``; dates filter on the travel date."""
+    latest_status = PaymentModel.objects.filter(ticket=OuterRef("ticketId")).order_by("-id").values("paymentStatus")[:1]
+    live = TicketModel.objects.annotate(latest_payment=Coalesce(Subquery(latest_status), Value("Pending")))
+    archived = ArchivedTicketModel.objects.all()
+
+    sources = [
+        (False, live, ("ticketId", "bookingDate", "bus__date", "bus_id", "bus__busNo", "bus__busCompany__busCompany",
+                       "fromStop", "toStop", "seatNumbers", "ticketPrice", "latest_payment", "customer_id")),
+        (True, archived, ("ticketId", "bookingDate", "bus__date", "bus__busId", "bus__busNo",
+                          "bus__busCompany__busCompany", "fromStop", "toStop", "seatNumbers", "ticketPrice",
+                          "paymentStatus", "customer_id")),
+    ]
+    for is_archived, tickets, columns in sources:
+        if date_from:
+            tickets = tickets.filter(bus__date__gte=date_from)
+        if date_to:
+            tickets = tickets.filter(bus__date__lte=date_to)
+        if company_id:
+            tickets = tickets.filter(bus__busCompany_id=company_id)
+
+        for (ticket_id, booking_date, travel_date, bus_id, bus_no, company, from_stop, to_stop, seats, price,
+             payment_status, customer_id) in tickets.order_by("ticketId").values_list(*columns).iterator(chunk_size):
+            yield {
+                "ticketId": ticket_id,
+                "archived": is_archived,
+                "bookingDate": booking_date.isoformat(),
+                "travelDate": travel_date.isoformat(),
+                "busId": bus_id,
+                "busNo": bus_no,
+                "busCompany": company,
+                "fromStop": from_stop,
+                "toStop": to_stop,
+                "seatNumbers": seats,
+                "seatCount": len(seats),
+                "ticketPrice": price,
+                "paymentStatus": payment_status,
+                "customer": customer_id,
+            }
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the line back to ``csv.writer``'s caller."""
+
+    def write(self, value):
+        return value
+
+
+def _chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_lines(rows, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for chunk in _chunked(rows, chunk_size):
+        yield "".join(
+            writer.writerow([" ".join(map(str, row["seatNumbers"])) if column == "seatNumbers" else row[column]
+                             for column in EXPORT_COLUMNS])
+            for row in chunk
+        )
+
+
+def jsonl_lines(rows, chunk_size=CHUNK_SIZE):
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    for chunk in _chunked(rows, chunk_size):
+        yield b"\n".join(renderer.render(row) for row in chunk) + b"\n"
+
+
+def export_lines(export_format, rows):
+    return csv_lines(rows) if export_format == "csv" else jsonl_lines(rows)
+
+
+async def aexport_lines(export_format, rows):
+    """``export_lines`` as an async iterator; each chunk is read and rendered in the sync thread."""
+    lines = export_lines(export_format, rows)
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(lines, None)) is not None:
+            yield chunk
+    finally:
+        # Closes the server-side cursor on the connection it was opened on.
+        await sync_to_async(lines.close)()
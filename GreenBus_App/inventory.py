@@ -0,0 +1,178 @@
+"""
+Per-segment seat occupancy for a bus, kept as integer bitmasks.
+
+Seat ``n`` maps to bit ``n - 1``. Segment ``i`` is the hop between the i-th and
+the (i + 1)-th stop of the bus in ``stopOrder``, so a ticket from stop ``a`` to
+stop ``b`` occupies segments ``a .. b - 1``.
+"""
+from collections import defaultdict
+
+from GreenBus_App.models import RouteModel, TicketModel
+
+
+def seat_mask(seats):
+    """Bitmask with one bit set per (positive) seat number."""
+    mask = 0
+    for seat in seats:
+        if seat > 0:
+            mask |= 1 << (seat - 1)
+    return mask
+
+
+def mask_to_seats(mask):
+    """Sorted seat numbers of the bits set in ``mask``."""
+    seats = []
+    while mask:
+        low = mask & -mask
+        seats.append(low.bit_length())
+        mask ^= low
+    return seats
+
+
+class SeatInventory:
+    __slots__ = ("bus_id", "total_seats", "all_seats", "blocked", "stop_names", "positions", "order_positions",
+                 "segments")
+
+    def __init__(self, bus_id, total_seats, blocked_seats, stops):
+        """``stops`` are the bus's ``(stopName, stopOrder)`` pairs in route order."""
+        self.bus_id = bus_id
+        self.total_seats = total_seats
+        self.all_seats = (1 << total_seats) - 1
+        self.blocked = seat_mask(blocked_seats) & self.all_seats
+        self.stop_names = [name for name, _ in stops]
+        self.positions = {}
+        for index, name in enumerate(self.stop_names):
+            self.positions.setdefault(name, index)
+        self.order_positions = {order: index for index, (_, order) in enumerate(stops)}
+        self.segments = [0] * max(len(stops) - 1, 0)
+
+    def position(self, stop_name):
+        return self.positions.get(stop_name)
+
+    def interval(self, from_stop, to_stop):
+        """Segment range ``(start, end)`` for a journey, or ``None`` if it is not on this route."""
+        start = self.positions.get(from_stop)
+        end = self.positions.get(to_stop)
+        if start is None or end is None or start >= end:
+            return None
+        return start, end
+
+    def occupied(self, start, end):
+        mask = 0
+        for segment in self.segments[start:end]:
+            mask |= segment
+        return mask
+
+    def free(self, start, end):
+        return self.all_seats & ~(self.occupied(start, end) | self.blocked)
+
+    def book(self, start, end, mask):
+        for index in range(start, end):
+            self.segments[index] |= mask
+
+    def release(self, start, end, mask):
+        for index in range(start, end):
+            self.segments[index] &= ~mask
+
+    def allocate(self, start, end, count):
+        """
+        Choose ``count`` seats free over segments ``[start, end)``; returns their mask, or 0 if too few are free.
+
+        A run of consecutive seat numbers is preferred, so groups sit together. Among the candidates,
+        the cheapest wins (best fit). A seat costs the free hops it has right before and after the
+        journey, because booking it leaves those hops as a gap only a shorter journey can fill. Seats
+        that are free for the whole route stay whole for long journeys. Ties go to the lowest seat
+        numbers.
+        """
+        free = self.free(start, end)
+        if free.bit_count() < count or count < 1:
+            return 0
+        costs = self._gap_costs(start, end, free)
+
+        runs = free
+        for shift in range(1, count):
+            runs &= free >> shift
+        best_cost = best_first = None
+        while runs:
+            low = runs & -runs
+            runs ^= low
+            first = low.bit_length() - 1
+            cost = sum(costs[first:first + count])
+            if best_cost is None or cost < best_cost:
+                best_cost, best_first = cost, first
+        if best_first is not None:
+            return ((1 << count) - 1) << best_first
+
+        mask = 0
+        for seat in sorted(mask_to_seats(free), key=lambda seat: costs[seat - 1])[:count]:
+            mask |= 1 << (seat - 1)
+        return mask
+
+    def _gap_costs(self, start, end, free):
+        """Per seat bit of ``free``: the free hops it has right before ``start`` and right after ``end``."""
+        costs = [0] * self.total_seats
+        for hops in (range(start - 1, -1, -1), range(end, len(self.segments))):
+            extended = free
+            for depth, segment in enumerate(hops):
+                ended = extended & self.segments[segment]
+                extended ^= ended
+                while ended:
+                    low = ended & -ended
+                    costs[low.bit_length() - 1] += depth
+                    ended ^= low
+                if not extended:
+                    break
+            else:
+                depth = len(hops)
+            while extended:
+                low = extended & -extended
+                costs[low.bit_length() - 1] += depth
+                extended ^= low
+        return costs
+
+    def order_interval(self, from_order, to_order):
+        """Segment range for a ticket's stored ``fromStopOrder``/``toStopOrder``."""
+        start = self.order_positions.get(from_order)
+        end = self.order_positions.get(to_order)
+        if start is None or end is None or start >= end:
+            return None
+        return start, end
+
+    def add_ticket(self, from_order, to_order, seat_numbers):
+        interval = self.order_interval(from_order, to_order)
+        if interval:
+            self.book(*interval, seat_mask(seat_numbers))
+
+    @classmethod
+    def for_bus(cls, bus):
+        return load_inventories([bus])[bus.id]
+
+    @classmethod
+    def for_routes(cls, bus, route_stops):
+        """Inventory for a bus whose ``RouteModel`` rows are already loaded in stop order."""
+        inventory = cls(bus.id, bus.totalSeats, bus.blockedSeats,
+                        [(stop.stopName, stop.stopOrder) for stop in route_stops])
+        for from_order, to_order, seat_numbers in (TicketModel.objects.filter(bus_id=bus.id)
+                                                   .values_list("fromStopOrder", "toStopOrder", "seatNumbers")):
+            inventory.add_ticket(from_order, to_order, seat_numbers)
+        return inventory
+
+
+def load_inventories(buses):
+    """Build a ``SeatInventory`` per bus with one route query and one ticket query in total."""
+    buses = list(buses)
+    bus_ids = [bus.id for bus in buses]
+    stops = defaultdict(list)
+    for bus_id, stop_name, stop_order in (RouteModel.objects.filter(bus_id__in=bus_ids)
+                                          .order_by("bus_id", "stopOrder")
+                                          .values_list("bus_id", "stopName", "stopOrder")):
+        stops[bus_id].append((stop_name, stop_order))
+
+    inventories = {
+        bus.id: SeatInventory(bus.id, bus.totalSeats, bus.blockedSeats, stops[bus.id]) for bus in buses
+    }
+    for bus_id, from_order, to_order, seat_numbers in (TicketModel.objects.filter(bus_id__in=bus_ids)
+                                                       .values_list("bus_id", "fromStopOrder", "toStopOrder",
+                                                                    "seatNumbers")):
+        inventories[bus_id].add_ticket(from_order, to_order, seat_numbers)
+    return inventories
@@ -0,0 +1,211 @@
+"""
+In-memory journey planner over the bus network.
+
+Every upcoming ``BusModel`` is a trip: the ordered stop ids of its routes, a
+departure key and its per-segment seat inventory. Searches run RAPTOR-style
+rounds over these arrays, one round per leg, without touching the database.
+Buses touched by route, bus or ticket writes are reloaded on the next query;
+a periodic full rebuild picks up writes made by other processes.
+
+``manage.py benchmark_journey_planner`` measures query times on a synthetic
+network.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from GreenBus_App.inventory import load_inventories
+from GreenBus_App.models import BusModel
+
+SLOT_ORDER = {"Morning": 0, "Night": 1}
+UNREACHED = float("inf")
+
+
+def departure_key(day, boarding_time):
+    """Orders trips by date, then boarding slot; a transfer must board a strictly later trip."""
+    return day.toordinal() * len(SLOT_ORDER) + SLOT_ORDER.get(boarding_time, 0)
+
+
+class Trip:
+    __slots__ = ("bus_id", "bus_no", "company", "date", "boarding_time", "departure", "price", "stops",
+                 "positions", "inventory")
+
+    def __init__(self, bus, stop_ids, inventory):
+        self.bus_id = bus.id
+        self.bus_no = bus.busNo
+        self.company = bus.busCompany.busCompany
+        self.date = bus.date
+        self.boarding_time = bus.boardingTime
+        self.departure = departure_key(bus.date, bus.boardingTime)
+        self.price = bus.perSeatPrice
+        self.stops = stop_ids
+        self.positions = {}
+        for index, stop_id in enumerate(stop_ids):
+            self.positions.setdefault(stop_id, index)
+        self.inventory = inventory
+
+
+class JourneyPlanner:
+    def __init__(self):
+        self._lock = threading.Lock()  # held by lookups and rebuilds
+        self._dirty_lock = threading.Lock()  # held only to touch _dirty, so writers never wait for a rebuild
+        self._stop_ids = {}
+        self._stop_names = []
+        self._trips = {}
+        self._serving = defaultdict(set)
+        self._dirty = set()
+        self._built_at = None
+
+    def mark_dirty(self, bus_id):
+        with self._dirty_lock:
+            self._dirty.add(bus_id)
+
+    def _take_dirty(self):
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+
+    def _refresh_seconds(self):
+        return getattr(settings, "JOURNEY_PLANNER_REFRESH_SECONDS", 300)
+
+    def _transfer_days(self):
+        return getattr(settings, "JOURNEY_PLANNER_TRANSFER_DAYS", 1)
+
+    def _ensure_fresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self._refresh_seconds():
+            self._rebuild()
+        elif self._dirty:
+            dirty = self._take_dirty()
+            for bus_id in dirty:
+                self._remove(bus_id)
+            self._load(BusModel.objects.filter(id__in=dirty))
+
+    def _rebuild(self):
+        self._take_dirty()
+        self._stop_ids = {}
+        self._stop_names = []
+        self._trips = {}
+        self._serving = defaultdict(set)
+        self._load(BusModel.objects.all())
+        self._built_at = time.monotonic()
+
+    def _stop_id(self, name):
+        stop_id = self._stop_ids.get(name)
+        if stop_id is None:
+            stop_id = self._stop_ids[name] = len(self._stop_names)
+            self._stop_names.append(name)
+        return stop_id
+
+    def _load(self, buses):
+        buses = list(buses.filter(date__gte=timezone.localdate()).select_related("busCompany"))
+        inventories = load_inventories(buses)
+        for bus in buses:
+            self._add(bus, inventories[bus.id])
+
+    def _add(self, bus, inventory):
+        if len(inventory.stop_names) < 2:
+            return
+        trip = Trip(bus, tuple(self._stop_id(name) for name in inventory.stop_names), inventory)
+        self._trips[trip.bus_id] = trip
+        for stop_id in trip.positions:
+            self._serving[(trip.date, stop_id)].add(trip.bus_id)
+
+    def _remove(self, bus_id):
+        trip = self._trips.pop(bus_id, None)
+        if trip:
+            for stop_id in trip.positions:
+                self._serving[(trip.date, stop_id)].discard(bus_id)
+
+    def plan(self, from_stop, to_stop, day, max_transfers=1, seats=1, window_days=1):
+        """
+        Pareto-optimal journeys from ``from_stop`` to ``to_stop`` departing between ``day`` and
+        ``day + window_days - 1``: the earliest arrival for each number of transfers up to
+        ``max_transfers``, keeping only options that improve on journeys with fewer transfers.
+        Connecting legs may leave up to ``JOURNEY_PLANNER_TRANSFER_DAYS`` after the window.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            origin = self._stop_ids.get(from_stop)
+            target = self._stop_ids.get(to_stop)
+            if origin is None or target is None or origin == target:
+                return []
+            days = [day + timedelta(days=offset) for offset in range(max(window_days, 1))]
+            return self._search(origin, target, days, max_transfers, seats)
+
+    def _search(self, origin, target, days, max_transfers, seats):
+        best = {origin: -1}
+        marked = {origin: -1}
+        parents = []
+        journeys = []
+        best_target = UNREACHED
+        last_day = days[-1] + timedelta(days=self._transfer_days())
+
+        for _ in range(max_transfers + 1):
+            reached = {}
+            parent = {}
+            for stop, arrival in marked.items():
+                for day in days if arrival < 0 else self._connecting_days(arrival, last_day):
+                    for bus_id in self._serving.get((day, stop), ()):
+                        trip = self._trips[bus_id]
+                        if not arrival < trip.departure < best_target:
+                            continue
+                        inventory = trip.inventory
+                        board = trip.positions[stop]
+                        occupied = inventory.blocked
+                        for alight in range(board + 1, len(trip.stops)):
+                            occupied |= inventory.segments[alight - 1]
+                            free = (inventory.all_seats & ~occupied).bit_count()
+                            if free < seats:
+                                break
+                            stop_reached = trip.stops[alight]
+                            if trip.departure < best.get(stop_reached, UNREACHED):
+                                best[stop_reached] = reached[stop_reached] = trip.departure
+                                parent[stop_reached] = (trip, board, alight, stop, free)
+            parents.append(parent)
+            if target in reached:
+                best_target = reached[target]
+                journeys.append(self._journey(parents, target, seats))
+            if not reached:
+                break
+            marked = reached
+        return journeys
+
+    @staticmethod
+    def _connecting_days(arrival, last_day):
+        """Days from the one of the ``arrival`` key through ``last_day``."""
+        day = date.fromordinal(arrival // len(SLOT_ORDER))
+        return [day + timedelta(days=offset) for offset in range((last_day - day).days + 1)]
+
+    def _journey(self, parents, target, seats):
+        legs = []
+        stop = target
+        for parent in reversed(parents):
+            trip, board, alight, stop, free = parent[stop]
+            legs.append({
+                "busId": trip.bus_id,
+                "busNo": trip.bus_no,
+                "busCompany": trip.company,
+                "date": trip.date.strftime("%Y-%m-%d"),
+                "boardingTime": trip.boarding_time,
+                "fromStop": self._stop_names[trip.stops[board]],
+                "toStop": self._stop_names[trip.stops[alight]],
+                "availableSeats": free,
+                "price": seats * trip.price,
+            })
+        legs.reverse()
+        return {
+            "transfers": len(legs) - 1,
+            "totalPrice": sum(leg["price"] for leg in legs),
+            "legs": legs,
+        }
+
+
+planner = JourneyPlanner()
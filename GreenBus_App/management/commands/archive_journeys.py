@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from GreenBus_App.archive import archive_completed_trips
+
+
+class Command(BaseCommand):
+    help = "Move completed trips with their tickets and payments into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=0,
+                            help="Only archive trips that ran at least this many days ago (default: before today).")
+        parser.add_argument("--batch-size", type=int, default=500, help="Buses archived per transaction.")
+        parser.add_argument("--max-batches", type=int, default=None, help="Stop after this many batches.")
+
+    def handle(self, *args, **options):
+        before = timezone.localdate() - timedelta(days=options["days"])
+        archived = archive_completed_trips(before, batch_size=options["batch_size"],
+                                           max_batches=options["max_batches"])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} trip(s) dated before {before}."))
@@ -0,0 +1,74 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from GreenBus_App.inventory import SeatInventory
+from GreenBus_App.journey_planner import SLOT_ORDER, JourneyPlanner
+from GreenBus_App.models import BusModel, CompanyModel
+
+
+class Command(BaseCommand):
+    help = "Time journey planner queries on a synthetic in-memory network; the database is not used."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--trips", type=int, default=5000, help="Synthetic trips in the network.")
+        parser.add_argument("--stops", type=int, default=300, help="Distinct stops in the network.")
+        parser.add_argument("--route-length", type=int, default=8, help="Stops per trip.")
+        parser.add_argument("--days", type=int, default=7, help="Days the trips are spread over.")
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument("--max-transfers", type=int, default=2)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        stops = [f"Stop {number}" for number in range(options["stops"])]
+        first_day = timezone.localdate()
+
+        planner = JourneyPlanner()
+        company = CompanyModel(busCompany="Benchmark")
+        started = time.perf_counter()
+        for bus_id in range(1, options["trips"] + 1):
+            bus = BusModel(id=bus_id, busNo=bus_id, busCompany=company, totalSeats=40, perSeatPrice=100,
+                           boardingTime=rng.choice(list(SLOT_ORDER)),
+                           date=first_day + timedelta(days=rng.randrange(options["days"])))
+            route = rng.sample(stops, min(options["route_length"], len(stops)))
+            inventory = SeatInventory(bus_id, bus.totalSeats, [], [(name, order) for order, name in enumerate(route)])
+            for segment in range(len(inventory.segments)):
+                inventory.segments[segment] = rng.getrandbits(bus.totalSeats) & rng.getrandbits(bus.totalSeats)
+            planner._add(bus, inventory)
+        planner._built_at = time.monotonic()
+        build_seconds = time.perf_counter() - started
+
+        timings, found = [], 0
+        for _ in range(options["queries"]):
+            from_stop, to_stop = rng.sample(stops, 2)
+            day = first_day + timedelta(days=rng.randrange(options["days"]))
+            started = time.perf_counter()
+            journeys = planner.plan(from_stop, to_stop, day, max_transfers=options["max_transfers"], seats=2)
+            timings.append((time.perf_counter() - started) * 1000)
+            found += bool(journeys)
+
+        timings.sort()
+        result = {
+            "trips": options["trips"],
+            "stops": options["stops"],
+            "buildSeconds": round(build_seconds, 3),
+            "queries": options["queries"],
+            "answered": found,
+            "medianMs": round(statistics.median(timings), 3),
+            "p95Ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+            "maxMs": round(timings[-1], 3),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(result))
+            return
+        self.stdout.write(f"{result['trips']} trips over {result['stops']} stops, built in "
+                          f"{result['buildSeconds']} s; {result['answered']}/{result['queries']} queries "
+                          f"with up to {options['max_transfers']} transfer(s) found a journey.")
+        self.stdout.write(f"  median {result['medianMs']} ms, p95 {result['p95Ms']} ms, max {result['maxMs']} ms")
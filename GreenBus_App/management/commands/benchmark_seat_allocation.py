@@ -0,0 +1,125 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from GreenBus_App.inventory import SeatInventory, mask_to_seats
+
+GROUP_SIZES = (1, 2, 3, 4)
+GROUP_WEIGHTS = (55, 30, 10, 5)
+
+
+def lowest_seats(inventory, start, end, count):
+    """The lowest-numbered free seats, like a client that takes the first seats on the map."""
+    free = inventory.free(start, end)
+    if free.bit_count() < count:
+        return 0
+    mask = 0
+    for _ in range(count):
+        low = free & -free
+        mask |= low
+        free ^= low
+    return mask
+
+
+def random_seats(rng):
+    """Free seats picked at random, like customers clicking around a seat map."""
+    def allocate(inventory, start, end, count):
+        free = inventory.free(start, end)
+        seats = [bit for bit in range(inventory.total_seats) if free >> bit & 1]
+        if len(seats) < count:
+            return 0
+        mask = 0
+        for bit in rng.sample(seats, count):
+            mask |= 1 << bit
+        return mask
+    return allocate
+
+
+def best_fit(inventory, start, end, count):
+    return inventory.allocate(start, end, count)
+
+
+class Command(BaseCommand):
+    help = "Compare seat assignment strategies on synthetic multi-stop demand: seat-hops sold and time per request."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--buses", type=int, default=200, help="Synthetic trips to fill.")
+        parser.add_argument("--stops", type=int, default=8, help="Stops per route.")
+        parser.add_argument("--seats", type=int, default=40, help="Seats per bus.")
+        parser.add_argument("--demand", type=float, default=1.3,
+                            help="Requested seat-hops as a multiple of each trip's capacity.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        trips = [self._demand(rng, options) for _ in range(options["buses"])]
+        strategies = {
+            "lowest": lowest_seats,
+            "random": random_seats(random.Random(options["seed"])),
+            "best-fit": best_fit,
+        }
+        capacity = options["buses"] * options["seats"] * (options["stops"] - 1)
+        stops = [(str(stop), stop) for stop in range(options["stops"])]
+
+        results = {}
+        for name, allocate in strategies.items():
+            booked = fragmented = seat_hops = groups = together = 0
+            elapsed = 0.0
+            for requests in trips:
+                inventory = SeatInventory(0, options["seats"], [], stops)
+                for start, end, count in requests:
+                    started = time.perf_counter()
+                    mask = allocate(inventory, start, end, count)
+                    elapsed += time.perf_counter() - started
+                    if mask:
+                        inventory.book(start, end, mask)
+                        booked += 1
+                        seat_hops += count * (end - start)
+                        if count > 1:
+                            groups += 1
+                            seats = mask_to_seats(mask)
+                            together += seats[-1] - seats[0] == count - 1
+                    elif all(inventory.free(segment, segment + 1).bit_count() >= count
+                             for segment in range(start, end)):
+                        # Every hop has the seats, just not the same ones: capacity lost to gaps.
+                        fragmented += 1
+            requests_total = sum(len(requests) for requests in trips)
+            results[name] = {
+                "booked": booked,
+                "rejectedByGaps": fragmented,
+                "seatHops": seat_hops,
+                "loadFactor": round(seat_hops / capacity, 4),
+                "groupsTogether": round(together / groups, 4) if groups else None,
+                "microsPerRequest": round(elapsed / requests_total * 1e6, 2),
+            }
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"requests": requests_total, "capacity": capacity, "results": results}))
+            return
+        self.stdout.write(f"{requests_total} requests on {options['buses']} trips of {options['stops']} stops "
+                          f"x {options['seats']} seats ({capacity} seat-hops):")
+        self.stdout.write(f"  {'strategy':<10} {'booked':>8} {'gap rejects':>12} {'seat-hops':>10} {'load':>7} "
+                          f"{'groups together':>16} {'us/request':>11}")
+        for name, result in results.items():
+            self.stdout.write(f"  {name:<10} {result['booked']:>8} {result['rejectedByGaps']:>12} "
+                              f"{result['seatHops']:>10} {result['loadFactor']:>7.1%} "
+                              f"{result['groupsTogether'] or 0:>16.1%} {result['microsPerRequest']:>11.2f}")
+        for baseline in ("random", "lowest"):
+            if results[baseline]["seatHops"]:
+                gain = results["best-fit"]["seatHops"] / results[baseline]["seatHops"] - 1
+                self.stdout.write(f"Best fit sells {gain:+.1%} seat-hops compared to {baseline} seats.")
+
+    def _demand(self, rng, options):
+        """Random journeys and group sizes adding up to ``--demand`` times the trip's seat-hops."""
+        target = options["demand"] * options["seats"] * (options["stops"] - 1)
+        requests, volume = [], 0
+        while volume < target:
+            start = rng.randrange(options["stops"] - 1)
+            end = rng.randrange(start + 1, options["stops"])
+            count = rng.choices(GROUP_SIZES, GROUP_WEIGHTS)[0]
+            requests.append((start, end, count))
+            volume += count * (end - start)
+        return requests
@@ -0,0 +1,49 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from GreenBus_App.models import BusModel
+from GreenBus_App.serializers import BusSerializer, bus_rows
+
+
+class Command(BaseCommand):
+    help = "Time BusSerializer + JSONRenderer against bus_rows + the orjson renderer on in-memory buses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000, help="Buses per payload.")
+        parser.add_argument("--repeat", type=int, default=20, help="Payloads timed per variant.")
+
+    def handle(self, *args, **options):
+        day = date.today()
+        buses = [
+            BusModel(id=number, busNo=number, busCompany_id=number % 7 + 1, totalSeats=40,
+                     availableSeats=list(range(1, 41, 2)), fromWhere="Chennai", toWhere="Bangalore",
+                     boardingTime="Morning", date=day + timedelta(days=number % 30), seatVersion=number)
+            for number in range(1, options["rows"] + 1)
+        ]
+        renderers = [("JSONRenderer", JSONRenderer())]
+        try:
+            from GreenBus_App.renderers import ORJSONRenderer
+        except ImportError:
+            self.stdout.write(self.style.WARNING("orjson is not installed; skipping ORJSONRenderer."))
+        else:
+            renderers.append(("ORJSONRenderer", ORJSONRenderer()))
+
+        serializers = [
+            ("BusSerializer", lambda: BusSerializer(buses, many=True).data),
+            ("bus_rows", lambda: bus_rows(buses)),
+        ]
+        for serializer_name, serialize in serializers:
+            for renderer_name, renderer in renderers:
+                self.report(f"{serializer_name} + {renderer_name}", lambda: renderer.render(serialize()),
+                            options["repeat"])
+
+    def report(self, label, payload, repeat):
+        payload()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            payload()
+        elapsed = (time.perf_counter() - started) / repeat
+        self.stdout.write(f"{label:<32} {elapsed * 1000:8.2f} ms/payload")
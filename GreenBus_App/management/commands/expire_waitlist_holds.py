@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from GreenBus_App.waitlist import expire_holds
+
+
+class Command(BaseCommand):
+    help = "Release waitlist seat holds left unpaid past their expiry and offer the seats to the next in line."
+
+    def handle(self, *args, **options):
+        expired = expire_holds()
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} waitlist hold(s)."))
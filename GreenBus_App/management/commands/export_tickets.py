@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from GreenBus_App.exports import EXPORT_FORMATS, export_lines, ticket_export_rows
+
+
+class Command(BaseCommand):
+    help = "Stream tickets joined with bus, company and latest payment status as CSV or JSON lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date-from", help="First travel date to include (YYYY-MM-DD).")
+        parser.add_argument("--date-to", help="Last travel date to include (YYYY-MM-DD).")
+        parser.add_argument("--company", type=int, help="Only tickets of this company id.")
+        parser.add_argument("--export-format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--output", help="File to write; defaults to stdout.")
+
+    def handle(self, *args, **options):
+        dates = []
+        for option in ("date_from", "date_to"):
+            value = options[option]
+            try:
+                parsed = parse_date(value) if value else None
+            except ValueError:
+                parsed = None
+            if value and parsed is None:
+                raise CommandError(f"--{option.replace('_', '-')} must be a valid YYYY-MM-DD date.")
+            dates.append(parsed)
+
+        rows = ticket_export_rows(*dates, options["company"])
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in export_lines(options["export_format"], rows):
+                output.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        finally:
+            if options["output"]:
+                output.close()
@@ -0,0 +1,72 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so every measurement is a cold start. Requests go through the ASGI
+# application, as they do under daphne, so they see the warm-up it ran.
+CHILD = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+from GreenBus.asgi import application
+result = {"bootMs": (time.perf_counter() - started) * 1000, "requestMs": {}}
+from channels.testing import HttpCommunicator
+
+async def main():
+    for path in sys.argv[1:]:
+        started = time.perf_counter()
+        await HttpCommunicator(application, "GET", path, headers=[(b"host", b"localhost")]).get_response(timeout=60)
+        result["requestMs"][path] = (time.perf_counter() - started) * 1000
+
+asyncio.run(main())
+print(json.dumps(result))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure cold-start time of the ASGI application and its first requests, with or without warm-up."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Fresh processes to start (median is reported).")
+        parser.add_argument("--path", action="append", dest="paths",
+                            help="Request path timed after startup; repeatable. "
+                                 "Defaults to the stop autocomplete and seat availability endpoints.")
+        parser.add_argument("--no-warmup", action="store_true", help="Start workers with GREENBUS_WARMUP=0.")
+        parser.add_argument("--json", action="store_true", help="Print the medians as JSON, e.g. for CI tracking.")
+
+    def handle(self, *args, **options):
+        if options["runs"] < 1:
+            raise CommandError("--runs must be at least 1.")
+        paths = options["paths"] or ["/customer/stops/autocomplete/?q=ch",
+                                     "/customer/available-seats/?busId=1&fromWhere=Chennai&toWhere=Vellore"]
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "GreenBus.settings"),
+               "GREENBUS_WARMUP": "0" if options["no_warmup"] else "1"}
+
+        samples = {"boot": [], **{path: [] for path in paths}}
+        for _ in range(options["runs"]):
+            result = self._run_child(paths, env)
+            samples["boot"].append(result["bootMs"])
+            for path, ms in result["requestMs"].items():
+                samples[path].append(ms)
+
+        medians = {name: round(statistics.median(values), 1) for name, values in samples.items()}
+        if options["json"]:
+            self.stdout.write(json.dumps({"warmup": not options["no_warmup"], "runs": options["runs"],
+                                          "medianMs": medians}))
+            return
+        self.stdout.write(f"Warm-up {'disabled' if options['no_warmup'] else 'enabled'}, "
+                          f"median of {options['runs']} cold starts:")
+        self.stdout.write(f"  {'ASGI application import':<48} {medians['boot']:8.1f} ms")
+        for path in paths:
+            self.stdout.write(f"  {'first GET ' + path:<48} {medians[path]:8.1f} ms")
+
+    def _run_child(self, paths, env):
+        result = subprocess.run([sys.executable, "-c", CHILD, *paths], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f"Startup failed:\n{result.stderr}")
+        return json.loads(result.stdout.splitlines()[-1])
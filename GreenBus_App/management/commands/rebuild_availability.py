@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from GreenBus_App.availability import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the journey availability rows behind the fare calendar from live tickets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date-from", help="First travel date to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--date-to", help="Last travel date to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--batch-size", type=int, default=500, help="Trips rebuilt per transaction.")
+
+    def handle(self, *args, **options):
+        dates = []
+        for option in ("date_from", "date_to"):
+            value = options[option]
+            try:
+                parsed = parse_date(value) if value else None
+            except ValueError:
+                parsed = None
+            if value and parsed is None:
+                raise CommandError(f"--{option.replace('_', '-')} must be a valid YYYY-MM-DD date.")
+            dates.append(parsed)
+
+        rebuilt = rebuild(*dates, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt availability for {rebuilt} trip(s)."))
@@ -0,0 +1,81 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from GreenBus_App.models import BusModel
+from GreenBus_App.reconciliation import reconcile_chunk
+
+
+class Command(BaseCommand):
+    help = ("Recompute bus and route seat arrays from tickets across a process pool, report discrepancies "
+            "and optionally repair them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Worker processes; 1 checks in this process.")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Buses checked per snapshot.")
+        parser.add_argument("--repair", action="store_true",
+                            help="Rewrite the seat arrays of drifting buses under their row locks.")
+        parser.add_argument("--limit", type=int, default=20, help="Discrepancies listed in the text report.")
+        parser.add_argument("--json", action="store_true", help="Print the full report as JSON.")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--workers and --chunk-size must be at least 1.")
+
+        started = time.perf_counter()
+        chunks = self._chunks(options["chunk_size"])
+        if min(options["workers"], len(chunks)) <= 1:
+            results = [reconcile_chunk(chunk, options["repair"]) for chunk in chunks]
+        else:
+            # Spawned workers set Django up themselves and open their own connections.
+            with ProcessPoolExecutor(max_workers=min(options["workers"], len(chunks)),
+                                     mp_context=multiprocessing.get_context("spawn"), initializer=django.setup) as pool:
+                futures = [pool.submit(reconcile_chunk, chunk, options["repair"]) for chunk in chunks]
+                results = [future.result() for future in as_completed(futures)]
+
+        problems = sorted((problem for result in results for problem in result["problems"]),
+                          key=lambda problem: (problem["busId"], problem["kind"]))
+        report = {
+            "checked": sum(result["checked"] for result in results),
+            "seconds": round(time.perf_counter() - started, 2),
+            "busesWithProblems": len({problem["busId"] for problem in problems}),
+            "byKind": dict(Counter(problem["kind"] for problem in problems)),
+            "repaired": sum(result["repaired"] for result in results),
+            "problems": problems,
+        }
+        if options["repair"]:
+            report["unrepaired"] = [problem for result in results for problem in result["unrepaired"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+            return
+        self.stdout.write(f"Checked {report['checked']} bus(es) in {report['seconds']} s: "
+                          f"{report['busesWithProblems']} with discrepancies.")
+        for kind, count in sorted(report["byKind"].items()):
+            self.stdout.write(f"  {kind:<22} {count:>8}")
+        for problem in problems[:options["limit"]]:
+            self.stdout.write(f"  {json.dumps(problem)}")
+        if len(problems) > options["limit"]:
+            self.stdout.write(f"  ... {len(problems) - options['limit']} more (use --json for all)")
+        if options["repair"]:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {report['repaired']} bus(es)."))
+            if report["unrepaired"]:
+                self.stdout.write(self.style.WARNING(
+                    f"{len(report['unrepaired'])} ticket problem(s) need a manual fix; --json lists them."))
+
+    def _chunks(self, chunk_size):
+        chunks, last_id = [], 0
+        while True:
+            bus_ids = list(BusModel.objects.filter(id__gt=last_id).order_by("id")
+                           .values_list("id", flat=True)[:chunk_size])
+            if not bus_ids:
+                return chunks
+            chunks.append(bus_ids)
+            last_id = bus_ids[-1]
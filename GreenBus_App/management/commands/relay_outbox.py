@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from GreenBus_App.outbox import Relay, outbox_settings, prune
+
+
+class Command(BaseCommand):
+    help = "Deliver booking events from the transactional outbox to the configured sinks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Deliver what is pending and exit.")
+        parser.add_argument("--batch-size", type=int, default=None, help="Events claimed per transaction.")
+        parser.add_argument("--shard", type=int, default=0, help="Deliver only buses with id %% shards == shard.")
+        parser.add_argument("--shards", type=int, default=1, help="Number of relays splitting the buses.")
+        parser.add_argument("--prune-days", type=int, default=None,
+                            help="Delete events published more than this many days ago, then exit.")
+
+    def handle(self, *args, **options):
+        if options["prune_days"] is not None:
+            deleted = prune(timezone.now() - timedelta(days=options["prune_days"]))
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} published event(s)."))
+            return
+        if not 0 <= options["shard"] < options["shards"]:
+            raise CommandError("--shard must be between 0 and --shards - 1.")
+
+        relay = Relay(batch_size=options["batch_size"], shard=options["shard"], shards=options["shards"])
+        poll_seconds = outbox_settings()["POLL_SECONDS"]
+        total = 0
+        while True:
+            published = relay.run_once()
+            total += published
+            if options["once"] and not published:
+                break
+            if not published:
+                close_old_connections()
+                time.sleep(poll_seconds)
+        self.stdout.write(self.style.SUCCESS(f"Published {total} event(s)."))
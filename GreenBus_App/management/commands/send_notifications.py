@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from GreenBus_App.notifications import Dispatcher, notification_settings
+
+
+class Command(BaseCommand):
+    help = "Render and send queued customer notifications with a worker pool, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Send what is due now and exit.")
+        parser.add_argument("--workers", type=int, default=None, help="Threads rendering and sending batches.")
+        parser.add_argument("--batch-size", type=int, default=None, help="Notifications per backend call.")
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher(workers=options["workers"], batch_size=options["batch_size"])
+        poll_seconds = notification_settings()["POLL_SECONDS"]
+        total = 0
+        try:
+            while True:
+                attempted = dispatcher.run_once()
+                total += attempted
+                if options["once"] and not attempted:
+                    break
+                if not attempted:
+                    close_old_connections()
+                    time.sleep(poll_seconds)
+        finally:
+            dispatcher.close()
+        self.stdout.write(self.style.SUCCESS(f"Attempted {total} notification(s)."))
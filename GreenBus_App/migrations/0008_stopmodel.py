@@ -0,0 +1,86 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_stops(apps, schema_editor):
+    StopModel = apps.get_model('GreenBus_App', 'StopModel')
+    RouteModel = apps.get_model('GreenBus_App', 'RouteModel')
+    TicketModel = apps.get_model('GreenBus_App', 'TicketModel')
+    BusModel = apps.get_model('GreenBus_App', 'BusModel')
+
+    names = set(RouteModel.objects.values_list('stopName', flat=True))
+    for from_name, to_name in TicketModel.objects.values_list('fromStop', 'toStop').distinct():
+        names.update((from_name, to_name))
+    for from_name, to_name in BusModel.objects.values_list('fromWhere', 'toWhere').distinct():
+        names.update((from_name, to_name))
+    StopModel.objects.bulk_create([StopModel(stopName=name) for name in names], ignore_conflicts=True)
+
+    RouteModel.objects.update(stop=models.Subquery(
+        StopModel.objects.filter(stopName=models.OuterRef('stopName')).values('id')[:1]
+    ))
+
+    def first_route(stop_field, column):
+        return models.Subquery(
+            RouteModel.objects.filter(bus=models.OuterRef('bus'), stopName=models.OuterRef(stop_field))
+            .order_by('stopOrder').values(column)[:1]
+        )
+
+    TicketModel.objects.update(
+        fromStopRef=first_route('fromStop', 'stop'),
+        toStopRef=first_route('toStop', 'stop'),
+        fromStopOrder=first_route('fromStop', 'stopOrder'),
+        toStopOrder=first_route('toStop', 'stopOrder'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('GreenBus_App', '0007_alter_ticketmodel_seatnumbers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StopModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stopName', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'db_table': 'Stops',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='routemodel',
+            options={'ordering': ['stopOrder']},
+        ),
+        migrations.AddField(
+            model_name='ticketmodel',
+            name='fromStopOrder',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticketmodel',
+            name='toStopOrder',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='routemodel',
+            name='stop',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='routes', to='GreenBus_App.stopmodel'),
+        ),
+        migrations.AddField(
+            model_name='ticketmodel',
+            name='fromStopRef',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='GreenBus_App.stopmodel'),
+        ),
+        migrations.AddField(
+            model_name='ticketmodel',
+            name='toStopRef',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='GreenBus_App.stopmodel'),
+        ),
+        migrations.RunPython(backfill_stops, migrations.RunPython.noop),
+    ]
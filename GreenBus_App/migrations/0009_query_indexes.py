@@ -0,0 +1,81 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def renumber_duplicate_stops(apps, schema_editor):
+    """Give repeated stop orders of a bus consecutive values, in (stopOrder, id) order, before they must be unique."""
+    RouteModel = apps.get_model('GreenBus_App', 'RouteModel')
+    TicketModel = apps.get_model('GreenBus_App', 'TicketModel')
+
+    bus_ids = list(
+        RouteModel.objects.values('bus').order_by()
+        .annotate(stops=models.Count('id'), orders=models.Count('stopOrder', distinct=True))
+        .filter(stops__gt=models.F('orders')).values_list('bus', flat=True)
+    )
+    if not bus_ids:
+        return
+    routes, next_order = [], {}
+    for route in RouteModel.objects.filter(bus_id__in=bus_ids).order_by('bus_id', 'stopOrder', 'id'):
+        route.stopOrder = max(route.stopOrder, next_order.get(route.bus_id, 0))
+        next_order[route.bus_id] = route.stopOrder + 1
+        routes.append(route)
+    RouteModel.objects.bulk_update(routes, ['stopOrder'], batch_size=1000)
+
+    def first_route(stop_field):
+        return models.Subquery(
+            RouteModel.objects.filter(bus=models.OuterRef('bus'), stopName=models.OuterRef(stop_field))
+            .order_by('stopOrder').values('stopOrder')[:1]
+        )
+
+    TicketModel.objects.filter(bus_id__in=bus_ids).update(
+        fromStopOrder=first_route('fromStop'),
+        toStopOrder=first_route('toStop'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('GreenBus_App', '0008_stopmodel'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentmodel',
+            name='ticket',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='GreenBus_App.ticketmodel'),
+        ),
+        migrations.AlterField(
+            model_name='routemodel',
+            name='bus',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='routes', to='GreenBus_App.busmodel'),
+        ),
+        migrations.AlterField(
+            model_name='ticketmodel',
+            name='bus',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='GreenBus_App.busmodel'),
+        ),
+        migrations.AddIndex(
+            model_name='busmodel',
+            index=models.Index(fields=['date', 'busCompany'], name='bus_date_company_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentmodel',
+            index=models.Index(fields=['ticket', '-id'], name='payment_ticket_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routemodel',
+            index=models.Index(fields=['bus', 'stopName'], name='route_bus_stopname_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketmodel',
+            index=models.Index(fields=['bus', 'fromStopOrder', 'toStopOrder'], name='ticket_bus_segment_idx'),
+        ),
+        migrations.RunPython(renumber_duplicate_stops, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='routemodel',
+            constraint=models.UniqueConstraint(fields=('bus', 'stopOrder'), name='route_bus_stoporder_uniq'),
+        ),
+    ]
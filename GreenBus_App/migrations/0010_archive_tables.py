@@ -0,0 +1,68 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:19
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('GreenBus_App', '0009_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBusModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('busId', models.PositiveBigIntegerField(unique=True)),
+                ('busNo', models.PositiveIntegerField()),
+                ('totalSeats', models.PositiveIntegerField()),
+                ('fromWhere', models.CharField(max_length=20)),
+                ('toWhere', models.CharField(max_length=20)),
+                ('perSeatPrice', models.PositiveIntegerField()),
+                ('boardingTime', models.CharField(choices=[('Morning', '9AM'), ('Night', '9PM')], max_length=10)),
+                ('date', models.DateField()),
+                ('stops', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=50), default=list, size=None)),
+                ('archivedAt', models.DateTimeField(auto_now_add=True)),
+                ('busCompany', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GreenBus_App.companymodel')),
+            ],
+            options={
+                'db_table': 'Archived Buses',
+                'ordering': ['date', 'busId'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTicketModel',
+            fields=[
+                ('ticketId', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('seatNumbers', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('fromStop', models.CharField(max_length=50)),
+                ('toStop', models.CharField(max_length=50)),
+                ('fromStopOrder', models.PositiveIntegerField(null=True)),
+                ('toStopOrder', models.PositiveIntegerField(null=True)),
+                ('ticketPrice', models.PositiveIntegerField(default=0)),
+                ('bookingDate', models.DateField()),
+                ('paymentStatus', models.CharField(choices=[('Pending', 'Pending'), ('Paid', 'Paid'), ('Cancelled', 'Cancelled')], default='Pending', max_length=10)),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='GreenBus_App.archivedbusmodel')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GreenBus_App.usermodel')),
+            ],
+            options={
+                'db_table': 'Archived Tickets',
+                'ordering': ['ticketId'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPaymentModel',
+            fields=[
+                ('paymentId', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('paymentStatus', models.CharField(choices=[('Pending', 'Pending'), ('Paid', 'Paid'), ('Cancelled', 'Cancelled')], max_length=10)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GreenBus_App.usermodel')),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='GreenBus_App.archivedticketmodel')),
+            ],
+            options={
+                'db_table': 'Archived Payments',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('GreenBus_App', '0010_archive_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='busmodel',
+            name='seatVersion',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('GreenBus_App', '0011_busmodel_seatversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusDayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('busId', models.PositiveBigIntegerField(unique=True)),
+                ('busNo', models.PositiveIntegerField()),
+                ('date', models.DateField()),
+                ('totalSeats', models.PositiveIntegerField()),
+                ('segmentCount', models.PositiveIntegerField(default=0)),
+                ('ticketsSold', models.IntegerField(default=0)),
+                ('seatsSold', models.IntegerField(default=0)),
+                ('seatSegments', models.IntegerField(default=0)),
+                ('bookedRevenue', models.BigIntegerField(default=0)),
+                ('paidRevenue', models.BigIntegerField(default=0)),
+                ('cancellations', models.IntegerField(default=0)),
+                ('cancelledSeats', models.IntegerField(default=0)),
+                ('busCompany', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='GreenBus_App.companymodel')),
+            ],
+            options={
+                'db_table': 'Bus Day Rollups',
+                'indexes': [models.Index(fields=['date', 'busCompany'], name='rollup_bus_date_company_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SegmentDayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('busId', models.PositiveBigIntegerField()),
+                ('segment', models.PositiveIntegerField()),
+                ('date', models.DateField()),
+                ('fromStop', models.CharField(max_length=50)),
+                ('toStop', models.CharField(max_length=50)),
+                ('totalSeats', models.PositiveIntegerField()),
+                ('seatsSold', models.IntegerField(default=0)),
+                ('busCompany', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='GreenBus_App.companymodel')),
+            ],
+            options={
+                'db_table': 'Segment Day Rollups',
+                'indexes': [models.Index(fields=['date', 'busCompany'], name='rollup_segment_date_co_idx'), models.Index(fields=['fromStop', 'toStop', 'date'], name='rollup_segment_stops_idx')],
+                'constraints': [models.UniqueConstraint(fields=('busId', 'segment'), name='rollup_segment_bus_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('GreenBus_App', '0012_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fromStop', models.CharField(max_length=50)),
+                ('toStop', models.CharField(max_length=50)),
+                ('fromStopOrder', models.PositiveIntegerField()),
+                ('toStopOrder', models.PositiveIntegerField()),
+                ('seatCount', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('Waiting', 'Waiting'), ('Held', 'Held'), ('Confirmed', 'Confirmed'), ('Expired', 'Expired'), ('Cancelled', 'Cancelled')], default='Waiting', max_length=10)),
+                ('holdExpiresAt', models.DateTimeField(blank=True, null=True)),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+                ('bus', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='GreenBus_App.busmodel')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GreenBus_App.usermodel')),
+                ('ticket', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='GreenBus_App.ticketmodel')),
+            ],
+            options={
+                'db_table': 'Waitlist',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['bus', 'status', 'fromStopOrder', 'toStopOrder'], name='waitlist_bus_status_idx'), models.Index(condition=models.Q(('status', 'Held')), fields=['holdExpiresAt'], name='waitlist_held_expiry_idx'), models.Index(fields=['customer', 'status'], name='waitlist_customer_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('GreenBus_App', '0013_waitlist'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('eventType', models.CharField(max_length=40)),
+                ('busId', models.PositiveBigIntegerField()),
+                ('payload', models.JSONField(default=dict)),
+                ('channelGroup', models.CharField(blank=True, default='', max_length=60)),
+                ('channelMessage', models.JSONField(blank=True, null=True)),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+                ('publishedAt', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('lastError', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'db_table': 'Outbox Events',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('publishedAt__isnull', True)), fields=['id'], name='outbox_pending_idx'), models.Index(condition=models.Q(('publishedAt__isnull', True)), fields=['busId', 'id'], name='outbox_pending_bus_idx'), models.Index(fields=['publishedAt'], name='outbox_published_idx')],
+            },
+        ),
+    ]
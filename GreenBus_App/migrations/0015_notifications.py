@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('GreenBus_App', '0014_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationModel',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('eventId', models.PositiveBigIntegerField()),
+                ('kind', models.CharField(max_length=30)),
+                ('ticketId', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('context', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Sent', 'Sent'), ('Failed', 'Failed')], default='Pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('nextAttemptAt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lastError', models.TextField(blank=True, default='')),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+                ('sentAt', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='GreenBus_App.usermodel')),
+            ],
+            options={
+                'db_table': 'Notifications',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'Pending')), fields=['nextAttemptAt'], name='notification_due_idx'), models.Index(fields=['customer', '-id'], name='notification_customer_idx')],
+                'constraints': [models.UniqueConstraint(fields=('eventId', 'ticketId'), name='notification_event_ticket_uniq', nulls_distinct=False)],
+            },
+        ),
+    ]
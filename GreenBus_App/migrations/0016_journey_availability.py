@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-19 15:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('GreenBus_App', '0015_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JourneyAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fromStop', models.CharField(max_length=50)),
+                ('toStop', models.CharField(max_length=50)),
+                ('date', models.DateField()),
+                ('perSeatPrice', models.PositiveIntegerField()),
+                ('freeSeats', models.PositiveIntegerField()),
+                ('seatVersion', models.PositiveBigIntegerField()),
+                ('bus', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='GreenBus_App.busmodel')),
+            ],
+            options={
+                'db_table': 'Journey Availability',
+                'indexes': [models.Index(fields=['fromStop', 'toStop', 'date'], include=('perSeatPrice', 'freeSeats'), name='availability_journey_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bus', 'fromStop', 'toStop'), name='availability_bus_journey_uniq')],
+            },
+        ),
+    ]
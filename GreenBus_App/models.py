@@ -1,6 +1,6 @@
 from django.contrib.auth.models import AbstractUser, Group, Permission, User
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.db import models, transaction
 from django.db.models import CASCADE
 from django.utils.timezone import now
 from rest_framework.exceptions import ValidationError
@@ -36,6 +36,17 @@ class CompanyModel(models.Model):
     def __str__(self):
         return self.busCompany
 
+class StopModel(models.Model):
+    stopName = models.CharField(max_length=50, unique=True)
+
+    class Meta:
+        db_table = "Stops"
+        ordering = ["id"]
+
+    def __str__(self):
+        return self.stopName
+
+
 class BusModel(models.Model):
     busNo = models.PositiveIntegerField(unique=True)
     busCompany = models.ForeignKey(CompanyModel, on_delete=CASCADE)
@@ -49,27 +60,49 @@ class BusModel(models.Model):
     TIME_CHOICES = [("Morning", "9AM"), ("Night", "9PM")]
     boardingTime = models.CharField(choices=TIME_CHOICES, max_length=10)
     date = models.DateField(default=now)
+    seatVersion = models.PositiveBigIntegerField(default=0, editable=False)  # bumped on every seat/route change
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "busCompany"], name="bus_date_company_idx"),
+        ]
+
     def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if not adding:
+            # Bumped in SQL, like RouteModel.save, so a save from a stale instance cannot undo another bump.
+            self.seatVersion = models.F("seatVersion") + 1
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "seatVersion"}
+        else:
+            # Full saves (new trips, edited seat counts) store the seat arrays they imply.
+            self.update_seat_status(save_instance=False)
         super().save(*args, **kwargs)
-        self.update_seat_status(save_instance=False)
+        if not adding:
+            # Deferred rather than re-read: the bumped value is only fetched if something asks for it.
+            del self.__dict__["seatVersion"]
 
     def get_booked_seats(self, from_stop=None, to_stop=None):
-        booked_seats = set()
-        tickets = TicketModel.objects.filter(bus=self)
+        if not (from_stop and to_stop):
+            return self.booked_seats_between()
 
-        for ticket in tickets:
-            if from_stop and to_stop:
-                ticket_from = self.routes.filter(stopName=ticket.fromStop).first()
-                ticket_to = self.routes.filter(stopName=ticket.toStop).first()
-                search_from = self.routes.filter(stopName=from_stop).first()
-                search_to = self.routes.filter(stopName=to_stop).first()
+        orders = dict(self.routes.filter(stopName__in=[from_stop, to_stop])
+                      .order_by("-stopOrder").values_list("stopName", "stopOrder"))
+        if from_stop not in orders or to_stop not in orders:
+            return []
+        return self.booked_seats_between(orders[from_stop], orders[to_stop])
 
-                if ticket_from and ticket_to and search_from and search_to:
-                    if not (ticket_to.stopOrder <= search_from.stopOrder or ticket_from.stopOrder >= search_to.stopOrder):
-                        booked_seats.update(ticket.seatNumbers)
-            else:
-                booked_seats.update(ticket.seatNumbers)
+    def booked_seats_between(self, from_order=None, to_order=None):
+        """Seats held by tickets whose stop orders overlap ``[from_order, to_order)``; all tickets if omitted."""
+        if self.pk is None:
+            return []
+        tickets = TicketModel.objects.filter(bus=self)
+        if from_order is not None and to_order is not None:
+            tickets = tickets.filter(fromStopOrder__lt=to_order, toStopOrder__gt=from_order)
 
+        booked_seats = set()
+        for seat_numbers in tickets.values_list("seatNumbers", flat=True):
+            booked_seats.update(seat_numbers)
         return sorted(booked_seats)
 
     def update_seat_status(self, save_instance=True):
@@ -82,64 +115,375 @@ class BusModel(models.Model):
         if save_instance:
             self.save(update_fields=["availableSeats", "bookedSeats"])
 
-    def release_seats(self, seat_numbers):
-        """Remove cancelled seats from bookedSeats and update availableSeats."""
-        booked_seats = set(self.get_booked_seats()) - set(seat_numbers)
-        all_seats = set(range(1, self.totalSeats + 1))
-        self.bookedSeats = list(booked_seats)
-        self.availableSeats = sorted(all_seats - booked_seats - set(self.blockedSeats))
-        self.save(update_fields=["bookedSeats", "availableSeats"])
-
 class RouteModel(models.Model):
-    bus = models.ForeignKey(BusModel, on_delete=CASCADE, related_name="routes")
+    bus = models.ForeignKey(BusModel, on_delete=CASCADE, related_name="routes", db_index=False)
     stopName = models.CharField(max_length=50)
+    stop = models.ForeignKey(StopModel, on_delete=models.PROTECT, related_name="routes", null=True, editable=False)
     stopOrder = models.PositiveIntegerField()
     bookedSeats = ArrayField(models.PositiveIntegerField(), blank=True, default=list)  # Add this back
 
     class Meta:
         db_table = "Bus Routes"
         ordering = ["stopOrder"]
+        constraints = [
+            models.UniqueConstraint(fields=["bus", "stopOrder"], name="route_bus_stoporder_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["bus", "stopName"], name="route_bus_stopname_idx"),
+        ]
 
     def __str__(self):
         return f"{self.bus.busNo} - {self.stopName}"
 
+    def save(self, *args, **kwargs):
+        """Link the named stop and re-resolve the stop orders stored on this bus's tickets."""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "stopName" in update_fields:
+            self.stop, _ = StopModel.objects.get_or_create(stopName=self.stopName)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "stop"}
+        super().save(*args, **kwargs)
+        if update_fields is None or {"stopName", "stopOrder"} & set(update_fields):
+            TicketModel.objects.filter(bus_id=self.bus_id).update(**TicketModel.stop_resolution())
+        BusModel.objects.filter(id=self.bus_id).update(seatVersion=models.F("seatVersion") + 1)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        TicketModel.objects.filter(bus_id=self.bus_id).update(**TicketModel.stop_resolution())
+        BusModel.objects.filter(id=self.bus_id).update(seatVersion=models.F("seatVersion") + 1)
+        return result
+
 
 
 class TicketModel(models.Model):
     ticketId = models.AutoField(primary_key=True)
     customer = models.ForeignKey(UserModel, on_delete=CASCADE)
-    bus = models.ForeignKey(BusModel, on_delete=CASCADE)
+    bus = models.ForeignKey(BusModel, on_delete=CASCADE, db_index=False)
     seatNumbers = ArrayField(models.IntegerField(), default=list)
     fromStop = models.CharField(max_length=50)
     toStop = models.CharField(max_length=50)
+    fromStopRef = models.ForeignKey(StopModel, on_delete=models.PROTECT, related_name="+", null=True,
+                                    editable=False)
+    toStopRef = models.ForeignKey(StopModel, on_delete=models.PROTECT, related_name="+", null=True,
+                                  editable=False)
+    fromStopOrder = models.PositiveIntegerField(null=True, editable=False)
+    toStopOrder = models.PositiveIntegerField(null=True, editable=False)
     ticketPrice = models.PositiveIntegerField(default=0, editable=False)
     bookingDate = models.DateField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["bus", "fromStopOrder", "toStopOrder"], name="ticket_bus_segment_idx"),
+        ]
+
     def __str__(self):
         return f"Ticket {self.ticketId} - Bus {self.bus.busNo} - Seats {self.seatNumbers}"
 
+    @staticmethod
+    def stop_resolution():
+        """``update()`` expressions that resolve fromStop/toStop against the bus's routes in SQL."""
+        def first_route(stop_field, column):
+            return models.Subquery(
+                RouteModel.objects.filter(bus=models.OuterRef("bus"), stopName=models.OuterRef(stop_field))
+                .order_by("stopOrder").values(column)[:1]
+            )
+
+        return {
+            "fromStopRef": first_route("fromStop", "stop"),
+            "toStopRef": first_route("toStop", "stop"),
+            "fromStopOrder": first_route("fromStop", "stopOrder"),
+            "toStopOrder": first_route("toStop", "stopOrder"),
+        }
+
+    def resolve_stops(self):
+        """Store the stop ids and route orders of fromStop/toStop so overlap checks compare integers."""
+        self.fromStopRef_id = self.toStopRef_id = self.fromStopOrder = self.toStopOrder = None
+        for stop_name, stop_id, stop_order in (RouteModel.objects.filter(bus_id=self.bus_id,
+                                                                         stopName__in=[self.fromStop, self.toStop])
+                                                .order_by("-stopOrder").values_list("stopName", "stop", "stopOrder")):
+            if stop_name == self.fromStop:
+                self.fromStopRef_id, self.fromStopOrder = stop_id, stop_order
+            if stop_name == self.toStop:
+                self.toStopRef_id, self.toStopOrder = stop_id, stop_order
+
     def save(self, *args, **kwargs):
         """Calculate ticket price and check seat availability before saving."""
         self.ticketPrice = len(self.seatNumbers) * self.bus.perSeatPrice
+        if kwargs.get("update_fields") is None:
+            self.resolve_stops()
         super().save(*args, **kwargs)
         self.bus.update_seat_status()
 
     def delete(self, *args, **kwargs):
-        bus = self.bus  # Get reference before deletion
-        super().delete(*args, **kwargs)  # Delete ticket
-        bus.update_seat_status()
+        with transaction.atomic():
+            # The bus row is locked before the routes, in the order bookings take them.
+            bus = BusModel.objects.select_for_update().get(id=self.bus_id)
+            result = super().delete(*args, **kwargs)  # Delete ticket
+            if self.fromStopOrder is not None and self.toStopOrder is not None:
+                # No other ticket holds these seats on these hops, so the hops lose exactly them.
+                RouteModel.objects.filter(bus=bus, stopOrder__gte=self.fromStopOrder,
+                                          stopOrder__lt=self.toStopOrder) \
+                    .update(bookedSeats=models.expressions.RawSQL(
+                        'ARRAY(SELECT seat FROM unnest("bookedSeats") AS seat WHERE seat <> ALL(%s::integer[]) '
+                        'ORDER BY seat)', (list(self.seatNumbers),)))
+            bus.update_seat_status()
+        return result
 
 
 class PaymentModel(models.Model):
     PAYMENT_CHOICES = [("Pending", "Pending"), ("Paid", "Paid"), ("Cancelled", "Cancelled")]
     customer = models.ForeignKey(UserModel, on_delete=models.CASCADE)
-    ticket = models.ForeignKey(TicketModel, on_delete=models.CASCADE)
+    ticket = models.ForeignKey(TicketModel, on_delete=models.CASCADE, db_index=False)
     paymentStatus = models.CharField(max_length=10, choices=PAYMENT_CHOICES, default="Pending")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["ticket", "-id"], name="payment_ticket_latest_idx"),
+        ]
+
     def delete(self, *args, **kwargs):
         if self.paymentStatus == "Cancelled":
             self.ticket.delete()
         super().delete(*args, **kwargs)
 
 
+class WaitlistModel(models.Model):
+    """
+    A request for ``seatCount`` seats between two stops of a sold-out bus.
+
+    ``GreenBus_App.waitlist`` turns a Waiting entry into a Held one when seats free up: it books
+    a ticket with a Pending payment that the customer has until ``holdExpiresAt`` to pay.
+    """
+    STATUS_CHOICES = [("Waiting", "Waiting"), ("Held", "Held"), ("Confirmed", "Confirmed"), ("Expired", "Expired"),
+                      ("Cancelled", "Cancelled")]
+    customer = models.ForeignKey(UserModel, on_delete=CASCADE)
+    bus = models.ForeignKey(BusModel, on_delete=CASCADE, related_name="waitlist", db_index=False)
+    fromStop = models.CharField(max_length=50)
+    toStop = models.CharField(max_length=50)
+    fromStopOrder = models.PositiveIntegerField()
+    toStopOrder = models.PositiveIntegerField()
+    seatCount = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="Waiting")
+    ticket = models.ForeignKey(TicketModel, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    holdExpiresAt = models.DateTimeField(null=True, blank=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "Waitlist"
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["bus", "status", "fromStopOrder", "toStopOrder"], name="waitlist_bus_status_idx"),
+            models.Index(fields=["holdExpiresAt"], name="waitlist_held_expiry_idx", condition=models.Q(status="Held")),
+            models.Index(fields=["customer", "status"], name="waitlist_customer_idx"),
+        ]
+
+    def __str__(self):
+        return f"Waitlist {self.id} - Bus {self.bus_id} - {self.fromStop} to {self.toStop} x{self.seatCount}"
+
+
+class OutboxEvent(models.Model):
+    """
+    A booking side effect recorded in the transaction of the change, delivered later by ``GreenBus_App.outbox``.
+
+    ``payload`` goes to every sink. ``channelMessage``, when set, is sent to the channel layer group ``channelGroup``.
+    """
+    id = models.BigAutoField(primary_key=True)
+    eventType = models.CharField(max_length=40)
+    busId = models.PositiveBigIntegerField()
+    payload = models.JSONField(default=dict)
+    channelGroup = models.CharField(max_length=60, blank=True, default="")
+    channelMessage = models.JSONField(null=True, blank=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    publishedAt = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    lastError = models.TextField(blank=True, default="")
+
+    class Meta:
+        db_table = "Outbox Events"
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["id"], name="outbox_pending_idx", condition=models.Q(publishedAt__isnull=True)),
+            models.Index(fields=["busId", "id"], name="outbox_pending_bus_idx",
+                         condition=models.Q(publishedAt__isnull=True)),
+            models.Index(fields=["publishedAt"], name="outbox_published_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.eventType} #{self.id} (bus {self.busId})"
+
+
+class NotificationModel(models.Model):
+    """
+    A customer message queued from an outbox event and sent by ``GreenBus_App.notifications``.
+
+    ``ticketId`` has no foreign key: cancellation notices outlive their tickets.
+    """
+    STATUS_CHOICES = [("Pending", "Pending"), ("Sent", "Sent"), ("Failed", "Failed")]
+    id = models.BigAutoField(primary_key=True)
+    eventId = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=30)
+    customer = models.ForeignKey(UserModel, on_delete=CASCADE, related_name="notifications")
+    ticketId = models.PositiveBigIntegerField(null=True, blank=True)
+    context = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="Pending")
+    attempts = models.PositiveIntegerField(default=0)
+    nextAttemptAt = models.DateTimeField(default=now)
+    lastError = models.TextField(blank=True, default="")
+    createdAt = models.DateTimeField(auto_now_add=True)
+    sentAt = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "Notifications"
+        ordering = ["id"]
+        constraints = [
+            # Outbox delivery is at least once; a redelivered event must not notify twice.
+            models.UniqueConstraint(fields=["eventId", "ticketId"], name="notification_event_ticket_uniq",
+                                    nulls_distinct=False),
+        ]
+        indexes = [
+            models.Index(fields=["nextAttemptAt"], name="notification_due_idx",
+                         condition=models.Q(status="Pending")),
+            models.Index(fields=["customer", "-id"], name="notification_customer_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
 
+class ArchivedBusModel(models.Model):
+    """A completed trip moved out of ``BusModel`` by the archive job, with its route flattened into ``stops``."""
+    busId = models.PositiveBigIntegerField(unique=True)
+    busNo = models.PositiveIntegerField()
+    busCompany = models.ForeignKey(CompanyModel, on_delete=CASCADE)
+    totalSeats = models.PositiveIntegerField()
+    fromWhere = models.CharField(max_length=20)
+    toWhere = models.CharField(max_length=20)
+    perSeatPrice = models.PositiveIntegerField()
+    boardingTime = models.CharField(choices=BusModel.TIME_CHOICES, max_length=10)
+    date = models.DateField()
+    stops = ArrayField(models.CharField(max_length=50), default=list)
+    archivedAt = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "Archived Buses"
+        ordering = ["date", "busId"]
+
+    def __str__(self):
+        return f"{self.busNo} ({self.date})"
+
+
+class ArchivedTicketModel(models.Model):
+    ticketId = models.PositiveBigIntegerField(primary_key=True)
+    customer = models.ForeignKey(UserModel, on_delete=CASCADE)
+    bus = models.ForeignKey(ArchivedBusModel, on_delete=CASCADE, related_name="tickets")
+    seatNumbers = ArrayField(models.IntegerField(), default=list)
+    fromStop = models.CharField(max_length=50)
+    toStop = models.CharField(max_length=50)
+    fromStopOrder = models.PositiveIntegerField(null=True)
+    toStopOrder = models.PositiveIntegerField(null=True)
+    ticketPrice = models.PositiveIntegerField(default=0)
+    bookingDate = models.DateField()
+    paymentStatus = models.CharField(max_length=10, choices=PaymentModel.PAYMENT_CHOICES, default="Pending")
+
+    class Meta:
+        db_table = "Archived Tickets"
+        ordering = ["ticketId"]
+
+    def __str__(self):
+        return f"Ticket {self.ticketId} - Bus {self.bus.busNo} - Seats {self.seatNumbers}"
+
+
+class ArchivedPaymentModel(models.Model):
+    paymentId = models.PositiveBigIntegerField(primary_key=True)
+    customer = models.ForeignKey(UserModel, on_delete=CASCADE)
+    ticket = models.ForeignKey(ArchivedTicketModel, on_delete=CASCADE, related_name="payments")
+    paymentStatus = models.CharField(max_length=10, choices=PaymentModel.PAYMENT_CHOICES)
+
+    class Meta:
+        db_table = "Archived Payments"
+
+
+class BusDayRollup(models.Model):
+    """
+    Sales totals for one trip, maintained by ``GreenBus_App.rollups``.
+
+    Keyed by the bus id without a foreign key so rows outlive archiving. ``seatSegments``
+    counts each sold seat once per hop it covers (routes carry no distances).
+    """
+    busId = models.PositiveBigIntegerField(unique=True)
+    busNo = models.PositiveIntegerField()
+    busCompany = models.ForeignKey(CompanyModel, on_delete=CASCADE, related_name="+")
+    date = models.DateField()
+    totalSeats = models.PositiveIntegerField()
+    segmentCount = models.PositiveIntegerField(default=0)
+    ticketsSold = models.IntegerField(default=0)
+    seatsSold = models.IntegerField(default=0)
+    seatSegments = models.IntegerField(default=0)
+    bookedRevenue = models.BigIntegerField(default=0)
+    paidRevenue = models.BigIntegerField(default=0)
+    cancellations = models.IntegerField(default=0)
+    cancelledSeats = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "Bus Day Rollups"
+        indexes = [
+            models.Index(fields=["date", "busCompany"], name="rollup_bus_date_company_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.busNo} ({self.date})"
+
+
+class SegmentDayRollup(models.Model):
+    """Seats sold on one hop (``segment`` = position of its first stop on the route) of one trip."""
+    busId = models.PositiveBigIntegerField()
+    segment = models.PositiveIntegerField()
+    busCompany = models.ForeignKey(CompanyModel, on_delete=CASCADE, related_name="+")
+    date = models.DateField()
+    fromStop = models.CharField(max_length=50)
+    toStop = models.CharField(max_length=50)
+    totalSeats = models.PositiveIntegerField()
+    seatsSold = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "Segment Day Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=["busId", "segment"], name="rollup_segment_bus_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["date", "busCompany"], name="rollup_segment_date_co_idx"),
+            models.Index(fields=["fromStop", "toStop", "date"], name="rollup_segment_stops_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.busId}: {self.fromStop} - {self.toStop}"
+
+
+class JourneyAvailability(models.Model):
+    """
+    Free seats and fare of one trip between two of its stops, maintained by ``GreenBus_App.availability``.
+
+    One row per ordered pair of stops on the route (first occurrence of each, as in search), so
+    the calendar aggregates an index-only range over ``(fromStop, toStop, date)``.
+    ``seatVersion`` is the bus's version the row was computed from.
+    """
+    bus = models.ForeignKey(BusModel, on_delete=CASCADE, related_name="+", db_index=False)
+    fromStop = models.CharField(max_length=50)
+    toStop = models.CharField(max_length=50)
+    date = models.DateField()
+    perSeatPrice = models.PositiveIntegerField()
+    freeSeats = models.PositiveIntegerField()
+    seatVersion = models.PositiveBigIntegerField()
+
+    class Meta:
+        db_table = "Journey Availability"
+        constraints = [
+            models.UniqueConstraint(fields=["bus", "fromStop", "toStop"], name="availability_bus_journey_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["fromStop", "toStop", "date"], include=["perSeatPrice", "freeSeats"],
+                         name="availability_journey_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.bus_id}: {self.fromStop} - {self.toStop} ({self.date})"
@@ -0,0 +1,312 @@
+"""
+Customer notifications for bookings, payments, cancellations and waitlist holds.
+
+``NotificationSink`` runs in the outbox relay. It turns each event into
+``NotificationModel`` rows in the relay's own transaction, so queueing
+commits together with the event being marked published, and no request pays
+for it. ``Dispatcher`` (``manage.py send_notifications``) drains the queue
+with a thread pool:
+- It leases a batch of due rows by moving their ``nextAttemptAt`` past
+  ``LEASE_SECONDS``, so rows of a crashed dispatcher come back by themselves.
+- It renders the rows and gives each worker's chunk to the backend in one
+  call.
+- It records the outcome: sent, retried with exponential backoff, or failed
+  after ``MAX_ATTEMPTS``.
+
+Ticket documents are rendered once per paid ticket and cached by ticket id.
+Payment receipts and the ticket download endpoint share that cache.
+"""
+import json
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from GreenBus_App import outbox
+from GreenBus_App.models import NotificationModel, PaymentModel, TicketModel, UserModel
+
+DEFAULTS = {
+    "BACKEND": "GreenBus_App.notifications.ConsoleBackend",
+    "WORKERS": 4,
+    "BATCH_SIZE": 50,              # notifications per backend call
+    "MAX_ATTEMPTS": 5,
+    "BACKOFF_SECONDS": 30,         # first retry delay, doubled per attempt
+    "MAX_BACKOFF_SECONDS": 3600,
+    "LEASE_SECONDS": 300,          # a leased batch is retried after this if its dispatcher dies
+    "POLL_SECONDS": 1,
+    "DOCUMENT_CACHE_SECONDS": 86400,
+    "FILE_PATH": None,             # FileBackend target
+}
+
+EVENT_KINDS = {
+    outbox.TICKET_BOOKED: "booking_confirmation",
+    outbox.PAYMENT_PAID: "payment_receipt",
+    outbox.TICKET_CANCELLED: "cancellation",
+    outbox.TRIP_CANCELLED: "trip_cancellation",
+    outbox.WAITLIST_HELD: "waitlist_hold",
+    outbox.WAITLIST_EXPIRED: "waitlist_expired",
+    outbox.WAITLIST_CANCELLED: "waitlist_cancelled",
+}
+
+TEMPLATES = {
+    "booking_confirmation": ("Booking {ticketId} confirmed",
+                             "Seats {seatNumbers} from {fromStop} to {toStop} are booked for you. "
+                             "Amount due: {ticketPrice}."),
+    "payment_receipt": ("Payment received for ticket {ticketId}",
+                        "We received {amount} for ticket {ticketId}. Your ticket is attached."),
+    "cancellation": ("Ticket {ticketId} cancelled",
+                     "Your ticket for seats {seatNumbers} from {fromStop} to {toStop} is cancelled ({reason})."),
+    "trip_cancellation": ("Trip cancelled: ticket {ticketId}",
+                          "The operator cancelled this trip, so your ticket {ticketId} is cancelled."),
+    "waitlist_hold": ("Seats held for you", "{message}"),
+    "waitlist_expired": ("Seat hold expired", "{message}"),
+    "waitlist_cancelled": ("Waitlist closed", "{message}"),
+}
+WITH_TICKET_DOCUMENT = {"payment_receipt"}
+
+
+def notification_settings():
+    return {**DEFAULTS, **getattr(settings, "NOTIFICATIONS", {})}
+
+
+class PermanentError(Exception):
+    """Raised (or returned) by a backend for a message that no retry can deliver."""
+
+
+class Message:
+    __slots__ = ("notification_id", "username", "email", "subject", "body", "attachments")
+
+    def __init__(self, notification_id, username, email, subject, body, attachments):
+        self.notification_id = notification_id
+        self.username = username
+        self.email = email
+        self.subject = subject
+        self.body = body
+        self.attachments = attachments  # (filename, content, mimetype)
+
+
+def notifications_for(event):
+    """Unsaved ``NotificationModel`` rows for an outbox event."""
+    kind = EVENT_KINDS.get(event.eventType)
+    payload = event.payload
+    # The holder of a waitlist hold is told by its waitlist.held notice; the ticket is not confirmed yet.
+    if kind is None or payload.get("waitlistHold"):
+        return []
+    if event.eventType == outbox.TRIP_CANCELLED:
+        recipients = [(ticket["customerId"], ticket["ticketId"], ticket) for ticket in payload["tickets"]]
+    else:
+        recipients = [(payload["customerId"], payload.get("ticketId", payload.get("ticket_id")), payload)]
+    return [
+        NotificationModel(eventId=event.id, kind=kind, customer_id=customer_id, ticketId=ticket_id,
+                          context={"busId": event.busId, **context})
+        for customer_id, ticket_id, context in recipients
+    ]
+
+
+class NotificationSink:
+    """Outbox sink that queues notifications in the relay's transaction."""
+
+    def __init__(self, options):
+        self.pending = []
+
+    def send(self, event):
+        self.pending.extend(notifications_for(event))
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        # Profiles deleted since the event was recorded would fail the relay's commit.
+        customers = set(UserModel.objects.filter(id__in={row.customer_id for row in pending})
+                        .values_list("id", flat=True))
+        NotificationModel.objects.bulk_create([row for row in pending if row.customer_id in customers],
+                                              ignore_conflicts=True)
+
+
+class _Context(dict):
+    def __missing__(self, key):
+        return ""
+
+
+def render(notification):
+    subject, body = TEMPLATES[notification.kind]
+    context = _Context(notification.context)
+    attachments = []
+    if notification.kind in WITH_TICKET_DOCUMENT and notification.ticketId:
+        document = ticket_document(notification.ticketId)
+        if document is not None:
+            attachments.append((f"ticket-{notification.ticketId}.txt", document, "text/plain"))
+    user = notification.customer.user
+    return Message(notification.id, user.username if user else "", user.email if user else "",
+                   subject.format_map(context), body.format_map(context), attachments)
+
+
+def _document_key(ticket_id):
+    return f"ticket-document:{ticket_id}"
+
+
+def ticket_document(ticket_id):
+    """Plain-text ticket, or ``None`` if the ticket is gone. Paid tickets no longer change, so only they are cached."""
+    document = cache.get(_document_key(ticket_id))
+    if document is not None:
+        return document
+
+    latest_status = PaymentModel.objects.filter(ticket=OuterRef("ticketId")).order_by("-id").values("paymentStatus")[:1]
+    row = (TicketModel.objects.filter(ticketId=ticket_id)
+           .annotate(latest_payment=Coalesce(Subquery(latest_status), Value("Pending")))
+           .values_list("bus__busNo", "bus__busCompany__busCompany", "bus__date", "bus__boardingTime", "fromStop",
+                        "toStop", "seatNumbers", "ticketPrice", "customer__user__username", "latest_payment")
+           .first())
+    if row is None:
+        return None
+    bus_no, company, travel_date, boarding, from_stop, to_stop, seats, price, username, payment_status = row
+    document = "\n".join([
+        f"GreenBus ticket {ticket_id}",
+        f"Passenger: {username}",
+        f"Bus: {bus_no} ({company})",
+        f"Date: {travel_date:%Y-%m-%d} {boarding}",
+        f"From: {from_stop}",
+        f"To: {to_stop}",
+        f"Seats: {', '.join(map(str, seats))}",
+        f"Fare: {price}",
+        f"Payment: {payment_status}",
+    ]) + "\n"
+    if payment_status == "Paid":
+        cache.set(_document_key(ticket_id), document, notification_settings()["DOCUMENT_CACHE_SECONDS"])
+    return document
+
+
+class ConsoleBackend:
+    """Prints messages; for development."""
+
+    def __init__(self, options):
+        self.stream = sys.stdout
+
+    def send_many(self, messages):
+        for message in messages:
+            self.stream.write(f"To {message.username} <{message.email}>: {message.subject}\n{message.body}\n"
+                              f"{''.join(f'[{name}]' for name, _, _ in message.attachments)}\n\n")
+        return [None] * len(messages)
+
+
+class FileBackend:
+    """Appends messages as JSON lines to ``NOTIFICATIONS["FILE_PATH"]``; a stand-in for e-mail or SMS in tests."""
+
+    def __init__(self, options):
+        self.path = options["FILE_PATH"]
+
+    def send_many(self, messages):
+        with open(self.path, "a") as file:
+            for message in messages:
+                file.write(json.dumps({
+                    "notificationId": message.notification_id, "username": message.username,
+                    "email": message.email, "subject": message.subject, "body": message.body,
+                    "attachments": [{"filename": name, "content": content} for name, content, _ in message.attachments],
+                }) + "\n")
+        return [None] * len(messages)
+
+
+class EmailBackend:
+    """Sends e-mail through Django's configured e-mail backend, one connection per batch."""
+
+    def __init__(self, options):
+        pass
+
+    def send_many(self, messages):
+        results = [None] * len(messages)
+        emails = []
+        for index, message in enumerate(messages):
+            if not message.email:
+                results[index] = PermanentError("Customer has no e-mail address.")
+                continue
+            email = EmailMessage(message.subject, message.body, to=[message.email])
+            for attachment in message.attachments:
+                email.attach(*attachment)
+            emails.append((index, email))
+        with get_connection() as connection:
+            for index, email in emails:
+                try:
+                    connection.send_messages([email])
+                except Exception as e:
+                    results[index] = e
+        return results
+
+
+class Dispatcher:
+    def __init__(self, backend=None, workers=None, batch_size=None):
+        self.options = notification_settings()
+        self.backend = backend or import_string(self.options["BACKEND"])(self.options)
+        self.workers = workers or self.options["WORKERS"]
+        self.batch_size = batch_size or self.options["BATCH_SIZE"]
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="notifications")
+
+    def run_once(self):
+        """Send one round of due notifications; returns how many were attempted."""
+        batch = self.lease(self.workers * self.batch_size)
+        chunks = [batch[start:start + self.batch_size] for start in range(0, len(batch), self.batch_size)]
+        list(self.pool.map(self._send_chunk, chunks))
+        return len(batch)
+
+    def lease(self, limit):
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(NotificationModel.objects.select_for_update(skip_locked=True)
+                       .filter(status="Pending", nextAttemptAt__lte=now)
+                       .order_by("nextAttemptAt", "id").values_list("id", flat=True)[:limit])
+            NotificationModel.objects.filter(id__in=ids).update(
+                attempts=F("attempts") + 1, nextAttemptAt=now + timedelta(seconds=self.options["LEASE_SECONDS"]))
+        return list(NotificationModel.objects.filter(id__in=ids).select_related("customer__user").order_by("id"))
+
+    def _send_chunk(self, notifications):
+        try:
+            results = {}
+            messages = []
+            for notification in notifications:
+                try:
+                    messages.append(render(notification))
+                except Exception as e:
+                    results[notification.id] = e
+            try:
+                sent = self.backend.send_many(messages)
+            except Exception as e:
+                sent = [e] * len(messages)
+            results.update((message.notification_id, result) for message, result in zip(messages, sent))
+            self._record(notifications, results)
+        finally:
+            close_old_connections()
+
+    def _record(self, notifications, results):
+        now = timezone.now()
+        sent, retries, failed = [], [], []
+        for notification in notifications:
+            error = results.get(notification.id)
+            if error is None:
+                sent.append(notification.id)
+                continue
+            notification.lastError = repr(error)
+            if isinstance(error, PermanentError) or notification.attempts >= self.options["MAX_ATTEMPTS"]:
+                notification.status = "Failed"
+                failed.append(notification)
+            else:
+                notification.nextAttemptAt = now + timedelta(seconds=self.backoff(notification.attempts))
+                retries.append(notification)
+        if sent:
+            NotificationModel.objects.filter(id__in=sent).update(status="Sent", sentAt=now, lastError="")
+        NotificationModel.objects.bulk_update(failed, ["status", "lastError"])
+        NotificationModel.objects.bulk_update(retries, ["nextAttemptAt", "lastError"])
+
+    def backoff(self, attempts):
+        delay = min(self.options["BACKOFF_SECONDS"] * 2 ** (attempts - 1), self.options["MAX_BACKOFF_SECONDS"])
+        return delay * random.uniform(0.9, 1.1)
+
+    def close(self):
+        self.pool.shutdown()
@@ -0,0 +1,235 @@
+"""
+Transactional outbox for booking side effects.
+
+Booking, payment and cancellation flows call ``publish`` inside their
+transaction, so an event is stored exactly when the change it describes
+commits, and the request itself never waits on the channel layer. The relay
+(``manage.py relay_outbox``) delivers stored events afterwards. It claims a
+batch with ``FOR UPDATE SKIP LOCKED``, hands each event to every sink in
+``OUTBOX["SINKS"]`` in id order and marks it published in the same
+transaction. Delivery is at least once: a relay that dies after sending but
+before committing sends the batch again, so consumers deduplicate on
+``eventId``.
+
+Events of one bus are delivered in order. A relay takes a bus's events only
+up to the first one that another relay holds or that failed. An event that
+has failed ``OUTBOX["MAX_ATTEMPTS"]`` times is parked: the relay logs it and
+stops trying, so the bus's later events go out, until the admin "retry"
+action resets its attempts. Relays started with ``--shards`` split the buses
+by id and do not contend at all.
+"""
+import logging
+import os
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Mod
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+
+from GreenBus_App.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "SINKS": ["GreenBus_App.outbox.ChannelLayerSink"],
+    "BATCH_SIZE": 200,       # events claimed per transaction
+    "POLL_SECONDS": 0.5,     # relay sleep when there is nothing to send
+    "MAX_ATTEMPTS": 10,      # failed deliveries before an event is parked
+    "FILE_PATH": None,       # FileSink target
+}
+
+TICKET_BOOKED = "ticket.booked"
+TICKET_CANCELLED = "ticket.cancelled"
+PAYMENT_PAID = "payment.paid"
+TRIP_CANCELLED = "trip.cancelled"
+WAITLIST_HELD = "waitlist.held"
+WAITLIST_EXPIRED = "waitlist.expired"
+WAITLIST_CANCELLED = "waitlist.cancelled"
+
+
+def outbox_settings():
+    return {**DEFAULTS, **getattr(settings, "OUTBOX", {})}
+
+
+def publish(*events):
+    """Store events in the caller's transaction; the relay delivers them once it commits."""
+    OutboxEvent.objects.bulk_create(events)
+
+
+def _seat_update(bus_id, booked_seats, message):
+    return {"type": "seat_update", "data": {"bus_id": bus_id, "booked_seats": booked_seats, "message": message}}
+
+
+def _ticket_payload(ticket):
+    return {
+        "ticketId": ticket.ticketId,
+        "customerId": ticket.customer_id,
+        "seatNumbers": ticket.seatNumbers,
+        "fromStop": ticket.fromStop,
+        "toStop": ticket.toStop,
+        "ticketPrice": ticket.ticketPrice,
+    }
+
+
+def ticket_booked(ticket, booked_seats, waitlist_hold=False):
+    """
+    ``booked_seats``: the seats now taken on the ticket's journey, for the bus's seat map subscribers.
+    ``waitlist_hold`` marks a ticket booked for a waitlist hold, whose holder gets ``waitlist.held`` instead.
+    """
+    payload = _ticket_payload(ticket)
+    if waitlist_hold:
+        payload["waitlistHold"] = True
+    return OutboxEvent(eventType=TICKET_BOOKED, busId=ticket.bus_id, payload=payload,
+                       channelGroup=f"bus_{ticket.bus_id}",
+                       channelMessage=_seat_update(ticket.bus_id, sorted(booked_seats),
+                                                   f"Seats {ticket.seatNumbers} booked successfully"))
+
+
+def ticket_cancelled(ticket, booked_seats, reason="cancelled"):
+    return OutboxEvent(eventType=TICKET_CANCELLED, busId=ticket.bus_id,
+                       payload={**_ticket_payload(ticket), "reason": reason},
+                       channelGroup=f"bus_{ticket.bus_id}",
+                       channelMessage=_seat_update(ticket.bus_id, sorted(booked_seats),
+                                                   f"Seats {ticket.seatNumbers} released"))
+
+
+def payment_paid(bus_id, ticket_id, customer_id, payment_id, amount):
+    return OutboxEvent(eventType=PAYMENT_PAID, busId=bus_id,
+                       payload={"ticketId": ticket_id, "customerId": customer_id, "paymentId": payment_id,
+                                "amount": amount})
+
+
+def trip_cancelled(bus_id, tickets):
+    """``tickets``: ``(ticketId, customerId)`` of the tickets cancelled with the trip."""
+    return OutboxEvent(eventType=TRIP_CANCELLED, busId=bus_id,
+                       payload={"tickets": [{"ticketId": ticket_id, "customerId": customer_id}
+                                            for ticket_id, customer_id in tickets]},
+                       channelGroup=f"bus_{bus_id}", channelMessage=_seat_update(bus_id, [], "Trip cancelled"))
+
+
+def waitlist_update(event_type, entry, message):
+    ticket = entry.ticket
+    data = {
+        "waitlist_id": entry.id,
+        "status": entry.status,
+        "bus_id": entry.bus_id,
+        "from_stop": entry.fromStop,
+        "to_stop": entry.toStop,
+        "ticket_id": ticket.ticketId if ticket else None,
+        "seat_numbers": ticket.seatNumbers if ticket else [],
+        "price": ticket.ticketPrice if ticket else None,
+        "hold_expires_at": entry.holdExpiresAt.isoformat() if entry.holdExpiresAt else None,
+        "message": message,
+    }
+    return OutboxEvent(eventType=event_type, busId=entry.bus_id, payload={**data, "customerId": entry.customer_id},
+                       channelGroup=f"customer_{entry.customer_id}",
+                       channelMessage={"type": "waitlist_update", "data": data})
+
+
+def event_document(event):
+    """What file-like sinks receive for an event."""
+    return {
+        "eventId": event.id,
+        "eventType": event.eventType,
+        "busId": event.busId,
+        "createdAt": event.createdAt.isoformat(),
+        "payload": event.payload,
+    }
+
+
+class ChannelLayerSink:
+    """Sends each event's channel message to its group, e.g. the websocket seat maps."""
+
+    def __init__(self, options):
+        self.channel_layer = get_channel_layer()
+
+    def send(self, event):
+        if event.channelGroup and event.channelMessage:
+            async_to_sync(self.channel_layer.group_send)(event.channelGroup, event.channelMessage)
+
+    def flush(self):
+        pass
+
+
+class FileSink:
+    """Appends events as JSON lines to ``OUTBOX["FILE_PATH"]``; a stand-in for a broker or socket."""
+
+    def __init__(self, options):
+        self.path = options["FILE_PATH"]
+        self.renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+        self.file = None
+
+    def send(self, event):
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        self.file.write(self.renderer.render(event_document(event)) + b"\n")
+
+    def flush(self):
+        # Durable before the events are marked published.
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+
+class Relay:
+    def __init__(self, sinks=None, batch_size=None, shard=0, shards=1):
+        options = outbox_settings()
+        self.sinks = sinks if sinks is not None else [import_string(path)(options) for path in options["SINKS"]]
+        self.batch_size = batch_size or options["BATCH_SIZE"]
+        self.max_attempts = options["MAX_ATTEMPTS"]
+        self.shard = shard
+        self.shards = shards
+
+    def pending(self):
+        events = OutboxEvent.objects.filter(publishedAt__isnull=True, attempts__lt=self.max_attempts)
+        if self.shards > 1:
+            events = events.alias(shard=Mod("busId", self.shards)).filter(shard=self.shard)
+        return events
+
+    def run_once(self):
+        """Deliver one batch; returns the number of events published."""
+        with transaction.atomic():
+            batch = list(self.pending().select_for_update(skip_locked=True).order_by("id")[:self.batch_size])
+            if not batch:
+                return 0
+
+            # A bus's events after one held by another relay must wait for it.
+            claimed = {event.id for event in batch}
+            held_back = {}
+            for bus_id, event_id in (self.pending().filter(busId__in={event.busId for event in batch},
+                                                           id__lte=batch[-1].id)
+                                     .order_by("id").values_list("busId", "id")):
+                if event_id not in claimed:
+                    held_back.setdefault(bus_id, event_id)
+
+            published, failed = [], {}
+            for event in batch:
+                if event.busId in failed or event.id > held_back.get(event.busId, event.id):
+                    continue
+                try:
+                    for sink in self.sinks:
+                        sink.send(event)
+                except Exception as e:
+                    logger.exception("Outbox event %s could not be delivered", event.id)
+                    failed[event.busId] = (event, repr(e))
+                    continue
+                published.append(event.id)
+            for sink in self.sinks:
+                sink.flush()
+
+            OutboxEvent.objects.filter(id__in=published).update(publishedAt=timezone.now())
+            for event, error in failed.values():
+                OutboxEvent.objects.filter(id=event.id).update(attempts=F("attempts") + 1, lastError=error)
+                if event.attempts + 1 >= self.max_attempts:
+                    logger.error("Outbox event %s is parked after %s failed attempts", event.id, event.attempts + 1)
+        return len(published)
+
+
+def prune(before):
+    """Delete events published before ``before``; returns how many."""
+    return OutboxEvent.objects.filter(publishedAt__lt=before).delete()[0]
@@ -0,0 +1,119 @@
+"""
+Keyset pagination and JSON-lines streaming for the list endpoints.
+
+``KeysetPagination`` is the default paginator: pages are ``WHERE pk > cursor
+ORDER BY pk LIMIT n`` range scans, so the last page costs the same as the
+first and rows inserted meanwhile never shift a page. Lists come as
+``{next, previous, results}`` pages; clients that still need a bare list ask
+for ``pageSize=all`` and get one only while it holds at most
+``max_unpaged_size`` rows.
+
+``JSONLinesListMixin`` lets staff read a whole table with ``?stream=jsonl``,
+one JSON document per line, from a server-side cursor so memory stays flat at
+any table size. The lines come from an async generator, because under ASGI
+Django buffers a synchronous streaming iterator whole before sending it.
+"""
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class KeysetPagination(CursorPagination):
+    ordering = "pk"
+    page_size_query_param = "pageSize"
+    max_page_size = 500
+    unpaged_value = "all"
+    max_unpaged_size = 1000
+    paginated = True
+
+    def unpaged(self, request):
+        return request.query_params.get(self.page_size_query_param) == self.unpaged_value
+
+    def capped(self, rows):
+        if len(rows) > self.max_unpaged_size:
+            raise ValidationError(f"More than {self.max_unpaged_size} results; page through them with "
+                                  f"{self.page_size_query_param} and {self.cursor_query_param}.")
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """A page of ``queryset``, or all of it in ``pk`` order for clients that asked for ``pageSize=all``."""
+        self.paginated = not self.unpaged(request)
+        if not self.paginated:
+            return self.capped(list(queryset.order_by(self.ordering)[:self.max_unpaged_size + 1]))
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if not self.paginated:
+            return Response(data)
+        return super().get_paginated_response(data)
+
+    def paginate_rows(self, request, sources, key):
+        """
+        One forward-only page of rows merged from ``(queryset, rows)`` sources in ascending ``key``,
+        or all of them for clients that asked for ``pageSize=all``.
+
+        The ``key`` values must be unique across all sources. ``rows`` turns a sliced queryset
+        into dicts that contain ``key``.
+        """
+        self.paginated = not self.unpaged(request)
+        if not self.paginated:
+            limit = self.max_unpaged_size + 1
+            merged = [row for queryset, rows in sources for row in rows(queryset.order_by(key)[:limit])]
+            return sorted(self.capped(merged), key=lambda row: row[key])
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        merged = []
+        for queryset, rows in sources:
+            if cursor is not None:
+                queryset = queryset.filter(**{f"{key}__gt": cursor.position})
+            merged.extend(rows(queryset.order_by(key)[:self.page_size + 1]))
+        merged.sort(key=lambda row: row[key])
+
+        self.has_next = len(merged) > self.page_size
+        page = merged[:self.page_size]
+        self.next_position = page[-1][key] if self.has_next else None
+        return page
+
+    def get_rows_response(self, rows):
+        if not self.paginated:
+            return Response(rows)
+        next_link = None
+        if self.next_position is not None:
+            next_link = self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+        return Response({"next": next_link, "previous": None, "results": rows})
+
+
+class JSONLinesListMixin:
+    stream_chunk_size = 2000
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get("stream") != "jsonl":
+            return super().list(request, *args, **kwargs)
+        if not request.user.is_staff:
+            raise PermissionDenied("Streaming is limited to staff users.")
+        queryset = self.filter_queryset(self.get_queryset()).order_by("pk")
+        return StreamingHttpResponse(self.json_lines(queryset), content_type="application/x-ndjson")
+
+    async def json_lines(self, queryset):
+        renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+        # Serializers may touch the database, so chunks are rendered in the sync thread.
+        render_chunk = sync_to_async(self._render_chunk)
+        chunk = []
+        async for instance in queryset.aiterator(chunk_size=self.stream_chunk_size):
+            chunk.append(instance)
+            if len(chunk) == self.stream_chunk_size:
+                yield await render_chunk(renderer, chunk)
+                chunk = []
+        if chunk:
+            yield await render_chunk(renderer, chunk)
+
+    def _render_chunk(self, renderer, chunk):
+        lines = [renderer.render(row) for row in self.get_serializer(chunk, many=True).data]
+        return b"\n".join(lines) + b"\n"
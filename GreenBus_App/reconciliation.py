@@ -0,0 +1,162 @@
+"""
+Seat inventory reconciliation.
+
+Tickets are the truth, and the seat arrays are denormalized copies of them:
+- ``BusModel.bookedSeats`` holds every seat a ticket holds. ``availableSeats``
+  holds the other seats that are not blocked.
+- ``RouteModel.bookedSeats`` of a stop holds the seats taken on the hop that
+  leaves it. The last stop holds none.
+
+``check`` recomputes the copies for a chunk of buses as per-hop seat bitmasks.
+It runs in one REPEATABLE READ, READ ONLY transaction, so copies and tickets
+come from the same snapshot while bookings go on. It also reports ticket
+problems that no rewrite of the copies fixes: stops off the route, seats
+outside the bus, and two tickets on one seat of one hop.
+
+``repair`` locks the drifting buses, re-resolves tickets with unresolved stop
+orders, recomputes the copies under the lock and writes them in bulk. It takes
+``REPAIR_BATCH_SIZE`` buses at a time.
+
+``manage.py reconcile_seats`` runs chunks in a process pool.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from GreenBus_App import availability
+from GreenBus_App.inventory import mask_to_seats, seat_mask
+from GreenBus_App.models import BusModel, RouteModel, TicketModel
+
+BUS_BOOKED = "bus_booked_seats"
+BUS_AVAILABLE = "bus_available_seats"
+ROUTE_BOOKED = "route_booked_seats"
+UNRESOLVED_STOPS = "unresolved_stops"
+INVALID_SEATS = "invalid_seats"
+DOUBLE_BOOKED = "double_booked"
+
+REPAIRABLE = {BUS_BOOKED, BUS_AVAILABLE, ROUTE_BOOKED, UNRESOLVED_STOPS}
+REPAIR_BATCH_SIZE = 50  # buses locked at once, so bookings on them wait a fraction of a second at most
+
+
+def _load(bus_ids, lock=False):
+    buses = BusModel.objects.filter(id__in=bus_ids).order_by("id")
+    if lock:
+        buses = buses.select_for_update()
+    buses = list(buses.only("id", "totalSeats", "blockedSeats", "bookedSeats", "availableSeats", "seatVersion"))
+    routes = defaultdict(list)
+    for route in (RouteModel.objects.filter(bus_id__in=bus_ids).order_by("bus_id", "stopOrder")
+                  .only("id", "bus_id", "stopOrder", "bookedSeats")):
+        routes[route.bus_id].append(route)
+    tickets = defaultdict(list)
+    for bus_id, *ticket in (TicketModel.objects.filter(bus_id__in=bus_ids).order_by("ticketId")
+                            .values_list("bus_id", "ticketId", "fromStopOrder", "toStopOrder", "seatNumbers")):
+        tickets[bus_id].append(ticket)
+    return buses, routes, tickets
+
+
+def _expected(bus, route_stops, tickets):
+    """``(problems, bookedSeats, availableSeats, bookedSeats per stop)`` as the tickets say they should be."""
+    all_seats = (1 << bus.totalSeats) - 1
+    positions = {stop.stopOrder: index for index, stop in enumerate(route_stops)}
+    segments = [0] * len(route_stops)
+    booked, outside, problems = 0, set(), []
+    for ticket_id, from_order, to_order, seat_numbers in tickets:
+        invalid = sorted({seat for seat in seat_numbers if not 1 <= seat <= bus.totalSeats})
+        if invalid:
+            outside.update(invalid)
+            problems.append({"busId": bus.id, "kind": INVALID_SEATS, "ticketId": ticket_id, "seats": invalid})
+        mask = seat_mask(seat_numbers) & all_seats
+        booked |= mask
+
+        start, end = positions.get(from_order), positions.get(to_order)
+        if start is None or end is None or start >= end:
+            problems.append({"busId": bus.id, "kind": UNRESOLVED_STOPS, "ticketId": ticket_id,
+                             "fromStopOrder": from_order, "toStopOrder": to_order})
+            continue
+        clash = 0
+        for index in range(start, end):
+            clash |= segments[index] & mask
+            segments[index] |= mask
+        if clash:
+            problems.append({"busId": bus.id, "kind": DOUBLE_BOOKED, "ticketId": ticket_id,
+                             "seats": mask_to_seats(clash)})
+
+    # update_seat_status keeps seats outside the bus in bookedSeats too.
+    booked_seats = sorted({*mask_to_seats(booked), *outside})
+    available_seats = mask_to_seats(all_seats & ~(booked | seat_mask(bus.blockedSeats)))
+    return problems, booked_seats, available_seats, [mask_to_seats(segment) for segment in segments]
+
+
+def _drift(bus, route_stops, booked_seats, available_seats, stop_seats):
+    problems = []
+    if sorted(bus.bookedSeats) != booked_seats:
+        problems.append({"busId": bus.id, "kind": BUS_BOOKED, "expected": booked_seats,
+                         "found": sorted(bus.bookedSeats)})
+    if sorted(bus.availableSeats) != available_seats:
+        problems.append({"busId": bus.id, "kind": BUS_AVAILABLE, "expected": available_seats,
+                         "found": sorted(bus.availableSeats)})
+    for stop, expected in zip(route_stops, stop_seats):
+        if sorted(stop.bookedSeats) != expected:
+            problems.append({"busId": bus.id, "kind": ROUTE_BOOKED, "stopOrder": stop.stopOrder,
+                             "expected": expected, "found": sorted(stop.bookedSeats)})
+    return problems
+
+
+def check(bus_ids):
+    """Every discrepancy on ``bus_ids``, read from one snapshot without taking locks."""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        buses, routes, tickets = _load(bus_ids)
+        problems = []
+        for bus in buses:
+            ticket_problems, *expected = _expected(bus, routes[bus.id], tickets[bus.id])
+            problems.extend(ticket_problems)
+            problems.extend(_drift(bus, routes[bus.id], *expected))
+    return problems
+
+
+def repair(bus_ids):
+    """Rewrite the seat arrays of ``bus_ids`` under their locks; returns ``(buses changed, problems left)``."""
+    with transaction.atomic():
+        bus_ids = list(BusModel.objects.select_for_update().filter(id__in=bus_ids).order_by("id")
+                       .values_list("id", flat=True))
+        TicketModel.objects.filter(Q(fromStopOrder__isnull=True) | Q(toStopOrder__isnull=True), bus_id__in=bus_ids) \
+            .update(**TicketModel.stop_resolution())
+        buses, routes, tickets = _load(bus_ids)
+
+        changed_buses, changed_routes, left = [], [], []
+        for bus in buses:
+            ticket_problems, booked_seats, available_seats, stop_seats = _expected(bus, routes[bus.id], tickets[bus.id])
+            left.extend(ticket_problems)
+            drift = _drift(bus, routes[bus.id], booked_seats, available_seats, stop_seats)
+            if not drift:
+                continue
+            bus.bookedSeats, bus.availableSeats = booked_seats, available_seats
+            bus.seatVersion = F("seatVersion") + 1  # route edits bump it without the bus lock
+            changed_buses.append(bus)
+            for stop, expected in zip(routes[bus.id], stop_seats):
+                if sorted(stop.bookedSeats) != expected:
+                    stop.bookedSeats = expected
+                    changed_routes.append(stop)
+
+        BusModel.objects.bulk_update(changed_buses, ["bookedSeats", "availableSeats", "seatVersion"])
+        RouteModel.objects.bulk_update(changed_routes, ["bookedSeats"])
+        availability.refresh([bus.id for bus in changed_buses])
+    return len(changed_buses), left
+
+
+def reconcile_chunk(bus_ids, fix=False):
+    """Check a chunk and, with ``fix``, repair its drifting buses; the unit of work of ``reconcile_seats``."""
+    problems = check(bus_ids)
+    result = {"checked": len(bus_ids), "problems": problems, "repaired": 0, "unrepaired": []}
+    if fix:
+        drifting = sorted({problem["busId"] for problem in problems if problem["kind"] in REPAIRABLE})
+        for start in range(0, len(drifting), REPAIR_BATCH_SIZE):
+            repaired, left = repair(drifting[start:start + REPAIR_BATCH_SIZE])
+            result["repaired"] += repaired
+            result["unrepaired"] += left
+        result["unrepaired"] += [problem for problem in problems
+                                 if problem["kind"] not in REPAIRABLE and problem["busId"] not in drifting]
+    return result
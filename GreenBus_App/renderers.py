@@ -0,0 +1,36 @@
+"""
+orjson-backed JSON renderer and parser for DRF.
+
+``settings.py`` enables them in ``REST_FRAMEWORK`` when orjson is installed.
+Output matches ``rest_framework.renderers.JSONRenderer``: datetimes, dates and
+times are passed through to DRF's own encoder (which shortens microseconds and
+writes UTC as ``Z``), as is anything orjson cannot encode natively (Decimal,
+lazy strings, querysets). Indented output always uses two spaces.
+"""
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_fallback = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_fallback.default, option=option)
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
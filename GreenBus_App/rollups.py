@@ -0,0 +1,239 @@
+"""
+Occupancy and revenue rollups per trip and per hop.
+
+``BusDayRollup`` and ``SegmentDayRollup`` rows are adjusted with ``F()``
+deltas by the booking, payment and cancellation flows, inside their
+transactions, so dashboards aggregate a few small rows instead of scanning
+tickets and payments. ``rebuild`` recomputes rows from live and archived
+tickets: run it once to backfill and after edits made outside those flows
+(admin change forms, the model API). Cancelled tickets are deleted, so it
+keeps the cancellation counters it finds.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from GreenBus_App.models import (
+    ArchivedBusModel, ArchivedTicketModel, BusDayRollup, BusModel, PaymentModel, RouteModel, SegmentDayRollup,
+    TicketModel,
+)
+
+GROUPINGS = {
+    "date": ("date",),
+    "company": ("busCompany",),
+    "bus": ("busId", "busNo", "date", "busCompany"),
+    "segment": ("date", "busCompany", "fromStop", "toStop"),
+}
+
+
+def ensure_bus(bus, route_stops):
+    """Create zeroed rows for a trip that has none yet; ``route_stops`` in stop order."""
+    if BusDayRollup.objects.filter(busId=bus.id).exists():
+        return
+    BusDayRollup.objects.bulk_create([
+        BusDayRollup(busId=bus.id, busNo=bus.busNo, busCompany_id=bus.busCompany_id, date=bus.date,
+                     totalSeats=bus.totalSeats, segmentCount=max(len(route_stops) - 1, 0)),
+    ], ignore_conflicts=True)
+    SegmentDayRollup.objects.bulk_create([
+        SegmentDayRollup(busId=bus.id, segment=index, busCompany_id=bus.busCompany_id, date=bus.date,
+                         fromStop=stop.stopName, toStop=route_stops[index + 1].stopName, totalSeats=bus.totalSeats)
+        for index, stop in enumerate(route_stops[:-1])
+    ], ignore_conflicts=True)
+
+
+def record_bookings(bus, route_stops, tickets):
+    ensure_bus(bus, route_stops)
+    positions = {stop.stopOrder: index for index, stop in enumerate(route_stops)}
+    _apply(bus.id, tickets, positions, sign=1)
+
+
+def record_payment(ticket):
+    BusDayRollup.objects.filter(busId=ticket.bus_id).update(paidRevenue=F("paidRevenue") + ticket.ticketPrice)
+
+
+def record_payments(tickets):
+    """``record_payment`` for a queryset of newly paid tickets, in two queries."""
+    revenue = dict(tickets.order_by().values("bus_id").annotate(total=Sum("ticketPrice")).values_list("bus_id", "total"))
+    if revenue:
+        delta = Case(*(When(busId=bus_id, then=Value(total)) for bus_id, total in revenue.items()), default=Value(0))
+        BusDayRollup.objects.filter(busId__in=list(revenue)).update(paidRevenue=F("paidRevenue") + delta)
+
+
+def record_trip_cancellations(bus_ids):
+    """Move everything sold on these trips into the cancellation counters."""
+    BusDayRollup.objects.filter(busId__in=bus_ids).update(
+        cancellations=F("cancellations") + F("ticketsSold"), cancelledSeats=F("cancelledSeats") + F("seatsSold"),
+        ticketsSold=0, seatsSold=0, seatSegments=0, bookedRevenue=0, paidRevenue=0,
+    )
+    SegmentDayRollup.objects.filter(busId__in=bus_ids).update(seatsSold=0)
+
+
+def record_cancellation(ticket, was_paid):
+    orders = RouteModel.objects.filter(bus_id=ticket.bus_id).order_by("stopOrder").values_list("stopOrder", flat=True)
+    positions = {order: index for index, order in enumerate(orders)}
+    _apply(ticket.bus_id, [ticket], positions, sign=-1, was_paid=was_paid, cancelled=True)
+
+
+def _apply(bus_id, tickets, positions, sign, was_paid=False, cancelled=False):
+    seats = seat_segments = revenue = 0
+    seats_by_segment = defaultdict(int)
+    for ticket in tickets:
+        count = len(ticket.seatNumbers)
+        seats += count
+        revenue += ticket.ticketPrice
+        start, end = positions.get(ticket.fromStopOrder), positions.get(ticket.toStopOrder)
+        if start is not None and end is not None:
+            seat_segments += count * (end - start)
+            for segment in range(start, end):
+                seats_by_segment[segment] += count
+
+    updates = {
+        "ticketsSold": F("ticketsSold") + sign * len(tickets),
+        "seatsSold": F("seatsSold") + sign * seats,
+        "seatSegments": F("seatSegments") + sign * seat_segments,
+        "bookedRevenue": F("bookedRevenue") + sign * revenue,
+    }
+    if was_paid:
+        updates["paidRevenue"] = F("paidRevenue") + sign * revenue
+    if cancelled:
+        updates["cancellations"] = F("cancellations") + len(tickets)
+        updates["cancelledSeats"] = F("cancelledSeats") + seats
+    BusDayRollup.objects.filter(busId=bus_id).update(**updates)
+
+    if seats_by_segment:
+        delta = Case(*(When(segment=segment, then=Value(sign * count)) for segment, count in seats_by_segment.items()),
+                     default=Value(0))
+        SegmentDayRollup.objects.filter(busId=bus_id, segment__in=list(seats_by_segment)) \
+            .update(seatsSold=F("seatsSold") + delta)
+
+
+def rebuild(date_from=None, date_to=None, batch_size=500):
+    """Recompute the rows of every live and archived trip dated in the range; returns the number of trips."""
+    rebuilt = 0
+    for model, rebuild_batch in ((BusModel, _rebuild_live), (ArchivedBusModel, _rebuild_archived)):
+        buses = model.objects.order_by("id")
+        if date_from:
+            buses = buses.filter(date__gte=date_from)
+        if date_to:
+            buses = buses.filter(date__lte=date_to)
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                batch = list(buses.filter(id__gt=last_id)[:batch_size])
+                if not batch:
+                    break
+                rebuild_batch(batch)
+            last_id = batch[-1].id
+            rebuilt += len(batch)
+    return rebuilt
+
+
+def _rebuild_live(buses):
+    # Lock the trips so bookings on them wait for their rows to be rewritten.
+    bus_ids = [bus.id for bus in BusModel.objects.select_for_update().filter(id__in=[bus.id for bus in buses])]
+    routes = defaultdict(list)
+    for bus_id, stop_name, stop_order in (RouteModel.objects.filter(bus_id__in=bus_ids)
+                                          .order_by("bus_id", "stopOrder")
+                                          .values_list("bus_id", "stopName", "stopOrder")):
+        routes[bus_id].append((stop_name, stop_order))
+
+    latest_status = PaymentModel.objects.filter(ticket=OuterRef("ticketId")).order_by("-id").values("paymentStatus")[:1]
+    tickets = defaultdict(list)
+    for bus_id, seats, from_order, to_order, price, payment_status in (
+            TicketModel.objects.filter(bus_id__in=bus_ids)
+            .annotate(latest_payment=Coalesce(Subquery(latest_status), Value("Pending")))
+            .values_list("bus_id", "seatNumbers", "fromStopOrder", "toStopOrder", "ticketPrice", "latest_payment")):
+        tickets[bus_id].append((len(seats), from_order, to_order, price, payment_status == "Paid"))
+
+    _write(buses, {bus.id: [name for name, _ in routes[bus.id]] for bus in buses},
+           {bus.id: {order: index for index, (_, order) in enumerate(routes[bus.id])} for bus in buses},
+           {bus.id: bus.id for bus in buses}, tickets)
+
+
+def _rebuild_archived(buses):
+    tickets = defaultdict(list)
+    for bus_pk, seats, from_stop, to_stop, price, payment_status in (
+            ArchivedTicketModel.objects.filter(bus__in=buses)
+            .values_list("bus_id", "seatNumbers", "fromStop", "toStop", "ticketPrice", "paymentStatus")):
+        tickets[bus_pk].append((len(seats), from_stop, to_stop, price, payment_status == "Paid"))
+
+    positions = {}
+    for bus in buses:
+        positions[bus.id] = {}
+        for index, name in enumerate(bus.stops):
+            positions[bus.id].setdefault(name, index)
+    _write(buses, {bus.id: bus.stops for bus in buses}, positions, {bus.id: bus.busId for bus in buses}, tickets)
+
+
+def _write(buses, stops, positions, bus_ids, tickets):
+    """Replace the rows of ``buses``; tickets are ``(seats, from, to, price, paid)`` keyed like ``positions``."""
+    cancellations = {
+        row["busId"]: row for row in BusDayRollup.objects.filter(busId__in=bus_ids.values())
+        .values("busId", "cancellations", "cancelledSeats")
+    }
+    bus_rows, segment_rows = [], []
+    for bus in buses:
+        bus_id = bus_ids[bus.id]
+        trip_stops, trip_positions = stops[bus.id], positions[bus.id]
+        seats_by_segment = [0] * max(len(trip_stops) - 1, 0)
+        row = BusDayRollup(busId=bus_id, busNo=bus.busNo, busCompany_id=bus.busCompany_id, date=bus.date,
+                           totalSeats=bus.totalSeats, segmentCount=len(seats_by_segment),
+                           **{key: value for key, value in cancellations.get(bus_id, {}).items() if key != "busId"})
+        for seats, from_key, to_key, price, paid in tickets[bus.id]:
+            row.ticketsSold += 1
+            row.seatsSold += seats
+            row.bookedRevenue += price
+            row.paidRevenue += price if paid else 0
+            start, end = trip_positions.get(from_key), trip_positions.get(to_key)
+            if start is not None and end is not None:
+                row.seatSegments += seats * (end - start)
+                for segment in range(start, end):
+                    seats_by_segment[segment] += seats
+        bus_rows.append(row)
+        segment_rows.extend(
+            SegmentDayRollup(busId=bus_id, segment=index, busCompany_id=bus.busCompany_id, date=bus.date,
+                             fromStop=trip_stops[index], toStop=trip_stops[index + 1], totalSeats=bus.totalSeats,
+                             seatsSold=sold)
+            for index, sold in enumerate(seats_by_segment)
+        )
+
+    BusDayRollup.objects.bulk_create(
+        bus_rows, update_conflicts=True, unique_fields=["busId"],
+        update_fields=["busNo", "busCompany", "date", "totalSeats", "segmentCount", "ticketsSold", "seatsSold",
+                       "seatSegments", "bookedRevenue", "paidRevenue"],
+    )
+    SegmentDayRollup.objects.filter(busId__in=bus_ids.values()).delete()
+    SegmentDayRollup.objects.bulk_create(segment_rows)
+
+
+def summary(group_by="date", date_from=None, date_to=None, company_id=None):
+    """Aggregated rollup rows for the analytics API, with ``loadFactor`` = sold / offered seat-hops."""
+    model = SegmentDayRollup if group_by == "segment" else BusDayRollup
+    rows = model.objects.all()
+    if date_from:
+        rows = rows.filter(date__gte=date_from)
+    if date_to:
+        rows = rows.filter(date__lte=date_to)
+    if company_id:
+        rows = rows.filter(busCompany_id=company_id)
+
+    if model is SegmentDayRollup:
+        totals = {"trips": Count("id"), "seatsSold": Sum("seatsSold"), "capacity": Sum("totalSeats")}
+        sold = "seatsSold"
+    else:
+        totals = {
+            "trips": Count("id"), "ticketsSold": Sum("ticketsSold"), "seatsSold": Sum("seatsSold"),
+            "seatSegments": Sum("seatSegments"), "bookedRevenue": Sum("bookedRevenue"),
+            "paidRevenue": Sum("paidRevenue"), "cancellations": Sum("cancellations"),
+            "cancelledSeats": Sum("cancelledSeats"), "capacity": Sum(F("totalSeats") * F("segmentCount")),
+        }
+        sold = "seatSegments"
+
+    fields = GROUPINGS[group_by]
+    result = []
+    for row in rows.values(*fields).annotate(**totals).order_by(*fields):
+        row["loadFactor"] = round(row[sold] / row["capacity"], 4) if row["capacity"] else None
+        result.append(row)
+    return result
@@ -1,6 +1,7 @@
 from django.urls import re_path
-from GreenBus_App.consumers import BookingConsumer, SeatUpdateConsumer
+from GreenBus_App.consumers import BookingConsumer, CustomerNotificationConsumer, SeatUpdateConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/seat-updates/(?P<bus_id>\d+)/$', SeatUpdateConsumer.as_asgi()),
+    re_path(r'ws/notifications/$', CustomerNotificationConsumer.as_asgi()),
 ]
@@ -0,0 +1,54 @@
+"""
+Compact seat maps and conditional responses for the seat availability endpoints.
+
+Clients opt into the compact form with ``?seatFormat=bitset`` or an
+``Accept: application/json; seats=bitset`` header. Seat lists are then sent
+as base64 of a little-endian bitset (bit ``n - 1`` set for seat ``n``, padded
+to ``totalSeats``) instead of integer arrays.
+
+ETags are built from the ids and ``seatVersion`` of the buses in a response
+plus the request parameters, so a matching ``If-None-Match`` is answered with
+304 before any seats are computed or serialized.
+"""
+import base64
+import hashlib
+
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+from GreenBus_App.inventory import seat_mask
+
+BITSET = "bitset"
+
+
+def encode_seats(seats, total_seats):
+    """Base64 bitset of ``seats`` sized for ``total_seats``."""
+    return base64.b64encode(seat_mask(seats).to_bytes((total_seats + 7) // 8, "little")).decode("ascii")
+
+
+def wants_bitset(request):
+    if request.query_params.get("seatFormat") == BITSET:
+        return True
+    media_type = getattr(request, "accepted_media_type", "") or ""
+    return any(param.strip() == f"seats={BITSET}" for param in media_type.split(";")[1:])
+
+
+def seat_etag(*parts):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def not_modified(request, etag):
+    """A 304 response when the client already holds ``etag``, else ``None``."""
+    client_etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    if etag in client_etags or "*" in client_etags:
+        return with_etag(Response(status=304), etag)
+    return None
+
+
+def with_etag(response, etag):
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"
+    patch_vary_headers(response, ["Accept"])
+    return response
@@ -1,10 +1,13 @@
 from datetime import date
 
 from django.contrib.auth import get_user_model
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 from rest_framework.generics import get_object_or_404
 
-from GreenBus_App.models import BusModel, UserModel, TicketModel, PaymentModel, CompanyModel, RouteModel
+from GreenBus_App.models import BusModel, UserModel, TicketModel, PaymentModel, CompanyModel, RouteModel, \
+    ArchivedTicketModel, WaitlistModel
 
 
 class BusSerializer(serializers.ModelSerializer):
@@ -12,6 +15,65 @@ class BusSerializer(serializers.ModelSerializer):
         model = BusModel
         exclude = ['bookedSeats','blockedSeats']
 
+
+# Plain-dict equivalents of BusSerializer, TicketSerializer and ArchivedTicketSerializer for the large
+# customer lists. They produce the same keys and values without per-field to_representation calls
+# or per-row queries; SerializerRowTests keeps them equal. Dates still go through DRF's DateField
+# so they follow REST_FRAMEWORK["DATE_FORMAT"].
+
+_date_field = serializers.DateField()
+
+
+def bus_rows(buses):
+    """``BusSerializer(buses, many=True).data`` for already loaded buses."""
+    return [
+        {
+            "id": bus.id,
+            "busNo": bus.busNo,
+            "totalSeats": bus.totalSeats,
+            "availableSeats": bus.availableSeats,
+            "fromWhere": bus.fromWhere,
+            "toWhere": bus.toWhere,
+            "perSeatPrice": bus.perSeatPrice,
+            "boardingTime": bus.boardingTime,
+            "date": _date_field.to_representation(bus.date),
+            "seatVersion": bus.seatVersion,
+            "busCompany": bus.busCompany_id,
+        }
+        for bus in buses
+    ]
+
+
+TICKET_ROW_FIELDS = ("ticketId", "paymentStatus", "seatNumbers", "fromStop", "toStop", "fromStopOrder", "toStopOrder",
+                     "ticketPrice", "bookingDate", "customer", "bus", "fromStopRef", "toStopRef")
+ARCHIVED_TICKET_ROW_FIELDS = ("ticketId", "bus", "seatNumbers", "fromStop", "toStop", "fromStopOrder", "toStopOrder",
+                              "ticketPrice", "bookingDate", "paymentStatus", "customer")
+
+
+def with_payment_status(tickets):
+    """``tickets`` annotated with ``latest_payment``, the status ``TicketSerializer`` reports."""
+    latest_status = PaymentModel.objects.filter(ticket=OuterRef("ticketId")).order_by("-id").values("paymentStatus")[:1]
+    return tickets.annotate(latest_payment=Coalesce(Subquery(latest_status), Value("Pending")))
+
+
+def ticket_rows(tickets):
+    """``TicketSerializer(tickets, many=True).data`` in one query, with the latest payment status joined in."""
+    rows = with_payment_status(tickets).values_list("ticketId", "latest_payment", *TICKET_ROW_FIELDS[2:])
+    return [_row(TICKET_ROW_FIELDS, values) for values in rows]
+
+
+def archived_ticket_rows(tickets):
+    """``ArchivedTicketSerializer(tickets, many=True).data`` in one query."""
+    rows = tickets.values_list("ticketId", "bus__busId", *ARCHIVED_TICKET_ROW_FIELDS[2:])
+    return [_row(ARCHIVED_TICKET_ROW_FIELDS, values) for values in rows]
+
+
+def _row(fields, values):
+    row = dict(zip(fields, values))
+    row["bookingDate"] = _date_field.to_representation(row["bookingDate"])
+    return row
+
+
 class CompanySerializer(serializers.ModelSerializer):
     noOfBuses = serializers.SerializerMethodField()
 
@@ -42,6 +104,8 @@ class TicketSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_paymentStatus(self, obj):
+        if hasattr(obj, "latest_payment"):  # querysets from with_payment_status
+            return obj.latest_payment
         # Ensure we filter by the correct ticket reference
         payment = PaymentModel.objects.filter(ticket=obj).order_by('-id').first()
         return payment.paymentStatus if payment and payment.paymentStatus else "Pending"
@@ -53,4 +117,18 @@ class TicketSerializer(serializers.ModelSerializer):
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model=PaymentModel
-        fields='__all__'
\ No newline at end of file
+        fields='__all__'
+
+
+class WaitlistSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WaitlistModel
+        fields = '__all__'
+
+
+class ArchivedTicketSerializer(serializers.ModelSerializer):
+    bus = serializers.IntegerField(source="bus.busId")
+
+    class Meta:
+        model = ArchivedTicketModel
+        fields = '__all__'
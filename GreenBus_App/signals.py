@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from GreenBus_App import availability
+from GreenBus_App.authentication import revoke_user_tokens
+from GreenBus_App.journey_planner import planner
+from GreenBus_App.models import BusModel, RouteModel, TicketModel, UserModel
+from GreenBus_App.stop_index import stop_index
+
+
+def refresh_availability(bus_id):
+    # robust: the edit has committed; a failed refresh is repaired by the next one or rebuild_availability.
+    transaction.on_commit(lambda: availability.refresh([bus_id]), robust=True)
+
+
+@receiver([post_save, post_delete], sender=BusModel)
+def bus_changed(sender, instance, update_fields=None, **kwargs):
+    planner.mark_dirty(instance.id)
+    # Seat syncs save with update_fields; their bookings reach the calendar through the outbox.
+    if kwargs["signal"] is post_save and update_fields is None:
+        refresh_availability(instance.id)
+
+
+@receiver(pre_delete, sender=BusModel)
+def bus_deleting(sender, instance, origin=None, **kwargs):
+    # The trips' availability rows go with them, so their journeys are read before the delete: once for
+    # a queryset delete such as an archive batch, which signals every bus it deletes.
+    if isinstance(origin, QuerySet):
+        if getattr(origin, "_journeys_read", False):
+            return
+        origin._journeys_read = True
+        bus_ids = origin.values("id")
+    else:
+        bus_ids = [instance.id]
+    journeys = availability.journeys(bus_ids)
+    transaction.on_commit(lambda: availability.forget_journeys(journeys), robust=True)
+
+
+@receiver([post_save, post_delete], sender=RouteModel)
+def route_changed(sender, instance, update_fields=None, **kwargs):
+    # The planner carries seat occupancy, so seat syncs make it reload too; stop names do not change with them.
+    planner.mark_dirty(instance.bus_id)
+    if update_fields is None or set(update_fields) - {"bookedSeats"}:
+        stop_index.mark_dirty(instance.bus_id)
+        refresh_availability(instance.bus_id)
+
+
+@receiver([post_save, post_delete], sender=TicketModel)
+def ticket_changed(sender, instance, **kwargs):
+    planner.mark_dirty(instance.bus_id)
+
+
+# User fields signed into the token claims, or deciding whether the user may authenticate at all.
+USER_CLAIM_FIELDS = ("is_active", "is_staff", "is_superuser")
+
+
+@receiver(pre_save, sender=get_user_model())
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    instance._claims_changed = False
+    if instance.pk is None or (update_fields is not None and not set(update_fields) & set(USER_CLAIM_FIELDS)):
+        return
+    stored = sender.objects.filter(pk=instance.pk).values(*USER_CLAIM_FIELDS).first()
+    instance._claims_changed = stored is not None and any(
+        stored[field] != getattr(instance, field) for field in USER_CLAIM_FIELDS)
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(sender, instance, created, **kwargs):
+    if not created and instance._claims_changed:
+        revoke_user_tokens(instance.id)
+
+
+@receiver(post_delete, sender=get_user_model())
+def user_deleted(sender, instance, **kwargs):
+    revoke_user_tokens(instance.id)
+
+
+@receiver(post_save, sender=UserModel)
+@receiver(post_delete, sender=UserModel)
+def profile_changed(sender, instance, created=False, **kwargs):
+    # Tokens carry the profile id and customer flag, so a changed profile invalidates them.
+    if not created and instance.user_id:
+        revoke_user_tokens(instance.user_id)
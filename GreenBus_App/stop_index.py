@@ -0,0 +1,167 @@
+"""
+In-memory autocomplete index over the distinct ``RouteModel.stopName`` values.
+
+Names are kept sorted by their normalised form (and each word suffix of it)
+for prefix lookups and in a trigram index for typo-tolerant matches, ranked by
+the number of buses that serve each stop. Like the journey planner, buses whose
+routes change are re-read on the next lookup and a periodic full rebuild
+covers other workers.
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from GreenBus_App.models import RouteModel
+
+
+def normalize(name):
+    return " ".join(name.casefold().split())
+
+
+def trigrams(key, closed=True):
+    padded = f"  {key} " if closed else f"  {key}"
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def word_suffixes(key):
+    """The key from each word start on, so "anna nagar" is also found by typing "nagar"."""
+    return [key[index:] for index in range(len(key)) if index == 0 or key[index - 1] == " "]
+
+
+def prefix_distance(query, key, limit):
+    """
+    Smallest edit distance (adjacent transpositions count as one edit) between ``query`` and any
+    prefix of ``key``, or ``limit + 1`` once it is exceeded.
+    """
+    before = None
+    previous = list(range(len(key) + 1))
+    for row, char in enumerate(query, start=1):
+        current = [row]
+        for column, key_char in enumerate(key, start=1):
+            cost = min(previous[column] + 1, current[column - 1] + 1, previous[column - 1] + (char != key_char))
+            if before and column > 1 and char == key[column - 2] and query[row - 2] == key_char:
+                cost = min(cost, before[column - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous)
+
+
+class StopIndex:
+    def __init__(self):
+        self._lock = threading.Lock()  # held by lookups and rebuilds
+        self._dirty_lock = threading.Lock()  # held only to touch _dirty, so writers never wait for a rebuild
+        self._bus_stops = {}
+        self._counts = {}
+        self._keys = []
+        self._grams = defaultdict(set)
+        self._dirty = set()
+        self._built_at = None
+
+    def mark_dirty(self, bus_id):
+        with self._dirty_lock:
+            self._dirty.add(bus_id)
+
+    def _take_dirty(self):
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+
+    def _ensure_fresh(self):
+        refresh_seconds = getattr(settings, "STOP_INDEX_REFRESH_SECONDS", 300)
+        if self._built_at is None or time.monotonic() - self._built_at > refresh_seconds:
+            self._rebuild()
+        elif self._dirty:
+            dirty = self._take_dirty()
+            stops = defaultdict(set)
+            for bus_id, stop_name in RouteModel.objects.filter(bus_id__in=dirty).values_list("bus_id", "stopName"):
+                stops[bus_id].add(stop_name)
+            for bus_id in dirty:
+                self._set_bus_stops(bus_id, stops.get(bus_id, set()))
+
+    def _rebuild(self):
+        self._take_dirty()
+        self._bus_stops = {}
+        self._counts = {}
+        self._keys = []
+        self._grams = defaultdict(set)
+        stops = defaultdict(set)
+        for bus_id, stop_name in RouteModel.objects.values_list("bus_id", "stopName").iterator(chunk_size=5000):
+            stops[bus_id].add(stop_name)
+        for bus_id, names in stops.items():
+            self._set_bus_stops(bus_id, names)
+        self._built_at = time.monotonic()
+
+    def _set_bus_stops(self, bus_id, names):
+        old = self._bus_stops.pop(bus_id, set())
+        if names:
+            self._bus_stops[bus_id] = names
+        for name in old - names:
+            self._counts[name] -= 1
+            if not self._counts[name]:
+                self._remove_name(name)
+        for name in names - old:
+            if name not in self._counts:
+                self._add_name(name)
+            self._counts[name] += 1
+
+    def _add_name(self, name):
+        self._counts[name] = 0
+        key = normalize(name)
+        for suffix in word_suffixes(key):
+            bisect.insort(self._keys, (suffix, name))
+        for gram in trigrams(key):
+            self._grams[gram].add((key, name))
+
+    def _remove_name(self, name):
+        del self._counts[name]
+        key = normalize(name)
+        for suffix in word_suffixes(key):
+            del self._keys[bisect.bisect_left(self._keys, (suffix, name))]
+        for gram in trigrams(key):
+            self._grams[gram].discard((key, name))
+
+    def search(self, query, limit=10):
+        """Stops ranked by match quality (prefix, then typo-tolerant) and then by number of buses."""
+        with self._lock:
+            self._ensure_fresh()
+            query = normalize(query)
+            if not query:
+                ranked = sorted(self._counts, key=lambda name: (-self._counts[name], name))
+                return [{"stopName": name, "trips": self._counts[name]} for name in ranked[:limit]]
+
+            matches = {}
+            start = bisect.bisect_left(self._keys, (query,))
+            for key, name in self._keys[start:]:
+                if not key.startswith(query):
+                    break
+                matches[name] = 0
+
+            if len(query) >= 3:
+                max_edits = 1 if len(query) <= 5 else 2
+                query_grams = trigrams(query, closed=False)
+                overlap = defaultdict(int)
+                for gram in query_grams:
+                    for entry in self._grams.get(gram, ()):
+                        overlap[entry] += 1
+                min_overlap = max(len(query_grams) - 4 * max_edits, 1)
+                for (key, name), shared in overlap.items():
+                    if name in matches or shared < min_overlap:
+                        continue
+                    distance = prefix_distance(query, key, max_edits)
+                    if distance <= max_edits:
+                        matches[name] = distance
+
+            ranked = sorted(matches, key=lambda name: (matches[name], -self._counts[name], name))
+            return [{"stopName": name, "trips": self._counts[name]} for name in ranked[:limit]]
+
+
+stop_index = StopIndex()
@@ -1,3 +1,1638 @@
-from django.test import TestCase
+import base64
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from GreenBus import settings as greenbus_settings
+from GreenBus.db_router import ReplicaPool, ReplicaRouter, _pin_key, _read_alias, check_pin_cache
+from GreenBus.warmup import warm_up
+from GreenBus_App import reconciliation
+from GreenBus_App.admin import BusAdmin, EstimatedCountPaginator, OutboxEventAdmin, TicketAdmin, \
+    mark_tickets_paid
+from GreenBus_App.archive import archive_batch, archive_completed_trips
+from GreenBus_App.authentication import GreenBusRefreshToken, revoke_user_tokens
+from GreenBus_App.availability import AvailabilitySink, _day_versions, calendar, journey_rows, refresh
+from GreenBus_App.booking_queue import BookingAdmission, BookingRequest, BusBookingWorker
+from GreenBus_App.exports import EXPORT_COLUMNS
+from GreenBus_App.inventory import SeatInventory, mask_to_seats, seat_mask
+from GreenBus_App.journey_planner import JourneyPlanner
+from GreenBus_App.management.commands.measure_startup import Command as MeasureStartupCommand
+from GreenBus_App.models import ArchivedBusModel, ArchivedTicketModel, BusDayRollup, BusModel, CompanyModel, \
+    JourneyAvailability, NotificationModel, OutboxEvent, PaymentModel, RouteModel, SegmentDayRollup, StopModel, \
+    TicketModel, UserModel, WaitlistModel
+from GreenBus_App.notifications import Dispatcher, FileBackend, PermanentError, notifications_for
+from GreenBus_App.outbox import Relay
+from GreenBus_App.pagination import KeysetPagination
+from GreenBus_App.renderers import ORJSONRenderer
+from GreenBus_App.rollups import GROUPINGS, rebuild
+from GreenBus_App.seat_maps import encode_seats, seat_etag
+from GreenBus_App.serializers import ArchivedTicketSerializer, BusSerializer, TicketSerializer, \
+    archived_ticket_rows, bus_rows, ticket_rows
+from GreenBus_App.stop_index import StopIndex, prefix_distance
+from GreenBus_App.throttling import BucketStore, SeatsIPThrottle, TokenBucketThrottle, buckets
+from GreenBus_App.waitlist import expire_holds
+
+
+class QueryPlanTests(TestCase):
+    """The hot queries in views.py must be answerable from the indexes declared on the models."""
+
+    STOPS = ["Chennai", "Vellore", "Krishnagiri", "Hosur", "Bangalore"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CompanyModel.objects.create(busCompany="KPN")
+        other = CompanyModel.objects.create(busCompany="SRS")
+        cls.day = date(2030, 1, 1)
+        stops = {name: StopModel.objects.create(stopName=name) for name in cls.STOPS}
+        customer = UserModel.objects.create(user=User.objects.create_user("customer"))
+
+        buses = BusModel.objects.bulk_create(
+            BusModel(busNo=number, busCompany=cls.company if number % 2 else other, totalSeats=40,
+                     fromWhere=cls.STOPS[0], toWhere=cls.STOPS[-1], boardingTime="Morning",
+                     date=cls.day + timedelta(days=number % 60))
+            for number in range(1, 601)
+        )
+        RouteModel.objects.bulk_create(
+            RouteModel(bus=bus, stopName=name, stop=stops[name], stopOrder=order)
+            for bus in buses for order, name in enumerate(cls.STOPS)
+        )
+        tickets = TicketModel.objects.bulk_create(
+            TicketModel(customer=customer, bus=bus, seatNumbers=[seat, seat + 1], fromStop=cls.STOPS[0],
+                        toStop=cls.STOPS[2], fromStopOrder=0, toStopOrder=2)
+            for bus in buses for seat in range(1, 9, 2)
+        )
+        # A busy bus whose tickets are mostly on the last segment, beyond the queried one.
+        cls.bus = buses[0]
+        TicketModel.objects.bulk_create(
+            TicketModel(customer=customer, bus=cls.bus, seatNumbers=[seat], fromStop=cls.STOPS[3],
+                        toStop=cls.STOPS[4], fromStopOrder=3, toStopOrder=4)
+            for seat in range(9, 41) for _ in range(10)
+        )
+        PaymentModel.objects.bulk_create(PaymentModel(customer=customer, ticket=ticket) for ticket in tickets)
+        cls.ticket = tickets[0]
+
+        with connection.cursor() as cursor:
+            for model in (BusModel, RouteModel, TicketModel, PaymentModel):
+                cursor.execute(f'ANALYZE "{model._meta.db_table}"')
+
+    def setUp(self):
+        # The seeded tables are small enough that a sequential scan would always win;
+        # disabling it shows which index the planner reaches for when tables are large.
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+        self.addCleanup(self._reset_seqscan)
+
+    def _reset_seqscan(self):
+        with connection.cursor() as cursor:
+            cursor.execute("RESET enable_seqscan")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+        self.assertNotIn("Seq Scan", plan, plan)
+
+    def test_search_buses_by_date_and_company(self):
+        self.assertUsesIndex(BusModel.objects.filter(date=self.day, busCompany=self.company),
+                             "bus_date_company_idx")
+
+    def test_search_buses_by_date(self):
+        self.assertUsesIndex(BusModel.objects.filter(date=self.day), "bus_date_company_idx")
+
+    def test_bus_routes_in_stop_order(self):
+        self.assertUsesIndex(RouteModel.objects.filter(bus_id=self.bus.id).order_by("stopOrder"),
+                             "route_bus_stoporder_uniq")
+
+    def test_bus_routes_by_stop_name(self):
+        self.assertUsesIndex(
+            RouteModel.objects.filter(bus_id=self.bus.id, stopName__in=["Vellore", "Hosur"])
+            .values_list("stopName", "stopOrder"),
+            "route_bus_stopname_idx",
+        )
+
+    def test_tickets_overlapping_segment(self):
+        self.assertUsesIndex(
+            TicketModel.objects.filter(bus=self.bus, fromStopOrder__lt=3, toStopOrder__gt=1)
+            .values_list("seatNumbers", flat=True),
+            "ticket_bus_segment_idx",
+        )
+
+    def test_all_tickets_for_bus(self):
+        self.assertUsesIndex(TicketModel.objects.filter(bus=self.bus).values_list("seatNumbers", flat=True),
+                             "ticket_bus_segment_idx")
+
+    def test_latest_payment_for_ticket(self):
+        self.assertUsesIndex(PaymentModel.objects.filter(ticket=self.ticket).order_by("-id")[:1],
+                             "payment_ticket_latest_idx")
+
+
+class JourneyPlannerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = date.today() + timedelta(days=1)
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.customer = UserModel.objects.create(user=User.objects.create_user("customer"))
+
+        def bus(number, stops, boarding_time="Morning", day=cls.day, seats=4):
+            bus = BusModel.objects.create(busNo=number, busCompany=company, totalSeats=seats, fromWhere=stops[0],
+                                          toWhere=stops[-1], boardingTime=boarding_time, date=day)
+            for order, name in enumerate(stops):
+                RouteModel.objects.create(bus=bus, stopName=name, stopOrder=order)
+            return bus
+
+        cls.direct = bus(1, ["Chennai", "Vellore", "Bangalore"])
+        cls.feeder = bus(2, ["Chennai", "Salem"])
+        cls.connection = bus(3, ["Salem", "Coimbatore"], boarding_time="Night")
+        cls.next_day = bus(4, ["Coimbatore", "Kochi"], day=cls.day + timedelta(days=1))
+
+    def setUp(self):
+        self.planner = JourneyPlanner()
+
+    def test_mark_dirty_does_not_wait_for_a_rebuild(self):
+        with self.planner._lock:
+            writer = threading.Thread(target=self.planner.mark_dirty, args=(self.direct.id,))
+            writer.start()
+            writer.join(5)
+            self.assertFalse(writer.is_alive())
+        self.assertEqual(self.planner._dirty, {self.direct.id})
+
+    def test_direct_journey(self):
+        [journey] = self.planner.plan("Chennai", "Vellore", self.day)
+        self.assertEqual(journey["transfers"], 0)
+        self.assertEqual([leg["busId"] for leg in journey["legs"]], [self.direct.id])
+        self.assertEqual(journey["legs"][0]["availableSeats"], 4)
+
+    def test_transfer_boards_a_later_trip(self):
+        [journey] = self.planner.plan("Chennai", "Coimbatore", self.day)
+        self.assertEqual(journey["transfers"], 1)
+        self.assertEqual([leg["busId"] for leg in journey["legs"]], [self.feeder.id, self.connection.id])
+        self.assertEqual(self.planner.plan("Chennai", "Coimbatore", self.day, max_transfers=0), [])
+
+    def test_connecting_leg_may_leave_after_the_window(self):
+        [journey] = self.planner.plan("Chennai", "Kochi", self.day, max_transfers=2)
+        self.assertEqual([leg["busId"] for leg in journey["legs"]],
+                         [self.feeder.id, self.connection.id, self.next_day.id])
+        with self.settings(JOURNEY_PLANNER_TRANSFER_DAYS=0):
+            self.assertEqual(JourneyPlanner().plan("Chennai", "Kochi", self.day, max_transfers=2), [])
+
+    def test_filters_trips_without_enough_seats(self):
+        TicketModel.objects.create(customer=self.customer, bus=self.direct, seatNumbers=[1, 2, 3],
+                                   fromStop="Vellore", toStop="Bangalore")
+        self.planner.rebuild()
+        [journey] = self.planner.plan("Chennai", "Vellore", self.day, seats=2)
+        self.assertEqual(journey["legs"][0]["availableSeats"], 4)
+        self.assertEqual(self.planner.plan("Chennai", "Bangalore", self.day, seats=2), [])
+        self.assertEqual(len(self.planner.plan("Chennai", "Bangalore", self.day, seats=1)), 1)
+
+    def test_dirty_bus_is_reloaded(self):
+        self.assertEqual(len(self.planner.plan("Chennai", "Bangalore", self.day, seats=4)), 1)
+        TicketModel.objects.create(customer=self.customer, bus=self.direct, seatNumbers=[1],
+                                   fromStop="Chennai", toStop="Vellore")
+        self.planner.mark_dirty(self.direct.id)
+        self.assertEqual(self.planner.plan("Chennai", "Bangalore", self.day, seats=4), [])
+
+    def test_rebuild_forgets_stops_no_longer_served(self):
+        self.planner.rebuild()
+        self.assertIn("Kochi", self.planner._stop_ids)
+        self.next_day.delete()
+        self.planner.rebuild()
+        self.assertNotIn("Kochi", self.planner._stop_ids)
+        self.assertEqual(self.planner._stop_names, sorted(self.planner._stop_ids, key=self.planner._stop_ids.get))
+
+
+class PrefixDistanceTests(SimpleTestCase):
+    def test_exact_prefix_costs_nothing(self):
+        self.assertEqual(prefix_distance("vel", "vellore", 2), 0)
+
+    def test_substitution_insertion_and_deletion(self):
+        self.assertEqual(prefix_distance("vwl", "vellore", 2), 1)
+        self.assertEqual(prefix_distance("velo", "vellore", 2), 1)
+        self.assertEqual(prefix_distance("vellloo", "vellore", 2), 2)
+
+    def test_adjacent_transposition_is_one_edit(self):
+        self.assertEqual(prefix_distance("vlel", "vellore", 2), 1)
+
+    def test_stops_once_over_the_limit(self):
+        self.assertEqual(prefix_distance("xyzw", "vellore", 1), 2)
+
+
+class StopIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        routes = [["Chennai", "Vellore"], ["Chennai", "Velachery"], ["Chennai", "Anna Nagar"], ["Vellore", "Salem"]]
+        cls.buses = []
+        for number, stops in enumerate(routes, start=1):
+            bus = BusModel.objects.create(busNo=number, busCompany=company, totalSeats=4, fromWhere=stops[0],
+                                          toWhere=stops[-1], boardingTime="Morning")
+            for order, name in enumerate(stops):
+                RouteModel.objects.create(bus=bus, stopName=name, stopOrder=order)
+            cls.buses.append(bus)
+
+    def setUp(self):
+        self.index = StopIndex()
+
+    def names(self, query):
+        return [match["stopName"] for match in self.index.search(query)]
+
+    def test_prefix_matches_rank_by_trip_count(self):
+        self.assertEqual(self.index.search("vel"), [{"stopName": "Vellore", "trips": 2},
+                                                   {"stopName": "Velachery", "trips": 1}])
+
+    def test_empty_query_lists_busiest_stops(self):
+        self.assertEqual(self.names(""), ["Chennai", "Vellore", "Anna Nagar", "Salem", "Velachery"])
+
+    def test_matches_later_words_and_ignores_case(self):
+        self.assertEqual(self.names("NAGAR"), ["Anna Nagar"])
+
+    def test_typos_rank_after_prefix_matches(self):
+        self.assertEqual(self.names("vela"), ["Velachery", "Vellore"])
+        self.assertEqual(self.names("chenai"), ["Chennai"])
+        self.assertEqual(self.names("vellre"), ["Vellore"])
+        self.assertEqual(self.names("sa"), ["Salem"])
+        self.assertEqual(self.names("xyz"), [])
+
+    def test_route_changes_apply_on_next_search(self):
+        self.index.rebuild()
+        RouteModel.objects.filter(bus=self.buses[3], stopName="Salem").update(stopName="Salem Junction")
+        self.index.mark_dirty(self.buses[3].id)
+        self.assertEqual(self.names("salem"), ["Salem Junction"])
+        RouteModel.objects.filter(bus=self.buses[2]).delete()
+        self.index.mark_dirty(self.buses[2].id)
+        self.assertEqual(self.names("anna"), [])
+        self.assertEqual(self.index.search("chen"), [{"stopName": "Chennai", "trips": 2}])
+
+    def test_mark_dirty_does_not_wait_for_a_rebuild(self):
+        with self.index._lock:
+            writer = threading.Thread(target=self.index.mark_dirty, args=(self.buses[0].id,))
+            writer.start()
+            writer.join(5)
+            self.assertFalse(writer.is_alive())
+        self.assertEqual(self.index._dirty, {self.buses[0].id})
+
+    def test_seat_syncs_leave_the_index_alone(self):
+        route = RouteModel.objects.filter(bus=self.buses[0]).first()
+        with mock.patch("GreenBus_App.signals.stop_index") as index:
+            route.bookedSeats = [1]
+            route.save(update_fields=["bookedSeats"])
+            index.mark_dirty.assert_not_called()
+            route.save()
+            index.mark_dirty.assert_called_once_with(self.buses[0].id)
+
+
+class ReplicaPoolTests(SimpleTestCase):
+    def pool(self, lags):
+        """A pool over ``lags``' aliases whose lag check reads (or raises) from ``lags``."""
+        pool = ReplicaPool()
+
+        def lag(alias):
+            if isinstance(lags[alias], Exception):
+                raise lags[alias]
+            return lags[alias]
+
+        patcher = mock.patch.object(pool, "_lag", side_effect=lag)
+        self.addCleanup(patcher.stop)
+        pool.checks = patcher.start()
+        return pool
+
+    @override_settings(DATABASE_REPLICAS=["replica_1", "replica_2"], REPLICA_CHECK_SECONDS=0)
+    def test_round_robin_over_healthy_replicas(self):
+        pool = self.pool({"replica_1": 0, "replica_2": None})
+        self.assertEqual([pool.choose() for _ in range(4)], ["replica_1", "replica_2", "replica_1", "replica_2"])
+
+    @override_settings(DATABASE_REPLICAS=["replica_1", "replica_2"], REPLICA_CHECK_SECONDS=0,
+                       REPLICA_MAX_LAG_SECONDS=10)
+    def test_skips_lagging_and_unreachable_replicas(self):
+        lags = {"replica_1": 60, "replica_2": 0}
+        pool = self.pool(lags)
+        self.assertEqual({pool.choose() for _ in range(4)}, {"replica_2"})
+        lags["replica_2"] = OperationalError("connection refused")
+        self.assertIsNone(pool.choose())
+
+    @override_settings(DATABASE_REPLICAS=["replica_1"], REPLICA_CHECK_SECONDS=0, REPLICA_RETRY_SECONDS=30)
+    def test_replica_marked_down_is_retried_later(self):
+        pool = self.pool({"replica_1": 0})
+        pool.mark_down("replica_1")
+        self.assertIsNone(pool.choose())
+        pool.checks.assert_not_called()
+        with mock.patch("GreenBus.db_router.time.monotonic", return_value=time.monotonic() + 31):
+            self.assertEqual(pool.choose(), "replica_1")
+
+    @override_settings(DATABASE_REPLICAS=["replica_1"], REPLICA_CHECK_SECONDS=60)
+    def test_checks_each_replica_once_per_interval(self):
+        pool = self.pool({"replica_1": 0})
+        for _ in range(5):
+            self.assertEqual(pool.choose(), "replica_1")
+        self.assertEqual(pool.checks.call_count, 1)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_reads_from_primary(self):
+        self.assertIsNone(ReplicaPool().choose())
+
+    def test_router_sends_writes_and_migrations_to_primary(self):
+        router = ReplicaRouter()
+        token = _read_alias.set("replica_1")
+        self.addCleanup(_read_alias.reset, token)
+        self.assertEqual(router.db_for_read(BusModel), "replica_1")
+        self.assertEqual(router.db_for_write(BusModel), "default")
+        self.assertFalse(router.allow_migrate("replica_1", "GreenBus_App"))
+
+    @override_settings(DATABASE_REPLICAS=["replica_1"])
+    def test_warns_when_pins_are_per_process(self):
+        self.assertEqual([warning.id for warning in check_pin_cache(None)], ["GreenBus.W001"])
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache",
+                                               "LOCATION": "redis://localhost:6379"}}):
+            self.assertEqual(check_pin_cache(None), [])
+
+
+# "default" doubles as the replica: it is not in recovery, so its health check passes.
+@override_settings(DATABASE_REPLICAS=["default"])
+class ReplicaMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.bus = BusModel.objects.create(busNo=1, busCompany=company, totalSeats=4, fromWhere="Chennai",
+                                          toWhere="Vellore", boardingTime="Morning", date=date.today())
+        for order, name in enumerate(["Chennai", "Vellore"]):
+            RouteModel.objects.create(bus=cls.bus, stopName=name, stopOrder=order)
+        cls.users = [User.objects.create_user(name) for name in ("alice", "bob")]
+        for user in cls.users:
+            UserModel.objects.create(user=user)
+
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob = (self.client_for(user) for user in self.users)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {GreenBusRefreshToken.for_user(user).access_token}")
+        return client
+
+    def read_alias(self, client):
+        response = client.get("/customer/available-seats/",
+                              {"busId": self.bus.id, "fromWhere": "Chennai", "toWhere": "Vellore"})
+        self.assertEqual(response.status_code, 200)
+        return response.wsgi_request.replica_alias
+
+    def book(self, client, seat, to_stop="Vellore"):
+        return client.post("/customer/book_seat/", {"bus_id": self.bus.id, "seat_numbers": [seat],
+                                                    "from_stop": "Chennai", "to_stop": to_stop}, format="json")
+
+    def test_read_views_use_a_replica(self):
+        self.assertEqual(self.read_alias(self.alice), "default")
+
+    def test_other_views_read_from_primary(self):
+        response = self.alice.get("/customer/waitlist/")
+        self.assertIsNone(response.wsgi_request.replica_alias)
+
+    def test_booking_pins_only_that_client_to_the_primary(self):
+        response = self.book(self.alice, 1)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(cache.get(_pin_key(response.wsgi_request)))
+        self.assertIsNone(self.read_alias(self.alice))
+        self.assertEqual(self.read_alias(self.bob), "default")
+
+    def test_failed_booking_does_not_pin(self):
+        self.assertEqual(self.book(self.alice, 1, to_stop="Bangalore").status_code, 400)
+        self.assertEqual(self.read_alias(self.alice), "default")
+
+
+class TokenRevocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", password="pw", is_staff=True)
+        cls.profile = UserModel.objects.create(user=cls.staff)
+
+    def setUp(self):
+        cache.clear()
+        self.refresh = GreenBusRefreshToken.for_user(self.staff)
+        self.access = self.refresh.access_token
+
+    def get_admin_view(self, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        return client.get("/api/metrics/db-pool/")
+
+    def refresh_token(self):
+        return APIClient().post("/api/token/refresh/", {"refresh": str(self.refresh)}, format="json")
+
+    def test_demotion_revokes_tokens(self):
+        self.assertEqual(self.get_admin_view(self.access).status_code, 200)
+        self.staff.is_staff = False
+        self.staff.save()
+        self.assertEqual(self.get_admin_view(self.access).status_code, 401)
+        self.assertEqual(self.refresh_token().status_code, 401)
+
+    def test_profile_change_revokes_tokens(self):
+        self.profile.is_customer = False
+        self.profile.save()
+        self.assertEqual(self.get_admin_view(self.access).status_code, 401)
+
+    def test_unrelated_saves_keep_tokens(self):
+        self.staff.first_name = "Sam"
+        self.staff.save()
+        self.staff.save(update_fields=["last_login"])
+        self.assertEqual(self.get_admin_view(self.access).status_code, 200)
+
+    def test_refresh_reads_current_claims(self):
+        # A queryset update sends no signal, so nothing is revoked; the refresh must still see the demotion.
+        User.objects.filter(id=self.staff.id).update(is_staff=False)
+        response = self.refresh_token()
+        self.assertEqual(response.status_code, 200)
+        access = AccessToken(response.data["access"])
+        self.assertFalse(access["is_staff"])
+        self.assertEqual(access["profile_id"], self.profile.id)
+        self.assertEqual(self.get_admin_view(response.data["access"]).status_code, 403)
+
+    def test_refresh_rejects_inactive_users(self):
+        User.objects.filter(id=self.staff.id).update(is_active=False)
+        self.assertEqual(self.refresh_token().status_code, 401)
+
+    def test_tokens_issued_after_a_revocation_in_the_same_second_are_kept(self):
+        second = timezone.now().replace(microsecond=0) - timedelta(seconds=1)
+        tokens = []
+        for offset in (200_000, 800_000):
+            with mock.patch("rest_framework_simplejwt.tokens.aware_utcnow",
+                            return_value=second + timedelta(microseconds=offset)):
+                tokens.append(GreenBusRefreshToken.for_user(self.staff).access_token)
+        with mock.patch("GreenBus_App.authentication.time.time", return_value=second.timestamp() + 0.5):
+            revoke_user_tokens(self.staff.id)
+        before, after = tokens
+        self.assertEqual(self.get_admin_view(before).status_code, 401)
+        self.assertEqual(self.get_admin_view(after).status_code, 200)
+
+
+class BookingValidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.bus = BusModel.objects.create(busNo=1, busCompany=company, totalSeats=4, fromWhere="Chennai",
+                                          toWhere="Vellore", boardingTime="Morning", date=date.today())
+        for order, name in enumerate(["Chennai", "Vellore"]):
+            RouteModel.objects.create(bus=cls.bus, stopName=name, stopOrder=order)
+        cls.user = User.objects.create_user("customer")
+        cls.profile = UserModel.objects.create(user=cls.user)
+
+    def book(self, seat_numbers):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.post("/customer/book_seat/", {"bus_id": self.bus.id, "seat_numbers": seat_numbers,
+                                                    "from_stop": "Chennai", "to_stop": "Vellore"}, format="json")
+
+    def test_rejects_seats_the_bus_does_not_have(self):
+        for seat_numbers in ([5], [0], ["1"], [1, 1], [True], "1,2"):
+            with self.subTest(seat_numbers=seat_numbers):
+                self.assertEqual(self.book(seat_numbers).status_code, 400)
+        self.assertFalse(TicketModel.objects.exists())
+        self.assertEqual(self.book([4]).status_code, 201)
+
+    def test_worker_rejects_bad_requests_one_at_a_time(self):
+        requests = [BookingRequest(self.profile.id, seats, "Chennai", "Vellore")
+                    for seats in ([1], [9], ["x"], [1], [2, 3])]
+        BusBookingWorker(self.bus.id, BookingAdmission()).process(requests)
+
+        booked, out_of_range, malformed, taken, pair = (request.future.exception() for request in requests)
+        self.assertIsNone(booked)
+        self.assertIsNone(pair)
+        self.assertIn("do not exist", str(out_of_range))
+        self.assertIn("do not exist", str(malformed))
+        self.assertIn("already booked", str(taken))
+        self.assertEqual(sorted(TicketModel.objects.values_list("seatNumbers", flat=True)), [[1], [2, 3]])
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.bookedSeats, [1, 2, 3])
+
+
+class BucketStoreTests(SimpleTestCase):
+    def test_bucket_empties_and_reports_the_wait(self):
+        store = BucketStore()
+        self.assertEqual([store.take("ip:1", 2, 1.0) for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(store.take("ip:1", 2, 1.0), 1.0, places=2)
+        self.assertEqual(store.take("ip:2", 2, 1.0), 0)
+
+    def test_evicts_least_recently_used_buckets_down_to_the_low_water_mark(self):
+        store = BucketStore(max_keys=10, low_water=0.5)
+        for key in range(10):
+            store.take(key, 10, 1.0)
+        store.take(0, 10, 1.0)
+        self.assertEqual(len(store._buckets), 10)
+        store.take(10, 10, 1.0)
+        self.assertEqual(list(store._buckets), [7, 8, 9, 0, 10])
+
+    def test_forwarded_for_does_not_pick_the_bucket(self):
+        throttle = SeatsIPThrottle()
+        keys = {throttle.get_ident_key(Request(RequestFactory().get("/", HTTP_X_FORWARDED_FOR=f"10.0.0.{n}",
+                                                                    REMOTE_ADDR="192.0.2.1")))
+                for n in range(3)}
+        self.assertEqual(keys, {"ip:192.0.2.1"})
+
+    def test_throttles_must_name_their_client(self):
+        with self.assertRaises(TypeError):
+            TokenBucketThrottle()
+
+
+class SeatVersionTests(TestCase):
+    def setUp(self):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        self.bus = BusModel.objects.create(busNo=1, busCompany=company, totalSeats=4, fromWhere="Chennai",
+                                           toWhere="Vellore", boardingTime="Morning")
+
+    def test_saves_from_stale_instances_keep_every_bump(self):
+        bus = self.bus
+        stale = BusModel.objects.get(id=bus.id)
+        bus.update_seat_status()
+        RouteModel.objects.create(bus=bus, stopName="Chennai", stopOrder=0)
+        stale.blockedSeats = [2]
+        stale.save()
+        self.assertEqual(BusModel.objects.get(id=bus.id).seatVersion, 3)
+        self.assertEqual(stale.seatVersion, 3)
+        self.assertEqual(stale.availableSeats, [1, 3, 4])
+
+    def test_bumped_version_is_read_only_when_asked_for(self):
+        with self.assertNumQueries(1):
+            self.bus.save(update_fields=["blockedSeats"])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.bus.seatVersion, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.bus.seatVersion, 1)
+
+
+class SeatMapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.bus = BusModel.objects.create(busNo=1, busCompany=company, totalSeats=10, blockedSeats=[2],
+                                          fromWhere="Chennai", toWhere="Vellore", boardingTime="Morning")
+        for order, name in enumerate(["Chennai", "Vellore"]):
+            RouteModel.objects.create(bus=cls.bus, stopName=name, stopOrder=order)
+        customer = UserModel.objects.create(user=User.objects.create_user("customer"))
+        TicketModel.objects.create(customer=customer, bus=cls.bus, seatNumbers=[1, 9], fromStop="Chennai",
+                                   toStop="Vellore")
+        cls.url = f"/customer/available-seats/?busId={cls.bus.id}&fromWhere=Chennai&toWhere=Vellore"
+
+    def setUp(self):
+        buckets.clear()
+
+    def test_bitset_round_trips(self):
+        seats = [1, 3, 8, 9, 10]
+        encoded = encode_seats(seats, 10)
+        raw = base64.b64decode(encoded)
+        self.assertEqual(len(raw), 2)
+        self.assertEqual(mask_to_seats(int.from_bytes(raw, "little")), seats)
+
+    def test_bitset_response_decodes_to_the_seat_list(self):
+        plain = self.client.get(self.url).json()
+        compact = self.client.get(self.url + "&seatFormat=bitset").json()
+        self.assertEqual(plain["availableSeats"], [3, 4, 5, 6, 7, 8, 10])
+        bits = int.from_bytes(base64.b64decode(compact["availableSeatMap"]), "little")
+        self.assertEqual((compact["totalSeats"], mask_to_seats(bits)), (10, plain["availableSeats"]))
+
+    def test_matching_etag_is_answered_with_304(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertEqual(etag, seat_etag(self.bus.id, BusModel.objects.get(id=self.bus.id).seatVersion,
+                                         "Chennai", "Vellore", False))
+        self.assertNotEqual(self.client.get(self.url + "&seatFormat=bitset")["ETag"], etag)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual((cached["ETag"], cached.content), (etag, b""))
+
+    def test_seat_changes_change_the_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        BusModel.objects.get(id=self.bus.id).update_seat_status()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    def test_matches_drf_renderer(self):
+        moment = datetime(2026, 3, 1, 9, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        data = {"at": moment, "local": moment.replace(tzinfo=None), "day": moment.date(), "time": moment.time(),
+                "id": uuid.UUID(int=7), "price": Decimal("12.50"), "rows": [{"name": "Chennai", "seats": [1, 2]}]}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class SerializerRowTests(TestCase):
+    """The plain-dict rows must render exactly like the serializers they stand in for."""
+
+    @classmethod
+    def setUpTestData(cls):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.bus = BusModel.objects.create(busNo=1, busCompany=company, totalSeats=4, fromWhere="Chennai",
+                                          toWhere="Vellore", boardingTime="Morning", date=date(2030, 1, 2))
+        for order, name in enumerate(["Chennai", "Vellore"]):
+            RouteModel.objects.create(bus=cls.bus, stopName=name, stopOrder=order)
+        customer = UserModel.objects.create(user=User.objects.create_user("customer"))
+        paid, unpaid = (TicketModel.objects.create(customer=customer, bus=cls.bus, seatNumbers=seats,
+                                                   fromStop="Chennai", toStop="Vellore") for seats in ([1, 2], [3]))
+        PaymentModel.objects.create(customer=customer, ticket=paid, paymentStatus="Pending")
+        PaymentModel.objects.create(customer=customer, ticket=paid, paymentStatus="Paid")
+        archived_bus = ArchivedBusModel.objects.create(busId=99, busNo=99, busCompany=company, totalSeats=4,
+                                                       fromWhere="Chennai", toWhere="Vellore", perSeatPrice=500,
+                                                       boardingTime="Night", date=date(2020, 1, 1))
+        ArchivedTicketModel.objects.create(ticketId=7, customer=customer, bus=archived_bus, seatNumbers=[4],
+                                           fromStop="Chennai", toStop="Vellore", fromStopOrder=0, toStopOrder=1,
+                                           ticketPrice=500, bookingDate=date(2019, 12, 1), paymentStatus="Paid")
+
+    def assertRendersLike(self, rows, serializer_data):
+        self.assertEqual(json.loads(JSONRenderer().render(rows)), json.loads(JSONRenderer().render(serializer_data)))
+
+    def test_bus_rows(self):
+        buses = BusModel.objects.all()
+        self.assertRendersLike(bus_rows(buses), BusSerializer(buses, many=True).data)
+
+    def test_ticket_rows(self):
+        tickets = TicketModel.objects.order_by("ticketId")
+        self.assertRendersLike(ticket_rows(tickets), TicketSerializer(tickets, many=True).data)
+
+    def test_archived_ticket_rows(self):
+        tickets = ArchivedTicketModel.objects.all()
+        self.assertRendersLike(archived_ticket_rows(tickets), ArchivedTicketSerializer(tickets, many=True).data)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DATE_FORMAT": "%d/%m/%Y"})
+    def test_rows_follow_the_date_format(self):
+        buses, tickets = BusModel.objects.all(), TicketModel.objects.order_by("ticketId")
+        self.assertRendersLike(bus_rows(buses), BusSerializer(buses, many=True).data)
+        self.assertRendersLike(ticket_rows(tickets), TicketSerializer(tickets, many=True).data)
+
+
+class ListResponseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.day = date.today() + timedelta(days=1)
+        cls.buses = []
+        for number in range(1, 4):
+            bus = BusModel.objects.create(busNo=number, busCompany=company, totalSeats=4, fromWhere="Chennai",
+                                          toWhere="Vellore", boardingTime="Morning", date=cls.day)
+            for order, name in enumerate(["Chennai", "Vellore"]):
+                RouteModel.objects.create(bus=bus, stopName=name, stopOrder=order)
+            cls.buses.append(bus)
+        cls.user = User.objects.create_user("customer")
+        customer = UserModel.objects.create(user=cls.user)
+        cls.tickets = [TicketModel.objects.create(customer=customer, bus=bus, seatNumbers=[1], fromStop="Chennai",
+                                                  toStop="Vellore") for bus in cls.buses]
+        PaymentModel.objects.create(customer=customer, ticket=cls.tickets[0], paymentStatus="Paid")
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+
+    def client_for(self, user):
+        buckets.clear()
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_lists_are_paged_by_default(self):
+        client = self.client_for(self.staff)
+        for url in ("/api/buses/", "/api/tickets/", "/api/payments/", "/api/routes/"):
+            page = client.get(url).data
+            self.assertEqual(set(page), {"next", "previous", "results"}, url)
+
+        client = self.client_for(self.user)
+        search = {"fromWhere": "Chennai", "toWhere": "Vellore", "date": self.day.isoformat()}
+        page = client.get("/customer/search_buses/", search).data
+        self.assertEqual([bus["busNo"] for bus in page["results"]], [1, 2, 3])
+        self.assertIsNone(page["next"])
+        self.assertEqual(len(client.get("/customer/view_tickets/").data["results"]), 3)
+
+    def test_bare_lists_on_request_up_to_the_cap(self):
+        client = self.client_for(self.user)
+        search = {"fromWhere": "Chennai", "toWhere": "Vellore", "date": self.day.isoformat(), "pageSize": "all"}
+        self.assertEqual([bus["busNo"] for bus in client.get("/customer/search_buses/", search).data], [1, 2, 3])
+        self.assertEqual(len(client.get("/customer/view_tickets/", {"pageSize": "all"}).data), 3)
+
+        with mock.patch.object(KeysetPagination, "max_unpaged_size", 2):
+            self.assertEqual(client.get("/customer/search_buses/", search).status_code, 400)
+            self.assertEqual(client.get("/customer/view_tickets/", {"pageSize": "all"}).status_code, 400)
+            self.assertEqual(self.client_for(self.staff).get("/api/buses/", {"pageSize": "all"}).status_code, 400)
+
+    def test_paging_on_request(self):
+        client = self.client_for(self.user)
+        search = {"fromWhere": "Chennai", "toWhere": "Vellore", "date": self.day.isoformat(), "pageSize": 2}
+        first = client.get("/customer/search_buses/", search).data
+        self.assertEqual([bus["busNo"] for bus in first["results"]], [1, 2])
+        second = client.get(first["next"]).data
+        self.assertEqual([bus["busNo"] for bus in second["results"]], [3])
+        self.assertIsNone(second["next"])
+
+        page = client.get("/customer/view_tickets/", {"pageSize": 2}).data
+        self.assertEqual(len(page["results"]), 2)
+        self.assertEqual(len(client.get(page["next"]).data["results"]), 1)
+
+    def test_jsonl_stream_is_async_with_payment_status_joined_in(self):
+        response = self.client_for(self.staff).get("/api/tickets/", {"stream": "jsonl"})
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        with CaptureQueriesContext(connection) as queries:
+            lines = async_to_sync(read)().splitlines()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([json.loads(line)["paymentStatus"] for line in lines], ["Paid", "Pending", "Pending"])
+
+    def test_ticket_export_streams_from_an_async_iterator(self):
+        client = self.client_for(self.staff)
+
+        async def read(response):
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        response = client.get("/api/exports/tickets/", {"exportFormat": "csv"})
+        self.assertTrue(response.is_async)
+        lines = async_to_sync(read)(response).decode().splitlines()
+        self.assertEqual(lines[0].split(","), list(EXPORT_COLUMNS))
+        self.assertEqual(len(lines), 4)
+
+        response = client.get("/api/exports/tickets/", {"exportFormat": "jsonl"})
+        rows = [json.loads(line) for line in async_to_sync(read)(response).splitlines()]
+        self.assertEqual([row["ticketId"] for row in rows], [ticket.ticketId for ticket in self.tickets])
+        self.assertEqual(rows[0]["paymentStatus"], "Paid")
+
+
+class WaitlistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.bus = BusModel.objects.create(busNo=7, busCompany=company, totalSeats=2, fromWhere="Chennai",
+                                          toWhere="Bangalore", boardingTime="Morning",
+                                          date=date.today() + timedelta(days=1))
+        for order, name in enumerate(["Chennai", "Vellore", "Bangalore"]):
+            RouteModel.objects.create(bus=cls.bus, stopName=name, stopOrder=order)
+        cls.users = [User.objects.create_user(name) for name in ("alice", "bob", "carol")]
+        for user in cls.users:
+            UserModel.objects.create(user=user)
+
+    def setUp(self):
+        buckets.clear()
+        self.alice, self.bob, self.carol = (self.client_for(user) for user in self.users)
+        response = self.alice.post("/customer/book_seat/", {"bus_id": self.bus.id, "seat_numbers": [1, 2],
+                                                            "from_stop": "Chennai", "to_stop": "Bangalore"},
+                                   format="json")
+        self.assertEqual(response.status_code, 201)
+        self.ticket = TicketModel.objects.get()
+        PaymentModel.objects.create(customer_id=self.ticket.customer_id, ticket=self.ticket)
+        self.bob_entry = self.join(self.bob, 1)
+        self.carol_entry = self.join(self.carol, 2)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def join(self, client, seat_count):
+        response = client.post("/customer/waitlist/join/", {"bus_id": self.bus.id, "from_stop": "Chennai",
+                                                            "to_stop": "Vellore", "seat_count": seat_count})
+        self.assertEqual(response.status_code, 201)
+        return WaitlistModel.objects.get(id=response.data["id"])
+
+    def cancel_alice(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.alice.post("/customer/cancel-ticket/", {"ticket_id": self.ticket.ticketId})
+        self.assertEqual(response.status_code, 200)
+
+    def pay(self, client, entry):
+        return client.post("/customer/make_payment/", {"ticket_id": entry.ticket_id})
+
+    def test_join_is_refused_while_seats_are_free(self):
+        self.cancel_alice()
+        response = self.carol.post("/customer/waitlist/join/", {"bus_id": self.bus.id, "from_stop": "Vellore",
+                                                                "to_stop": "Bangalore"})
+        self.assertEqual(response.status_code, 409)
+
+    def test_cancellation_holds_seats_for_the_oldest_entry_that_fits(self):
+        self.cancel_alice()
+        self.bob_entry.refresh_from_db()
+        self.carol_entry.refresh_from_db()
+        self.assertEqual(self.bob_entry.status, "Held")
+        self.assertGreater(self.bob_entry.holdExpiresAt, timezone.now())
+        self.assertEqual(self.bob_entry.ticket.seatNumbers, [1])
+        self.assertEqual(PaymentModel.objects.get(ticket=self.bob_entry.ticket).paymentStatus, "Pending")
+        self.assertEqual(self.carol_entry.status, "Waiting")
+        self.assertTrue(OutboxEvent.objects.filter(eventType="waitlist.held",
+                                                   payload__waitlist_id=self.bob_entry.id).exists())
+        self.assertTrue(OutboxEvent.objects.get(eventType="ticket.booked", payload__ticketId=self.bob_entry.ticket_id)
+                        .payload["waitlistHold"])
+
+    def test_paying_a_hold_confirms_it(self):
+        self.cancel_alice()
+        self.bob_entry.refresh_from_db()
+        self.assertEqual(self.pay(self.bob, self.bob_entry).status_code, 200)
+        self.bob_entry.refresh_from_db()
+        self.assertEqual(self.bob_entry.status, "Confirmed")
+        self.assertEqual(expire_holds(timezone.now() + timedelta(days=1)), 0)
+
+    def test_expired_hold_refuses_payment_and_goes_to_the_next_entry(self):
+        self.cancel_alice()
+        self.bob_entry.refresh_from_db()
+        WaitlistModel.objects.filter(id=self.bob_entry.id).update(holdExpiresAt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.pay(self.bob, self.bob_entry).status_code, 410)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_holds(), 1)
+        self.assertFalse(TicketModel.objects.filter(ticketId=self.bob_entry.ticket_id).exists())
+        self.bob_entry.refresh_from_db()
+        self.carol_entry.refresh_from_db()
+        self.assertEqual((self.bob_entry.status, self.bob_entry.ticket), ("Expired", None))
+        self.assertEqual(self.carol_entry.status, "Held")
+        self.assertEqual(self.carol_entry.ticket.seatNumbers, [1, 2])
+
+
+class SeatInventoryTests(SimpleTestCase):
+    def inventory(self, total_seats=6, blocked_seats=()):
+        return SeatInventory(1, total_seats, list(blocked_seats), [("A", 0), ("B", 1), ("C", 2), ("D", 3)])
+
+    def allocate(self, inventory, from_stop, to_stop, count):
+        return mask_to_seats(inventory.allocate(*inventory.interval(from_stop, to_stop), count))
+
+    def test_group_sits_together(self):
+        inventory = self.inventory()
+        inventory.book(0, 3, seat_mask([2]))
+        self.assertEqual(self.allocate(inventory, "A", "D", 2), [3, 4])
+        self.assertEqual(self.allocate(inventory, "A", "D", 5), [1, 3, 4, 5, 6])
+
+    def test_scattered_seats_when_no_run_is_free(self):
+        inventory = self.inventory()
+        inventory.book(0, 3, seat_mask([2, 4, 6]))
+        self.assertEqual(self.allocate(inventory, "A", "D", 2), [1, 3])
+
+    def test_blocked_and_too_few_seats(self):
+        inventory = self.inventory(blocked_seats=[1])
+        inventory.book(0, 3, seat_mask([2, 3, 4]))
+        self.assertEqual(self.allocate(inventory, "A", "D", 2), [5, 6])
+        self.assertEqual(inventory.allocate(0, 3, 3), 0)
+        self.assertEqual(inventory.allocate(0, 3, 0), 0)
+
+    def test_gap_costs_count_free_hops_around_the_journey(self):
+        inventory = self.inventory()
+        inventory.book(0, 1, seat_mask([2, 3]))
+        inventory.book(2, 3, seat_mask([3]))
+        self.assertEqual(inventory._gap_costs(1, 2, inventory.free(1, 2)), [2, 1, 0, 2, 2, 2])
+
+    def test_best_fit_takes_the_seat_whose_gap_the_journey_fills(self):
+        inventory = self.inventory()
+        inventory.book(0, 1, seat_mask([2, 3]))
+        inventory.book(2, 3, seat_mask([3]))
+        self.assertEqual(self.allocate(inventory, "B", "C", 1), [3])
+        # Seats free for the whole route stay whole while a partly used one fits.
+        inventory.book(1, 2, seat_mask([3]))
+        self.assertEqual(self.allocate(inventory, "B", "C", 1), [2])
+
+    def test_best_fit_run_beats_lowest_run(self):
+        inventory = self.inventory()
+        inventory.book(0, 1, seat_mask([4, 5]))
+        inventory.book(2, 3, seat_mask([4, 5]))
+        self.assertEqual(self.allocate(inventory, "B", "C", 2), [4, 5])
+        self.assertEqual(self.allocate(inventory, "A", "D", 2), [1, 2])
+
+
+class RecordingSink:
+    def __init__(self, fail_on=()):
+        self.sent = []
+        self.fail_on = set(fail_on)
+
+    def send(self, event):
+        if event.id in self.fail_on:
+            raise ConnectionError("sink down")
+        self.sent.append(event.id)
+
+    def flush(self):
+        pass
+
+
+def outbox_event(bus_id, event_type="ticket.booked"):
+    return OutboxEvent.objects.create(eventType=event_type, busId=bus_id, payload={})
+
+
+class OutboxRelayTests(TestCase):
+    def test_events_go_out_in_order_and_are_marked_published(self):
+        events = [outbox_event(bus_id).id for bus_id in (1, 2, 1, 2)]
+        sink = RecordingSink()
+        self.assertEqual(Relay(sinks=[sink]).run_once(), 4)
+        self.assertEqual(sink.sent, events)
+        self.assertFalse(OutboxEvent.objects.filter(publishedAt__isnull=True).exists())
+        self.assertEqual(Relay(sinks=[sink]).run_once(), 0)
+
+    def test_failed_event_holds_back_its_bus_only(self):
+        first, second, other = outbox_event(1), outbox_event(1), outbox_event(2)
+        sink = RecordingSink(fail_on={first.id})
+        with self.assertLogs("GreenBus_App.outbox", "ERROR"):
+            self.assertEqual(Relay(sinks=[sink]).run_once(), 1)
+        self.assertEqual(sink.sent, [other.id])
+        first.refresh_from_db()
+        self.assertEqual(first.attempts, 1)
+        self.assertIn("sink down", first.lastError)
+        self.assertIsNone(OutboxEvent.objects.get(id=second.id).publishedAt)
+
+    @override_settings(OUTBOX={"MAX_ATTEMPTS": 2})
+    def test_event_is_parked_after_max_attempts(self):
+        first, second = outbox_event(1), outbox_event(1)
+        sink = RecordingSink(fail_on={first.id})
+        with self.assertLogs("GreenBus_App.outbox", "ERROR"):
+            Relay(sinks=[sink]).run_once()
+            Relay(sinks=[sink]).run_once()
+        self.assertEqual(Relay(sinks=[sink]).run_once(), 1)
+        self.assertEqual(sink.sent, [second.id])
+        first.refresh_from_db()
+        self.assertEqual((first.attempts, first.publishedAt), (2, None))
+
+        OutboxEventAdmin(OutboxEvent, admin.site).retry_now(mock.Mock(), OutboxEvent.objects.filter(id=first.id))
+        self.assertEqual(Relay(sinks=[RecordingSink()]).run_once(), 1)
+
+
+class OutboxRelayLockTests(TransactionTestCase):
+    def test_bus_waits_for_an_event_another_relay_holds(self):
+        held, later, other = outbox_event(1), outbox_event(1), outbox_event(2)
+        locked, release = threading.Event(), threading.Event()
+
+        def other_relay():
+            with transaction.atomic():
+                OutboxEvent.objects.select_for_update().get(id=held.id)
+                locked.set()
+                release.wait(10)
+            connection.close()
+
+        thread = threading.Thread(target=other_relay)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            sink = RecordingSink()
+            self.assertEqual(Relay(sinks=[sink]).run_once(), 1)
+            self.assertEqual(sink.sent, [other.id])
+        finally:
+            release.set()
+            thread.join()
+        sink = RecordingSink()
+        Relay(sinks=[sink]).run_once()
+        self.assertEqual(sink.sent, [held.id, later.id])
+
+
+class OutboxPublishTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.bus = BusModel.objects.create(busNo=9, busCompany=company, totalSeats=4, fromWhere="Chennai",
+                                          toWhere="Vellore", boardingTime="Morning",
+                                          date=date.today() + timedelta(days=1))
+        for order, name in enumerate(["Chennai", "Vellore"]):
+            RouteModel.objects.create(bus=cls.bus, stopName=name, stopOrder=order)
+        cls.user = User.objects.create_user("alice")
+        UserModel.objects.create(user=cls.user)
+
+    def setUp(self):
+        buckets.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        response = self.client.post("/customer/book_seat/", {"bus_id": self.bus.id, "seat_numbers": [1, 2],
+                                                             "from_stop": "Chennai", "to_stop": "Vellore"},
+                                    format="json")
+        self.assertEqual(response.status_code, 201)
+        self.ticket = TicketModel.objects.get()
+
+    def event_types(self):
+        return list(OutboxEvent.objects.values_list("eventType", flat=True))
+
+    def test_a_second_payment_publishes_nothing(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post("/customer/make_payment/", {"ticket_id": self.ticket.ticketId})
+                             .status_code, 200)
+        self.assertEqual(self.event_types(), ["ticket.booked", "payment.paid"])
+        self.assertEqual(PaymentModel.objects.get().paymentStatus, "Paid")
+
+    def test_cancellation_publishes_the_released_seats(self):
+        PaymentModel.objects.create(customer_id=self.ticket.customer_id, ticket=self.ticket)
+        response = self.client.post("/customer/cancel-ticket/", {"ticket_id": self.ticket.ticketId})
+        self.assertEqual(response.status_code, 200)
+        event = OutboxEvent.objects.get(eventType="ticket.cancelled")
+        self.assertEqual(event.payload["seatNumbers"], [1, 2])
+        self.assertEqual(event.channelMessage["data"]["booked_seats"], [])
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.availableSeats, [1, 2, 3, 4])
+
+
+class InlineExecutor:
+    """Runs the dispatcher's chunks in the test's thread and transaction."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def map(self, function, *iterables):
+        return map(function, *iterables)
+
+    def shutdown(self):
+        pass
+
+
+class RejectingFileBackend(FileBackend):
+    """``FileBackend`` that refuses customers without an e-mail address for good."""
+
+    def send_many(self, messages):
+        results = super().send_many([message for message in messages if message.email])
+        return [results.pop(0) if message.email else PermanentError("No e-mail address.") for message in messages]
+
+
+@mock.patch("GreenBus_App.notifications.close_old_connections", mock.Mock())
+@mock.patch("GreenBus_App.notifications.ThreadPoolExecutor", InlineExecutor)
+class NotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = UserModel.objects.create(user=User.objects.create_user("alice", email="alice@example.com"))
+        cls.bob = UserModel.objects.create(user=User.objects.create_user("bob"))
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "notifications.jsonl")
+
+    def notify(self, customer, event_id=1):
+        return NotificationModel.objects.create(eventId=event_id, kind="booking_confirmation", customer=customer,
+                                                ticketId=event_id, context={"ticketId": event_id})
+
+    def dispatcher(self, backend):
+        dispatcher = Dispatcher(backend=backend, workers=1)
+        self.addCleanup(dispatcher.close)
+        return dispatcher
+
+    def sent(self):
+        with open(self.path) as file:
+            return [json.loads(line)["notificationId"] for line in file]
+
+    def test_waitlist_hold_books_without_a_booking_confirmation(self):
+        ticket = {"ticketId": 5, "customerId": self.alice.id, "seatNumbers": [1], "fromStop": "A", "toStop": "B",
+                  "ticketPrice": 100}
+        booked = OutboxEvent(id=1, eventType="ticket.booked", busId=1, payload=ticket)
+        held = OutboxEvent(id=2, eventType="ticket.booked", busId=1, payload={**ticket, "waitlistHold": True})
+        self.assertEqual([row.kind for row in notifications_for(booked)], ["booking_confirmation"])
+        self.assertEqual(notifications_for(held), [])
+
+    def test_sends_through_the_backend(self):
+        notification = self.notify(self.alice)
+        self.assertEqual(self.dispatcher(FileBackend({"FILE_PATH": self.path})).run_once(), 1)
+        self.assertEqual(self.sent(), [notification.id])
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), ("Sent", 1))
+
+    @mock.patch("GreenBus_App.notifications.random.uniform", return_value=1)
+    def test_failures_back_off_then_fail(self, uniform):
+        notification = self.notify(self.alice)
+        missing = os.path.join(self.path, "missing", "notifications.jsonl")
+        dispatcher = self.dispatcher(FileBackend({"FILE_PATH": missing}))
+        backoff = dispatcher.options["BACKOFF_SECONDS"]
+
+        start = timezone.now()
+        for attempt in range(1, dispatcher.options["MAX_ATTEMPTS"]):
+            with mock.patch("GreenBus_App.notifications.timezone.now", return_value=start):
+                self.assertEqual(dispatcher.run_once(), 1)
+                self.assertEqual(dispatcher.run_once(), 0)
+            notification.refresh_from_db()
+            self.assertEqual((notification.status, notification.attempts), ("Pending", attempt))
+            self.assertEqual(notification.nextAttemptAt, start + timedelta(seconds=backoff * 2 ** (attempt - 1)))
+            self.assertIn("FileNotFoundError", notification.lastError)
+            start = notification.nextAttemptAt
+
+        with mock.patch("GreenBus_App.notifications.timezone.now", return_value=start):
+            dispatcher.run_once()
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, "Failed")
+
+    def test_permanent_error_fails_at_once(self):
+        bob, alice = self.notify(self.bob, 1), self.notify(self.alice, 2)
+        self.assertEqual(self.dispatcher(RejectingFileBackend({"FILE_PATH": self.path})).run_once(), 2)
+        bob.refresh_from_db()
+        self.assertEqual((bob.status, bob.attempts), ("Failed", 1))
+        self.assertIn("No e-mail address", bob.lastError)
+        self.assertEqual(self.sent(), [alice.id])
+
+    def test_lease_of_a_dead_dispatcher_expires(self):
+        notification = self.notify(self.alice)
+        dispatcher = self.dispatcher(FileBackend({"FILE_PATH": self.path}))
+        start = timezone.now()
+        with mock.patch("GreenBus_App.notifications.timezone.now", return_value=start):
+            self.assertEqual(len(dispatcher.lease(10)), 1)
+            self.assertEqual(dispatcher.run_once(), 0)
+
+        later = start + timedelta(seconds=dispatcher.options["LEASE_SECONDS"])
+        with mock.patch("GreenBus_App.notifications.timezone.now", return_value=later):
+            self.assertEqual(dispatcher.run_once(), 1)
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), ("Sent", 2))
+        self.assertEqual(self.sent(), [notification.id])
+
+
+class AvailabilityTests(TestCase):
+    STOPS = ["Chennai", "Vellore", "Bangalore"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = date.today() + timedelta(days=1)
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.bus = BusModel.objects.create(busNo=3, busCompany=company, totalSeats=4, fromWhere="Chennai",
+                                          toWhere="Bangalore", boardingTime="Morning", date=cls.day,
+                                          perSeatPrice=250)
+        for order, name in enumerate(cls.STOPS):
+            RouteModel.objects.create(bus=cls.bus, stopName=name, stopOrder=order)
+        customer = UserModel.objects.create(user=User.objects.create_user("alice"))
+        TicketModel.objects.create(customer=customer, bus=cls.bus, seatNumbers=[1], fromStop="Chennai",
+                                   toStop="Vellore")
+
+    def setUp(self):
+        cache.clear()
+
+    def free_seats(self):
+        return {(row.fromStop, row.toStop): row.freeSeats
+                for row in JourneyAvailability.objects.filter(bus=self.bus)}
+
+    def test_sink_refreshes_after_the_relay_commits(self):
+        outbox_event(self.bus.id)
+        outbox_event(self.bus.id, "payment.paid")
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(Relay(sinks=[AvailabilitySink({})]).run_once(), 2)
+        self.assertEqual(self.free_seats(), {})
+        with mock.patch("GreenBus_App.availability.refresh", wraps=refresh) as refreshed:
+            for callback in callbacks:
+                callback()
+        refreshed.assert_called_once_with([self.bus.id])
+        self.assertEqual(self.free_seats()[("Chennai", "Vellore")], 3)
+
+    def test_journey_rows_cover_first_stop_occurrences(self):
+        bus = BusModel(id=1, totalSeats=4, blockedSeats=[4], date=self.day, perSeatPrice=100, seatVersion=7)
+        inventory = SeatInventory(1, 4, [4], [("A", 0), ("B", 1), ("C", 2), ("B", 3)])
+        inventory.book(0, 1, seat_mask([1]))
+        inventory.book(2, 3, seat_mask([1, 2, 3]))
+        rows = journey_rows(bus, inventory)
+        self.assertEqual([(row.fromStop, row.toStop, row.freeSeats) for row in rows],
+                         [("A", "B", 2), ("A", "C", 2), ("B", "C", 3)])
+        self.assertEqual({(row.date, row.perSeatPrice, row.seatVersion) for row in rows}, {(self.day, 100, 7)})
+
+    def test_refresh_replaces_the_rows_of_a_bus(self):
+        self.assertEqual(refresh([self.bus.id]), 3)
+        self.assertEqual(self.free_seats(), {("Chennai", "Vellore"): 3, ("Chennai", "Bangalore"): 3,
+                                             ("Vellore", "Bangalore"): 4})
+        RouteModel.objects.filter(bus=self.bus, stopName="Bangalore").delete()
+        self.assertEqual(refresh([self.bus.id]), 1)
+        self.assertEqual(self.free_seats(), {("Chennai", "Vellore"): 3})
+
+    def test_calendar_days(self):
+        refresh([self.bus.id])
+        days = calendar("Chennai", "Bangalore", self.day - timedelta(days=1), self.day)
+        self.assertEqual(days, [
+            {"date": self.day - timedelta(days=1), "trips": 0, "minPrice": None, "maxFreeSeats": 0},
+            {"date": self.day, "trips": 1, "minPrice": 250, "maxFreeSeats": 3},
+        ])
+        JourneyAvailability.objects.filter(bus=self.bus).update(freeSeats=0)
+        self.assertEqual(calendar("Chennai", "Bangalore", self.day, self.day)[0]["maxFreeSeats"], 3)
+
+    def test_refresh_forgets_only_the_journeys_it_touched(self):
+        refresh([self.bus.id])
+        self.assertEqual(calendar("Chennai", "Vellore", self.day, self.day)[0]["maxFreeSeats"], 3)
+        other_pair = _day_versions("Hosur", "Salem", [self.day])
+        TicketModel.objects.create(customer=UserModel.objects.get(), bus=self.bus, seatNumbers=[2],
+                                   fromStop="Chennai", toStop="Vellore")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh([self.bus.id])
+        self.assertEqual(calendar("Chennai", "Vellore", self.day, self.day)[0]["maxFreeSeats"], 2)
+        self.assertEqual(_day_versions("Hosur", "Salem", [self.day]), other_pair)
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.day = date.today() + timedelta(days=1)
+        cls.bus = BusModel.objects.create(busNo=3, busCompany=company, totalSeats=6, perSeatPrice=100,
+                                          fromWhere="Chennai", toWhere="Bangalore", boardingTime="Morning",
+                                          date=cls.day)
+        for order, name in enumerate(["Chennai", "Vellore", "Bangalore"]):
+            RouteModel.objects.create(bus=cls.bus, stopName=name, stopOrder=order)
+        cls.users = [User.objects.create_user(name) for name in ("alice", "bob")]
+        for user in cls.users:
+            UserModel.objects.create(user=user)
+
+    def setUp(self):
+        buckets.clear()
+        self.alice, self.bob = (APIClient() for _ in self.users)
+        for client, user in zip((self.alice, self.bob), self.users):
+            client.force_authenticate(user)
+
+    def book(self, client, seats, from_stop, to_stop):
+        response = client.post("/customer/book_seat/", {"bus_id": self.bus.id, "seat_numbers": seats,
+                                                         "from_stop": from_stop, "to_stop": to_stop}, format="json")
+        self.assertEqual(response.status_code, 201)
+        return TicketModel.objects.latest("ticketId")
+
+    def rows(self):
+        return (list(BusDayRollup.objects.order_by("busId").values(*GROUPINGS["bus"], "totalSeats", "segmentCount",
+                                                                   "ticketsSold", "seatsSold", "seatSegments",
+                                                                   "bookedRevenue", "paidRevenue", "cancellations",
+                                                                   "cancelledSeats")),
+                list(SegmentDayRollup.objects.order_by("busId", "segment").values(
+                    "busId", "segment", "fromStop", "toStop", "totalSeats", "seatsSold")))
+
+    def test_booking_payment_and_cancellation_match_a_rebuild(self):
+        through = self.book(self.alice, [1, 2], "Chennai", "Bangalore")
+        self.assertEqual(self.alice.post("/customer/make_payment/", {"ticket_id": through.ticketId}).status_code, 200)
+        first_hop = self.book(self.bob, [3], "Chennai", "Vellore")
+        self.book(self.bob, [4], "Vellore", "Bangalore")
+        self.assertEqual(self.bob.post("/customer/make_payment/", {"ticket_id": first_hop.ticketId}).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.bob.post("/customer/cancel-ticket/", {"ticket_id": first_hop.ticketId})
+        self.assertEqual(response.status_code, 200)
+
+        live = self.rows()
+        self.assertEqual(live[0], [{
+            "busId": self.bus.id, "busNo": 3, "date": self.day, "busCompany": self.bus.busCompany_id, "totalSeats": 6,
+            "segmentCount": 2, "ticketsSold": 2, "seatsSold": 3, "seatSegments": 5, "bookedRevenue": 300,
+            "paidRevenue": 200, "cancellations": 1, "cancelledSeats": 1,
+        }])
+        self.assertEqual([row["seatsSold"] for row in live[1]], [2, 3])
+        self.assertEqual(rebuild(), 1)
+        self.assertEqual(self.rows(), live)
+
+        archive_completed_trips(self.day + timedelta(days=1))
+        self.assertEqual(rebuild(), 1)
+        self.assertEqual(self.rows(), live)
+
+
+class ReconciliationTests(TransactionTestCase):
+    """``check`` sets its own isolation level, so these run outside a test transaction."""
+
+    def setUp(self):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        self.bus = BusModel.objects.create(busNo=5, busCompany=company, totalSeats=4, fromWhere="Chennai",
+                                           toWhere="Bangalore", boardingTime="Morning",
+                                           date=date.today() + timedelta(days=1))
+        for order, name in enumerate(["Chennai", "Vellore", "Bangalore"]):
+            RouteModel.objects.create(bus=self.bus, stopName=name, stopOrder=order)
+        self.customer = UserModel.objects.create(user=User.objects.create_user("alice"))
+
+    def ticket(self, seats, from_stop="Chennai", to_stop="Bangalore"):
+        # Saved directly, like the legacy paths, so only the bus's arrays follow the ticket.
+        return TicketModel.objects.create(customer=self.customer, bus=self.bus, seatNumbers=seats,
+                                          fromStop=from_stop, toStop=to_stop)
+
+    def kinds(self, problems):
+        return sorted(problem["kind"] for problem in problems)
+
+    def test_drift_is_repaired(self):
+        self.ticket([1, 2], to_stop="Vellore")
+        BusModel.objects.filter(id=self.bus.id).update(availableSeats=[1, 2, 3, 4])
+        RouteModel.objects.filter(stopOrder=1).update(bookedSeats=[4])
+        TicketModel.objects.update(fromStopOrder=None)
+        problems = reconciliation.check([self.bus.id])
+        self.assertEqual(self.kinds(problems), [reconciliation.BUS_AVAILABLE, reconciliation.ROUTE_BOOKED,
+                                                reconciliation.UNRESOLVED_STOPS])
+        self.assertIn({"busId": self.bus.id, "kind": reconciliation.ROUTE_BOOKED, "stopOrder": 1,
+                       "expected": [], "found": [4]}, problems)
+
+        version = BusModel.objects.get().seatVersion
+        result = reconciliation.reconcile_chunk([self.bus.id], fix=True)
+        self.assertEqual((result["repaired"], result["unrepaired"]), (1, []))
+        self.assertEqual(reconciliation.check([self.bus.id]), [])
+        bus = BusModel.objects.get()
+        self.assertEqual((bus.availableSeats, bus.seatVersion), ([3, 4], version + 1))
+        self.assertEqual([route.bookedSeats for route in bus.routes.order_by("stopOrder")], [[1, 2], [], []])
+
+    def test_double_booking_is_reported_and_left_alone(self):
+        first = self.ticket([1])
+        second = self.ticket([1, 2], from_stop="Vellore")
+        problems = reconciliation.check([self.bus.id])
+        self.assertIn({"busId": self.bus.id, "kind": reconciliation.DOUBLE_BOOKED, "ticketId": second.ticketId,
+                       "seats": [1]}, problems)
+
+        result = reconciliation.reconcile_chunk([self.bus.id], fix=True)
+        self.assertEqual(self.kinds(result["unrepaired"]), [reconciliation.DOUBLE_BOOKED])
+        self.assertEqual(self.kinds(reconciliation.check([self.bus.id])), [reconciliation.DOUBLE_BOOKED])
+        self.assertEqual(set(TicketModel.objects.values_list("ticketId", flat=True)),
+                         {first.ticketId, second.ticketId})
+
+    def test_seats_outside_the_bus_are_reported(self):
+        ticket = self.ticket([2, 9])
+        result = reconciliation.reconcile_chunk([self.bus.id], fix=True)
+        self.assertEqual(result["unrepaired"], [{"busId": self.bus.id, "kind": reconciliation.INVALID_SEATS,
+                                                 "ticketId": ticket.ticketId, "seats": [9]}])
+        bus = BusModel.objects.get()
+        self.assertEqual((bus.bookedSeats, bus.availableSeats), ([2, 9], [1, 3, 4]))
+        self.assertEqual([route.bookedSeats for route in bus.routes.order_by("stopOrder")], [[2], [2], []])
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CompanyModel.objects.create(busCompany="KPN")
+        cls.customer = UserModel.objects.create(user=User.objects.create_user("alice"))
+        cls.completed = cls.bus(1, date.today() - timedelta(days=1))
+        cls.upcoming = cls.bus(2, date.today() + timedelta(days=1))
+
+    @classmethod
+    def bus(cls, number, day):
+        bus = BusModel.objects.create(busNo=number, busCompany=cls.company, totalSeats=4, fromWhere="Chennai",
+                                      toWhere="Vellore", boardingTime="Morning", date=day, perSeatPrice=100)
+        for order, name in enumerate(["Chennai", "Vellore"]):
+            RouteModel.objects.create(bus=bus, stopName=name, stopOrder=order)
+        ticket = TicketModel.objects.create(customer=cls.customer, bus=bus, seatNumbers=[1, 2], fromStop="Chennai",
+                                            toStop="Vellore")
+        PaymentModel.objects.create(customer=cls.customer, ticket=ticket, paymentStatus="Pending")
+        PaymentModel.objects.create(customer=cls.customer, ticket=ticket, paymentStatus="Paid")
+        return bus
+
+    def test_completed_trips_move_to_the_archive(self):
+        ticket = TicketModel.objects.get(bus=self.completed)
+        payment_ids = set(PaymentModel.objects.filter(ticket=ticket).values_list("id", flat=True))
+        self.assertEqual(archive_completed_trips(), 1)
+
+        archived = ArchivedBusModel.objects.get()
+        self.assertEqual((archived.busId, archived.stops), (self.completed.id, ["Chennai", "Vellore"]))
+        archived_ticket = ArchivedTicketModel.objects.get()
+        self.assertEqual((archived_ticket.ticketId, archived_ticket.bus, archived_ticket.seatNumbers,
+                          archived_ticket.ticketPrice, archived_ticket.paymentStatus),
+                         (ticket.ticketId, archived, [1, 2], 200, "Paid"))
+        self.assertEqual(set(archived_ticket.payments.values_list("paymentId", flat=True)), payment_ids)
+
+        self.assertEqual(list(BusModel.objects.values_list("id", flat=True)), [self.upcoming.id])
+        self.assertFalse(RouteModel.objects.filter(bus_id=self.completed.id).exists())
+        self.assertFalse(TicketModel.objects.filter(ticketId=ticket.ticketId).exists())
+        self.assertFalse(PaymentModel.objects.filter(id__in=payment_ids).exists())
+        self.assertEqual(archive_completed_trips(), 0)
+
+    def test_batch_reads_its_journeys_once(self):
+        self.bus(3, date.today() - timedelta(days=2))
+        with mock.patch("GreenBus_App.signals.availability.journeys", return_value=set()) as journeys:
+            self.assertEqual(archive_batch(date.today(), 10), 2)
+        journeys.assert_called_once()
+
+
+class ArchiveLockTests(TransactionTestCase):
+    def test_locked_bus_is_skipped(self):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        locked, free = (BusModel.objects.create(busNo=number, busCompany=company, totalSeats=4, fromWhere="Chennai",
+                                                toWhere="Vellore", boardingTime="Morning",
+                                                date=date.today() - timedelta(days=1)) for number in (1, 2))
+        holding, release = threading.Event(), threading.Event()
+
+        def booking():
+            with transaction.atomic():
+                BusModel.objects.select_for_update().get(id=locked.id)
+                holding.set()
+                release.wait(10)
+            connection.close()
+
+        thread = threading.Thread(target=booking)
+        thread.start()
+        try:
+            self.assertTrue(holding.wait(10))
+            self.assertEqual(archive_batch(date.today(), 10), 1)
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(list(ArchivedBusModel.objects.values_list("busId", flat=True)), [free.id])
+        self.assertEqual(list(BusModel.objects.values_list("id", flat=True)), [locked.id])
+
+
+class AdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        cls.buses = []
+        for number in (11, 12):
+            bus = BusModel.objects.create(busNo=number, busCompany=company, totalSeats=4, perSeatPrice=100,
+                                          fromWhere="Chennai", toWhere="Vellore", boardingTime="Morning",
+                                          date=date.today() + timedelta(days=1))
+            for order, name in enumerate(["Chennai", "Vellore"]):
+                RouteModel.objects.create(bus=bus, stopName=name, stopOrder=order)
+            cls.buses.append(bus)
+        cls.customer = UserModel.objects.create(user=User.objects.create_user("alice"))
+        cls.tickets = [TicketModel.objects.create(customer=cls.customer, bus=cls.buses[0], seatNumbers=[seat],
+                                                  fromStop="Chennai", toStop="Vellore") for seat in (1, 2, 3)]
+        for bus in cls.buses:
+            bus.update_seat_status()
+        rebuild()
+
+    def bus_admin(self):
+        model_admin = BusAdmin(BusModel, admin.site)
+        model_admin.message_user = mock.Mock()
+        return model_admin
+
+    def test_block_seats(self):
+        model_admin = self.bus_admin()
+        version = BusModel.objects.get(id=self.buses[1].id).seatVersion
+        model_admin.block_seats(RequestFactory().post("/", {"seats": "2, 9,3"}), BusModel.objects.filter(busNo=12))
+        bus = BusModel.objects.get(id=self.buses[1].id)
+        self.assertEqual((bus.blockedSeats, bus.availableSeats, bus.seatVersion), ([2, 3], [1, 4], version + 1))
+
+        model_admin.block_seats(RequestFactory().post("/", {"seats": "0,x"}), BusModel.objects.filter(busNo=12))
+        self.assertEqual(model_admin.message_user.call_args.args[2], messages.ERROR)
+        self.assertEqual(BusModel.objects.get(id=bus.id).blockedSeats, [2, 3])
+
+    def waitlist_entry(self, status, ticket=None):
+        return WaitlistModel.objects.create(bus=self.buses[0], customer=self.customer, fromStop="Chennai",
+                                            toStop="Vellore", fromStopOrder=0, toStopOrder=1, seatCount=1,
+                                            status=status, ticket=ticket)
+
+    def test_cancel_trips(self):
+        waiting, held = self.waitlist_entry("Waiting"), self.waitlist_entry("Held", self.tickets[0])
+        confirmed = self.waitlist_entry("Confirmed", self.tickets[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bus_admin().cancel_trips(mock.Mock(), BusModel.objects.filter(busNo=11))
+        self.assertEqual(dict(WaitlistModel.objects.values_list("id", "status")),
+                         {waiting.id: "Cancelled", held.id: "Cancelled", confirmed.id: "Confirmed"})
+        events = OutboxEvent.objects.filter(eventType="waitlist.cancelled").order_by("id")
+        self.assertEqual([(event.payload["waitlist_id"], event.payload["status"], event.payload["ticket_id"])
+                          for event in events],
+                         [(waiting.id, "Cancelled", None), (held.id, "Cancelled", self.tickets[0].ticketId)])
+        self.assertEqual(notifications_for(events[0])[0].kind, "waitlist_cancelled")
+        bus = BusModel.objects.get(id=self.buses[0].id)
+        self.assertEqual((bus.blockedSeats, bus.bookedSeats, bus.availableSeats), ([1, 2, 3, 4], [], []))
+        self.assertFalse(TicketModel.objects.exists())
+        event = OutboxEvent.objects.get(eventType="trip.cancelled")
+        self.assertEqual(event.busId, bus.id)
+        self.assertEqual(len(event.payload["tickets"]), 3)
+        self.assertEqual(BusDayRollup.objects.filter(busId=bus.id).values_list("ticketsSold", "cancellations")
+                         .get(), (0, 3))
+
+    def test_mark_tickets_paid_pays_each_ticket_once(self):
+        pending, missing, paid = self.tickets
+        PaymentModel.objects.create(customer=self.customer, ticket=pending)
+        PaymentModel.objects.create(customer=self.customer, ticket=paid, paymentStatus="Paid")
+        held = self.waitlist_entry("Held", missing)
+
+        self.assertEqual(mark_tickets_paid(TicketModel.objects.all()), 2)
+        self.assertEqual(mark_tickets_paid(TicketModel.objects.all()), 0)
+        self.assertEqual(sorted(PaymentModel.objects.values_list("ticket_id", "paymentStatus")),
+                         [(ticket.ticketId, "Paid") for ticket in self.tickets])
+        self.assertEqual(sorted(OutboxEvent.objects.filter(eventType="payment.paid")
+                                .values_list("payload__ticketId", flat=True)), [pending.ticketId, missing.ticketId])
+        self.assertEqual(BusDayRollup.objects.get(busId=self.buses[0].id).paidRevenue, 200)
+        held.refresh_from_db()
+        self.assertEqual(held.status, "Confirmed")
+
+    def test_estimated_count_for_unfiltered_changelists(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE "Bus Routes"')
+        with mock.patch.object(EstimatedCountPaginator, "estimate_above", 0), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(EstimatedCountPaginator(RouteModel.objects.all(), 2).count, 4)
+        self.assertEqual(len(queries), 1)
+        self.assertIn("reltuples", queries[0]["sql"])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(EstimatedCountPaginator(RouteModel.objects.filter(stopName="Chennai"), 2).count, 2)
+            self.assertEqual(EstimatedCountPaginator(RouteModel.objects.all(), 2).count, 4)
+        self.assertEqual(["COUNT(" in query["sql"] for query in queries], [True, False, True])
+
+    def test_search_uses_exact_lookups(self):
+        ticket_admin = TicketAdmin(TicketModel, admin.site)
+        tickets = TicketModel.objects.all()
+
+        def search(term):
+            results, may_have_duplicates = ticket_admin.get_search_results(None, tickets, term)
+            self.assertFalse(may_have_duplicates)
+            return sorted(results.values_list("ticketId", flat=True))
+
+        every = [ticket.ticketId for ticket in self.tickets]
+        self.assertEqual(search(f" {self.tickets[1].ticketId} "), [self.tickets[1].ticketId])
+        self.assertEqual(search("11"), every)
+        self.assertEqual(search("alice"), every)
+        self.assertEqual(search("ali"), [])
+        self.assertEqual(search(""), every)
+        self.assertFalse(BusAdmin(BusModel, admin.site).get_search_results(None, BusModel.objects.all(), "KPN")[0])
+
+
+class MarkTicketsPaidLockTests(TransactionTestCase):
+    def test_waits_for_a_payment_in_progress(self):
+        company = CompanyModel.objects.create(busCompany="KPN")
+        bus = BusModel.objects.create(busNo=1, busCompany=company, totalSeats=4, fromWhere="Chennai",
+                                      toWhere="Vellore", boardingTime="Morning", date=date.today() + timedelta(days=1))
+        customer = UserModel.objects.create(user=User.objects.create_user("alice"))
+        ticket = TicketModel.objects.create(customer=customer, bus=bus, seatNumbers=[1], fromStop="Chennai",
+                                            toStop="Vellore")
+        payment = PaymentModel.objects.create(customer=customer, ticket=ticket)
+        holding = threading.Event()
+
+        def make_payment():
+            with transaction.atomic():
+                TicketModel.objects.select_for_update().get(ticketId=ticket.ticketId)
+                holding.set()
+                time.sleep(0.3)
+                PaymentModel.objects.filter(id=payment.id).update(paymentStatus="Paid")
+            connection.close()
+
+        thread = threading.Thread(target=make_payment)
+        thread.start()
+        try:
+            self.assertTrue(holding.wait(10))
+            self.assertEqual(mark_tickets_paid(TicketModel.objects.all()), 0)
+        finally:
+            thread.join()
+        self.assertFalse(OutboxEvent.objects.filter(eventType="payment.paid").exists())
+
+
+def passing_warmup_step():
+    pass
+
+
+def failing_warmup_step():
+    raise OperationalError("database unreachable")
+
+
+WARMUP_TEST_STEPS = ["GreenBus_App.tests.failing_warmup_step", "GreenBus_App.tests.passing_warmup_step"]
+
+
+@override_settings(WARMUP_ENABLED=True, WARMUP_STEPS=WARMUP_TEST_STEPS)
+class WarmupTests(SimpleTestCase):
+    def test_failing_step_is_logged_and_skipped(self):
+        with self.assertLogs("GreenBus.warmup") as logs:
+            timings = warm_up()
+        self.assertEqual(list(timings), WARMUP_TEST_STEPS)
+        self.assertIsNone(timings[WARMUP_TEST_STEPS[0]])
+        self.assertGreaterEqual(timings[WARMUP_TEST_STEPS[1]], 0)
+        self.assertIn("failing_warmup_step failed", logs.output[0])
+
+    @override_settings(WARMUP_STEPS=WARMUP_TEST_STEPS[1:])
+    def test_steps_are_timed(self):
+        with mock.patch("GreenBus.warmup.time.perf_counter", side_effect=[1.0, 1.25]):
+            self.assertEqual(warm_up(), {WARMUP_TEST_STEPS[1]: 250.0})
+
+    @override_settings(WARMUP_ENABLED=False)
+    def test_disabled(self):
+        with mock.patch("GreenBus_App.tests.passing_warmup_step") as step:
+            self.assertEqual(warm_up(), {})
+        step.assert_not_called()
+
+    def test_greenbus_warmup_env_sets_warmup_enabled(self):
+        for value, enabled in (("0", False), ("1", True)):
+            with mock.patch.dict(os.environ, {"GREENBUS_WARMUP": value}):
+                self.assertEqual(importlib.reload(greenbus_settings).WARMUP_ENABLED, enabled)
+
+
+class MeasureStartupTests(SimpleTestCase):
+    def test_reports_medians(self):
+        runs = [{"bootMs": boot, "requestMs": {"/": request}} for boot, request in ((900, 30), (700, 10), (800, 20))]
+        out = StringIO()
+        with mock.patch.object(MeasureStartupCommand, "_run_child", side_effect=runs):
+            call_command("measure_startup", "--runs", "3", "--path", "/", "--json", stdout=out)
+        self.assertEqual(json.loads(out.getvalue()), {"warmup": True, "runs": 3,
+                                                      "medianMs": {"boot": 800, "/": 20}})
+
+    def test_needs_a_run(self):
+        with self.assertRaisesMessage(CommandError, "--runs must be at least 1."):
+            call_command("measure_startup", "--runs", "0")
+
+
+class DBPoolStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+        cls.customer = User.objects.create_user("customer")
+
+    def get(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get("/api/metrics/db-pool/")
+
+    def test_admin_only(self):
+        self.assertEqual(APIClient().get("/api/metrics/db-pool/").status_code, 401)
+        self.assertEqual(self.get(self.customer).status_code, 403)
+
+    def test_pooled_alias(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {"pool_size": 5, "pool_available": 2, "requests_waiting": 1,
+                                       "requests_num": 40, "requests_queued": 3, "requests_wait_ms": 12,
+                                       "requests_errors": 0, "connections_num": 6}
+        options = {"OPTIONS": {"pool": {"max_size": 5}}}
+        with mock.patch.dict(connections.settings["default"], options), \
+                mock.patch.object(type(connections["default"]), "pool", new_callable=mock.PropertyMock,
+                                  return_value=pool):
+            response = self.get(self.staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["default"], {
+            "pooled": True, "size": 5, "available": 2, "inUse": 3, "waiting": 1, "requests": 40,
+            "queuedRequests": 3, "waitMs": 12, "timeouts": 0, "connectionsOpened": 6,
+        })
+
+    def test_unpooled_alias(self):
+        with mock.patch.dict(connections.settings["default"], {"OPTIONS": {}}):
+            response = self.get(self.staff)
+        self.assertEqual(response.data["default"], {"pooled": False})
@@ -0,0 +1,125 @@
+"""
+Token-bucket throttles for the hot customer endpoints.
+
+Rates come from ``REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]`` in DRF's
+``"<requests>/<period>"`` form: the bucket holds that many requests and
+refills continuously over the period, so short bursts pass while sustained
+load is held to the rate. Buckets live in process memory behind a lock,
+which keeps the check well under a millisecond; each worker process
+enforces its own share. DRF turns ``wait()`` into the ``Retry-After``
+header of the 429 response.
+
+Per-address buckets key on DRF's ``get_ident``, which trusts only as many
+``X-Forwarded-For`` hops as ``REST_FRAMEWORK["NUM_PROXIES"]`` says there are
+proxies, so a client cannot pick a fresh bucket by rewriting the header.
+"""
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+
+class BucketStore:
+    """
+    ``key -> (tokens, updated_at)`` for every active client, least recently used first.
+
+    Past ``max_keys`` buckets, the least recently used ones are dropped in one go down to
+    ``low_water`` of ``max_keys``, so eviction costs O(1) per request on average. The oldest buckets
+    have had the longest to refill, so a dropped bucket is usually full anyway.
+    """
+
+    def __init__(self, max_keys=100_000, low_water=0.9):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.max_keys = max_keys
+        self.low_water = low_water
+
+    def take(self, key, capacity, refill_per_second):
+        """Take one token; returns ``0`` when allowed, otherwise the seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / refill_per_second
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._evict()
+        return wait
+
+    def _evict(self):
+        for _ in range(len(self._buckets) - int(self.max_keys * self.low_water)):
+            self._buckets.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+buckets = BucketStore()
+
+
+class TokenBucketThrottle(BaseThrottle, metaclass=ABCMeta):
+    scope = None
+
+    def __init__(self):
+        self.capacity, period = SimpleRateThrottle.parse_rate(None, api_settings.DEFAULT_THROTTLE_RATES[self.scope])
+        self.refill_per_second = self.capacity / period
+        self._wait = 0
+
+    @abstractmethod
+    def get_ident_key(self, request):
+        """The client the request is counted against, e.g. ``"ip:<address>"``."""
+
+    def allow_request(self, request, view):
+        key = f"{self.scope}:{self.get_ident_key(request)}"
+        self._wait = buckets.take(key, self.capacity, self.refill_per_second)
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+class UserBucketThrottle(TokenBucketThrottle):
+    """One bucket per authenticated user; anonymous requests share their address's bucket."""
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+
+class IPBucketThrottle(TokenBucketThrottle):
+    def get_ident_key(self, request):
+        return f"ip:{self.get_ident(request)}"
+
+
+class SearchUserThrottle(UserBucketThrottle):
+    scope = "search_user"
+
+
+class SearchIPThrottle(IPBucketThrottle):
+    scope = "search_ip"
+
+
+class BookingUserThrottle(UserBucketThrottle):
+    scope = "booking_user"
+
+
+class BookingIPThrottle(IPBucketThrottle):
+    scope = "booking_ip"
+
+
+class SeatsIPThrottle(IPBucketThrottle):
+    scope = "seats_ip"
+
+
+class AutocompleteIPThrottle(IPBucketThrottle):
+    scope = "autocomplete_ip"
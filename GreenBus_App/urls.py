@@ -2,8 +2,9 @@ from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 from GreenBus_App.views import (
     CompanyViewSet, BusViewSet, UserViewSet, TicketViewSet, PaymentViewSet, RouteViewSet,
-    login_view, cancel_ticket, get_bus_routes, register_user,
-    customer_search_buses, customer_book_seat, make_payment, customer_view_tickets, get_available_seats
+    login_view, cancel_ticket, get_bus_routes, register_user, db_pool_stats, export_tickets, analytics_rollups,
+    customer_search_buses, customer_search_calendar, customer_plan_journey, autocomplete_stops, customer_book_seat, make_payment, customer_view_tickets, get_available_seats,
+    customer_view_waitlist, join_waitlist, leave_waitlist, ticket_document
 )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
@@ -19,13 +20,23 @@ urlpatterns = [
     path('api/', include(router.urls)),
     path("customer/available-seats/", get_available_seats, name="get-available-seats"),
     path("customer/search_buses/", customer_search_buses, name="customer_search_buses"),
+    path("customer/search_calendar/", customer_search_calendar, name="customer_search_calendar"),
+    path("customer/plan_journey/", customer_plan_journey, name="customer_plan_journey"),
+    path("customer/stops/autocomplete/", autocomplete_stops, name="autocomplete-stops"),
     path("customer/book_seat/", customer_book_seat, name="customer_book_seat"),
     path("customer/make_payment/", make_payment, name="customer_make_payment"),
     path("customer/view_tickets/", customer_view_tickets, name="customer_view_tickets"),
     path('customer/cancel-ticket/', cancel_ticket, name='cancel-ticket'),
+    path("customer/tickets/<int:ticket_id>/document/", ticket_document, name="customer_ticket_document"),
+    path("customer/waitlist/", customer_view_waitlist, name="customer_view_waitlist"),
+    path("customer/waitlist/join/", join_waitlist, name="customer_join_waitlist"),
+    path("customer/waitlist/leave/", leave_waitlist, name="customer_leave_waitlist"),
     path('api/login/', login_view, name='login'),
     path('api/get-bus-routes/', get_bus_routes, name='get-bus-routes'),
     path('api/register/', register_user, name='customer-register'),
+    path('api/metrics/db-pool/', db_pool_stats, name='db-pool-stats'),
+    path('api/exports/tickets/', export_tickets, name='export-tickets'),
+    path('api/analytics/rollups/', analytics_rollups, name='analytics-rollups'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
@@ -1,18 +1,33 @@
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.db.models import F, OuterRef, Subquery
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, status
 from rest_framework.authtoken.admin import User
 from rest_framework.authtoken.models import Token
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.db import transaction
 
-from GreenBus_App.models import BusModel, UserModel, TicketModel, PaymentModel, CompanyModel, RouteModel
+from GreenBus_App import availability, notifications, outbox, rollups, waitlist
+from GreenBus_App.authentication import GreenBusRefreshToken, get_profile_id
+from GreenBus_App.exports import EXPORT_FORMATS, aexport_lines, ticket_export_rows
+from GreenBus_App.inventory import SeatInventory, mask_to_seats
+from GreenBus_App.journey_planner import planner
+from GreenBus_App.models import BusModel, UserModel, TicketModel, PaymentModel, CompanyModel, RouteModel, \
+    ArchivedTicketModel, WaitlistModel
+from GreenBus_App.pagination import JSONLinesListMixin, KeysetPagination
+from GreenBus_App.seat_maps import encode_seats, not_modified, seat_etag, wants_bitset, with_etag
 from GreenBus_App.serializers import BusSerializer, UserSerializer, TicketSerializer, PaymentSerializer, \
-    CompanySerializer, RouteSerializer
+    CompanySerializer, RouteSerializer, WaitlistSerializer, archived_ticket_rows, bus_rows, ticket_rows, \
+    with_payment_status
+from GreenBus_App.stop_index import stop_index
+from GreenBus_App.throttling import AutocompleteIPThrottle, BookingIPThrottle, BookingUserThrottle, \
+    SearchIPThrottle, SearchUserThrottle, SeatsIPThrottle
 
 
 class CompanyViewSet(viewsets.ModelViewSet):
@@ -20,7 +35,7 @@ class CompanyViewSet(viewsets.ModelViewSet):
     serializer_class = CompanySerializer
     permission_classes=[IsAdminUser]
 
-class BusViewSet(viewsets.ModelViewSet):
+class BusViewSet(JSONLinesListMixin, viewsets.ModelViewSet):
     queryset = BusModel.objects.all()
     serializer_class = BusSerializer
     permission_classes = [IsAuthenticated]  # Allows any logged-in user
@@ -32,23 +47,103 @@ class UserViewSet(viewsets.ModelViewSet):
     permission_classes=[IsAdminUser]
 
 
-class TicketViewSet(viewsets.ModelViewSet):
+class TicketViewSet(JSONLinesListMixin, viewsets.ModelViewSet):
     queryset = TicketModel.objects.all()
     serializer_class = TicketSerializer
     permission_classes=[IsAdminUser]
 
+    def get_queryset(self):
+        return with_payment_status(super().get_queryset())
+
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(JSONLinesListMixin, viewsets.ModelViewSet):
     queryset = PaymentModel.objects.all()
     serializer_class = PaymentSerializer
     permission_classes=[IsAdminUser]
 
 
-class RouteViewSet(viewsets.ModelViewSet):
+class RouteViewSet(JSONLinesListMixin, viewsets.ModelViewSet):
     queryset = RouteModel.objects.all()
     serializer_class = RouteSerializer
     permission_classes=[IsAdminUser]
 
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def db_pool_stats(request):
+    """Connection pool metrics per database alias; ``inUse`` = open connections not idle in the pool."""
+    stats = {}
+    for alias in connections:
+        if not connections.settings[alias].get("OPTIONS", {}).get("pool"):
+            stats[alias] = {"pooled": False}
+            continue
+        pool_stats = connections[alias].pool.get_stats()
+        stats[alias] = {
+            "pooled": True,
+            "size": pool_stats.get("pool_size", 0),
+            "available": pool_stats.get("pool_available", 0),
+            "inUse": pool_stats.get("pool_size", 0) - pool_stats.get("pool_available", 0),
+            "waiting": pool_stats.get("requests_waiting", 0),
+            "requests": pool_stats.get("requests_num", 0),
+            "queuedRequests": pool_stats.get("requests_queued", 0),
+            "waitMs": pool_stats.get("requests_wait_ms", 0),
+            "timeouts": pool_stats.get("requests_errors", 0),
+            "connectionsOpened": pool_stats.get("connections_num", 0),
+        }
+    return Response(stats)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def export_tickets(request):
+    """Stream every ticket with its bus, company and latest payment status as CSV or JSON lines."""
+    export_format = request.GET.get("exportFormat", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return Response({"error": "exportFormat must be csv or jsonl."}, status=400)
+
+    filters, error = _report_filters(request)
+    if error:
+        return error
+
+    rows = ticket_export_rows(*filters)
+    content_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    response = StreamingHttpResponse(aexport_lines(export_format, rows), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="tickets.{export_format}"'
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def analytics_rollups(request):
+    """Occupancy and revenue from the rollup tables, grouped by ``groupBy`` (date, company, bus or segment)."""
+    group_by = request.GET.get("groupBy", "date")
+    if group_by not in rollups.GROUPINGS:
+        return Response({"error": f"groupBy must be one of {', '.join(rollups.GROUPINGS)}."}, status=400)
+
+    filters, error = _report_filters(request)
+    if error:
+        return error
+    return Response(rollups.summary(group_by, *filters))
+
+
+def _report_filters(request):
+    """``(dateFrom, dateTo, busCompany)`` query parameters for the admin reports, or an error response."""
+    dates = []
+    for param in ("dateFrom", "dateTo"):
+        value = request.GET.get(param)
+        try:
+            parsed = parse_date(value) if value else None
+        except ValueError:
+            parsed = None
+        if value and parsed is None:
+            return None, Response({"error": f"{param} must be a valid YYYY-MM-DD date."}, status=400)
+        dates.append(parsed)
+
+    company_id = request.GET.get("busCompany")
+    if company_id and not company_id.isdigit():
+        return None, Response({"error": "busCompany must be a company id."}, status=400)
+    return (*dates, company_id), None
+
+
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def register_user(request):
@@ -66,7 +161,7 @@ def register_user(request):
 
         UserModel.objects.create(user=user, is_customer=True)
 
-        refresh = RefreshToken.for_user(user)
+        refresh = GreenBusRefreshToken.for_user(user)
         access_token = str(refresh.access_token)
 
         return Response(
@@ -91,7 +186,7 @@ def login_view(request):
     user = authenticate(username=username, password=password)
 
     if user:
-        refresh = RefreshToken.for_user(user)
+        refresh = GreenBusRefreshToken.for_user(user)
         access_token = str(refresh.access_token)
 
         return Response(
@@ -105,15 +200,19 @@ def login_view(request):
 
     return Response({"error": "Invalid credentials"}, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(["POST"])
+@api_view(["GET", "POST"])
 @permission_classes([AllowAny])
+@throttle_classes([SeatsIPThrottle])
 def get_available_seats(request):
     """
     Fetches the available seats for a bus journey between two stops.
+    Parameters come from the body (POST) or the query string (GET); see seat_maps for the
+    compact format and ETag handling.
     """
-    bus_id = request.data.get("busId")
-    from_where = request.data.get("fromWhere")
-    to_where = request.data.get("toWhere")
+    params = request.data if request.method == "POST" else request.query_params
+    bus_id = params.get("busId")
+    from_where = params.get("fromWhere")
+    to_where = params.get("toWhere")
 
     if not bus_id:
         return Response({"error": "busId is required."}, status=400)
@@ -122,9 +221,15 @@ def get_available_seats(request):
 
     try:
         bus = BusModel.objects.get(id=bus_id)
-    except BusModel.DoesNotExist:
+    except (BusModel.DoesNotExist, ValueError):
         return Response({"error": "Bus not found."}, status=404)
 
+    bitset = wants_bitset(request)
+    etag = seat_etag(bus.id, bus.seatVersion, from_where, to_where, bitset)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
     # Fetch the ordered route stops
     route_stops = bus.routes.order_by("stopOrder")
     stop_names = [stop.stopName for stop in route_stops]
@@ -145,16 +250,22 @@ def get_available_seats(request):
     # Available seats = Total seats - booked seats (for this segment) - blocked seats
     available_seats = sorted(all_seats - booked_seats - blocked_seats)
 
-    return Response({
+    data = {
         "busId": bus.id,
         "fromWhere": from_where,
         "toWhere": to_where,
-        "availableSeats": available_seats
-    })
+    }
+    if bitset:
+        data["totalSeats"] = bus.totalSeats
+        data["availableSeatMap"] = encode_seats(available_seats, bus.totalSeats)
+    else:
+        data["availableSeats"] = available_seats
+    return with_etag(Response(data), etag)
 
 
 
 @api_view(["GET"])
+@throttle_classes([SearchUserThrottle, SearchIPThrottle])
 def customer_search_buses(request):
     """Search available buses between two stops with correct seat availability."""
     from_stop = request.GET.get("fromWhere")
@@ -168,28 +279,101 @@ def customer_search_buses(request):
     if bus_company:
         buses = buses.filter(busCompany=bus_company)
 
-    valid_buses = []
+    # First occurrence of each stop on the bus's route, as in get_booked_seats.
+    def stop_order(stop_name):
+        return Subquery(RouteModel.objects.filter(bus=OuterRef("pk"), stopName=stop_name)
+                        .order_by("stopOrder").values("stopOrder")[:1])
+
+    buses = buses.annotate(from_order=stop_order(from_stop), to_order=stop_order(to_stop)) \
+        .filter(from_order__lt=F("to_order"))
+    paginator = KeysetPagination()
+    valid_buses = paginator.paginate_queryset(buses, request)
+    page_links = (paginator.has_next, paginator.has_previous) if paginator.paginated else ()
+
+    bitset = wants_bitset(request)
+    etag = seat_etag([(bus.id, bus.seatVersion) for bus in valid_buses], *page_links, from_stop, to_stop, bitset)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    for bus in valid_buses:
+        booked_seats = set(bus.booked_seats_between(bus.from_order, bus.to_order))
+        blocked_seats = set(bus.blockedSeats)
+        all_seats = set(range(1, bus.totalSeats + 1))
+
+        bus.availableSeats = sorted(all_seats - booked_seats - blocked_seats)
+        bus.bookedSeats = sorted(booked_seats)
+
+    data = bus_rows(valid_buses)
+    if bitset:
+        for item in data:
+            item["availableSeatMap"] = encode_seats(item.pop("availableSeats"), item["totalSeats"])
+    return with_etag(paginator.get_paginated_response(data), etag)
+
+
+@api_view(["GET"])
+@throttle_classes([SearchUserThrottle, SearchIPThrottle])
+def customer_plan_journey(request):
+    """Plan journeys between two stops with up to ``maxTransfers`` changes of bus."""
+    from_stop = request.GET.get("fromWhere")
+    to_stop = request.GET.get("toWhere")
+
+    if not from_stop or not to_stop:
+        return Response({"error": "Both fromWhere and toWhere are required."}, status=400)
+
+    try:
+        journey_date = parse_date(request.GET.get("date", ""))
+        max_transfers = int(request.GET.get("maxTransfers", 1))
+        seats = int(request.GET.get("seats", 1))
+        window_days = int(request.GET.get("days", 1))
+    except ValueError:
+        return Response({"error": "Invalid query parameters."}, status=400)
+
+    if not journey_date:
+        return Response({"error": "date is required in YYYY-MM-DD format."}, status=400)
+    if not 0 <= max_transfers <= 3 or not 1 <= window_days <= 7 or seats < 1:
+        return Response({"error": "maxTransfers must be 0-3, days 1-7 and seats at least 1."}, status=400)
 
-    for bus in buses.distinct():
-        route_stops = bus.routes.order_by("stopOrder")
-        stop_names = [stop.stopName for stop in route_stops]
+    journeys = planner.plan(from_stop, to_stop, journey_date, max_transfers=max_transfers, seats=seats,
+                            window_days=window_days)
+    return Response({"fromWhere": from_stop, "toWhere": to_stop, "journeys": journeys})
 
-        if from_stop in stop_names and to_stop in stop_names:
-            from_index = stop_names.index(from_stop)
-            to_index = stop_names.index(to_stop)
 
-            if from_index < to_index:
-                booked_seats = set(bus.get_booked_seats(from_stop, to_stop))
-                blocked_seats = set(bus.blockedSeats)
-                all_seats = set(range(1, bus.totalSeats + 1))
+@api_view(["GET"])
+@throttle_classes([SearchUserThrottle, SearchIPThrottle])
+def customer_search_calendar(request):
+    """Per-day trips, lowest fare and most free seats between two stops over ``dateFrom``..``dateTo``."""
+    from_stop = request.GET.get("fromWhere")
+    to_stop = request.GET.get("toWhere")
+    if not from_stop or not to_stop:
+        return Response({"error": "Both fromWhere and toWhere are required."}, status=400)
 
-                bus.availableSeats = sorted(all_seats - booked_seats - blocked_seats)
-                bus.bookedSeats = sorted(booked_seats)
+    try:
+        date_from = parse_date(request.GET.get("dateFrom", ""))
+        date_to = parse_date(request.GET.get("dateTo", ""))
+    except ValueError:
+        date_from = date_to = None
+    if not date_from or not date_to:
+        return Response({"error": "dateFrom and dateTo are required in YYYY-MM-DD format."}, status=400)
+    if not 0 <= (date_to - date_from).days < availability.MAX_CALENDAR_DAYS:
+        return Response({"error": f"dateTo must be on or after dateFrom and at most "
+                                  f"{availability.MAX_CALENDAR_DAYS} days in total."}, status=400)
 
-                valid_buses.append(bus)
+    days = availability.calendar(from_stop, to_stop, date_from, date_to)
+    return Response({"fromWhere": from_stop, "toWhere": to_stop, "days": days})
 
-    serializer = BusSerializer(valid_buses, many=True)
-    return Response(serializer.data)
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+@throttle_classes([AutocompleteIPThrottle])
+def autocomplete_stops(request):
+    """Suggest stop names for a partially typed ``q``; an empty ``q`` lists the busiest stops."""
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        return Response({"error": "limit must be a number."}, status=400)
+
+    return Response(stop_index.search(request.GET.get("q", ""), limit=limit))
 
 from django.db import transaction
 from django.shortcuts import get_object_or_404
@@ -197,51 +381,71 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from GreenBus_App.booking_queue import NOT_ENOUGH_SEATS, BookingRejected, QueueFull, admission, invalid_seats
 from GreenBus_App.models import BusModel, TicketModel, UserModel
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([BookingUserThrottle, BookingIPThrottle])
 def customer_book_seat(request):
     try:
-        user = request.user
-        user_model = UserModel.objects.filter(user=user).first()
+        profile_id = get_profile_id(request.user)
 
-        if not user_model:
+        if not profile_id:
             return Response({"error": "Only registered customers can book seats."}, status=status.HTTP_403_FORBIDDEN)
 
         bus_id = request.data.get("bus_id")
         seat_numbers = request.data.get("seat_numbers", [])
+        seat_count = request.data.get("seat_count")  # without seat_numbers: assign this many seats automatically
         from_stop = request.data.get("from_stop")
         to_stop = request.data.get("to_stop")
 
-        if not bus_id:
+        if not str(bus_id).isdigit():
             return Response({"error": "Bus ID is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if (not isinstance(seat_numbers, list) or not all(type(seat) is int and seat > 0 for seat in seat_numbers)
+                or len(set(seat_numbers)) != len(seat_numbers)):
+            return Response({"error": "seat_numbers must be a list of distinct seat numbers."},
+                            status=status.HTTP_400_BAD_REQUEST)
         if not seat_numbers:
-            return Response({"error": "At least one seat must be selected."}, status=status.HTTP_400_BAD_REQUEST)
+            if not str(seat_count).isdigit() or int(seat_count) < 1:
+                return Response({"error": "Select seat_numbers, or give a seat_count to have seats assigned."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            seat_count = int(seat_count)
         if not from_stop or not to_stop:
             return Response({"error": "Both from_stop and to_stop are required."}, status=status.HTTP_400_BAD_REQUEST)
 
+        if admission.enabled():
+            return _book_through_admission(int(bus_id), profile_id, seat_numbers, from_stop, to_stop, seat_count)
+
         with transaction.atomic():
             bus = get_object_or_404(BusModel.objects.select_for_update(), id=bus_id)
-            route_stops = bus.routes.order_by("stopOrder")
+            route_stops = list(bus.routes.order_by("stopOrder"))
             stop_names = [stop.stopName for stop in route_stops]
 
             if from_stop not in stop_names or to_stop not in stop_names:
                 return Response({"error": "Invalid stops selected."}, status=status.HTTP_400_BAD_REQUEST)
 
-            from_index = stop_names.index(from_stop)
-            to_index = stop_names.index(to_stop)
+            from_order = route_stops[stop_names.index(from_stop)].stopOrder
+            to_order = route_stops[stop_names.index(to_stop)].stopOrder
 
-            if from_index >= to_index:
+            if from_order >= to_order:
                 return Response({"error": "Invalid journey selection."}, status=status.HTTP_400_BAD_REQUEST)
 
+            invalid = invalid_seats(seat_numbers, bus.totalSeats)
+            if invalid:
+                return Response({"error": f"Seats {invalid} do not exist on this bus."},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            if not seat_numbers:
+                inventory = SeatInventory.for_routes(bus, route_stops)
+                seats = inventory.allocate(*inventory.interval(from_stop, to_stop), seat_count)
+                if not seats:
+                    return Response({"error": NOT_ENOUGH_SEATS.format(seat_count)}, status=status.HTTP_400_BAD_REQUEST)
+                seat_numbers = mask_to_seats(seats)
+
             # **Check seat availability only for the requested segment**
-            booked_seats = set()
-            for stop in route_stops:
-                if from_index <= stop.stopOrder < to_index:
-                    booked_seats.update(stop.bookedSeats)
+            booked_seats = set(bus.booked_seats_between(from_order, to_order))
 
             blocked_seats = set(bus.blockedSeats)
 
@@ -256,78 +460,98 @@ def customer_book_seat(request):
 
             # **Update RouteModel to mark the seats as booked for the specific segment**
             for stop in route_stops:
-                if from_index <= stop.stopOrder < to_index:
+                if from_order <= stop.stopOrder < to_order:
                     stop.bookedSeats = list(set(stop.bookedSeats) | set(seat_numbers))
                     stop.save(update_fields=["bookedSeats"])
 
             # Create the ticket
             ticket = TicketModel.objects.create(
-                customer=user_model,
+                customer_id=profile_id,
                 bus=bus,
                 seatNumbers=seat_numbers,
                 fromStop=from_stop,
                 toStop=to_stop,
             )
+            rollups.record_bookings(bus, route_stops, [ticket])
+            outbox.publish(outbox.ticket_booked(ticket, booked_seats | set(seat_numbers)))
 
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"bus_{bus_id}",
-                {
-                    "type": "seat_update",
-                    "data": {
-                        "bus_id": bus_id,
-                        "booked_seats": list(booked_seats | set(seat_numbers)),
-                        "message": f"Seats {seat_numbers} booked successfully",
-                    },
-                },
-            )
-
-        return Response(
-            {
-                "message": "Seat(s) booked successfully.",
-                "ticket_details": {
-                    "ticket_id": ticket.ticketId,
-                    "bus_no": bus.busNo,
-                    "bus_company": bus.busCompany.busCompany,
-                    "seat_numbers": seat_numbers,
-                    "from_stop": from_stop,
-                    "to_stop": to_stop,
-                    "journey_date": bus.date.strftime("%Y-%m-%d"),
-                    "price": ticket.ticketPrice,
-                },
-            },
-            status=status.HTTP_201_CREATED,
-        )
+        return _booking_response(ticket, bus)
 
     except Exception as e:
         return Response({"error": f"Booking failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _book_through_admission(bus_id, profile_id, seat_numbers, from_stop, to_stop, seat_count):
+    """Book via the bus's serialised worker (see ``GreenBus_App.booking_queue``)."""
+    try:
+        ticket = admission.submit(bus_id, profile_id, seat_numbers, from_stop, to_stop, seat_count)
+    except QueueFull:
+        return Response({"error": "Too many bookings for this bus right now. Please retry."},
+                        status=status.HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": "1"})
+    except BookingRejected as e:
+        return Response({"error": str(e)}, status=e.status_code)
+    except FutureTimeoutError:
+        return Response({"error": "Booking is still being processed. Check your tickets before retrying."},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return _booking_response(ticket, ticket.bus)
+
+
+def _booking_response(ticket, bus):
+    return Response(
+        {
+            "message": "Seat(s) booked successfully.",
+            "ticket_details": {
+                "ticket_id": ticket.ticketId,
+                "bus_no": bus.busNo,
+                "bus_company": bus.busCompany.busCompany,
+                "seat_numbers": ticket.seatNumbers,
+                "from_stop": ticket.fromStop,
+                "to_stop": ticket.toStop,
+                "journey_date": bus.date.strftime("%Y-%m-%d"),
+                "price": ticket.ticketPrice,
+            },
+        },
+        status=status.HTTP_201_CREATED,
+    )
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def cancel_ticket(request):
     try:
         ticket_id = request.data.get("ticket_id")
 
-        ticket = get_object_or_404(TicketModel, ticketId=ticket_id)
-        payment = PaymentModel.objects.filter(ticket=ticket).first()
+        bus_id = get_object_or_404(TicketModel, ticketId=ticket_id).bus_id
 
-        if not payment:
-            return Response({"error": "No payment found for this ticket."}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            # The bus row lock comes first, as in booking, so a cancellation queues behind the bookings
+            # instead of deadlocking with them on the routes; the ticket and payment are read under it.
+            bus = BusModel.objects.select_for_update().get(id=bus_id)
+            ticket = TicketModel.objects.select_for_update().filter(ticketId=ticket_id).first()
+            if ticket is None:
+                return Response({"error": "Ticket not found."}, status=status.HTTP_404_NOT_FOUND)
+            ticket.bus = bus
+            payment = PaymentModel.objects.select_for_update().filter(ticket=ticket).first()
+
+            if not payment:
+                return Response({"error": "No payment found for this ticket."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if payment.paymentStatus not in ["Pending", "Paid"]:
-            return Response({"error": "Ticket cannot be cancelled."}, status=status.HTTP_400_BAD_REQUEST)
+            if payment.paymentStatus not in ["Pending", "Paid"]:
+                return Response({"error": "Ticket cannot be cancelled."}, status=status.HTTP_400_BAD_REQUEST)
 
-        bus = ticket.bus
+            rollups.record_cancellation(ticket, was_paid=payment.paymentStatus == "Paid")
+            waitlist.release_ticket(ticket)
 
-        bus.release_seats(ticket.seatNumbers)
+            # Mark payment as cancelled
+            payment.paymentStatus = "Cancelled"
+            payment.save(update_fields=["paymentStatus"])
 
-        # Mark payment as cancelled
-        payment.paymentStatus = "Cancelled"
-        payment.save(update_fields=["paymentStatus"])
+            # Overlapping tickets cannot share a seat, so the rest of the journey's seats stay booked.
+            still_booked = set(bus.booked_seats_between(ticket.fromStopOrder, ticket.toStopOrder))
+            outbox.publish(outbox.ticket_cancelled(ticket, still_booked - set(ticket.seatNumbers)))
 
-        # Delete the ticket after releasing the seats
-        ticket.delete()
+            # Deleting the ticket releases its seats on the bus and on its hops
+            ticket.delete()
 
         return Response({"message": "Ticket cancelled successfully."}, status=status.HTTP_200_OK)
 
@@ -358,40 +582,56 @@ def make_payment(request):
         ticket = get_object_or_404(TicketModel, ticketId=ticket_id)
 
         # Ensure the logged-in user owns the ticket
-        if ticket.customer != request.user.profile:
+        if ticket.customer_id != get_profile_id(request.user):
             return Response({"error": "You are not authorized to make payment for this ticket."},
                             status=status.HTTP_403_FORBIDDEN)
 
-        # Check if a payment already exists
-        payment, created = PaymentModel.objects.get_or_create(
-            customer=ticket.customer,
-            ticket=ticket,
-            defaults={"paymentStatus": "Paid"}
-        )
-
-        if not created:
-            if payment.paymentStatus == "Paid":
-                return Response(
-                    {
-                        "message": "Payment has already been made for this ticket.",
-                        "payment_id": payment.id,
-                        "payment_status": payment.paymentStatus,
-                        "ticket_details": {
-                            "ticket_id": ticket.ticketId,
-                            "bus_no": ticket.bus.busNo,
-                            "bus_company": ticket.bus.busCompany.busCompany,
-                            "seat_numbers": ticket.seatNumbers,
-                            "from_stop": ticket.fromStop,
-                            "to_stop": ticket.toStop,
-                            "journey_date": ticket.bus.date.strftime("%Y-%m-%d"),
-                            "price": ticket.ticketPrice,
-                        }
-                    },
-                    status=status.HTTP_200_OK
-                )
-            else:
+        with transaction.atomic():
+            # The ticket lock orders this payment against a second one for the same ticket and against
+            # expire_holds, which takes the same lock before it releases an unpaid hold.
+            ticket = TicketModel.objects.select_for_update(of=("self",)).select_related("bus__busCompany") \
+                .filter(ticketId=ticket.ticketId).first()
+            if ticket is None:
+                return Response({"error": "This ticket was cancelled or released before the payment."},
+                                status=status.HTTP_410_GONE)
+            if waitlist.hold_expired(ticket):
+                return Response({"error": "The seat hold on this ticket expired. Its seats are being released."},
+                                status=status.HTTP_410_GONE)
+            # Check if a payment already exists
+            payment, created = PaymentModel.objects.select_for_update().get_or_create(
+                customer_id=ticket.customer_id,
+                ticket=ticket,
+                defaults={"paymentStatus": "Paid"}
+            )
+            already_paid = not created and payment.paymentStatus == "Paid"
+            if not created and not already_paid:
                 payment.paymentStatus = "Paid"
                 payment.save(update_fields=["paymentStatus"])
+            if not already_paid:
+                rollups.record_payment(ticket)
+                waitlist.confirm_hold(ticket)
+                outbox.publish(outbox.payment_paid(ticket.bus_id, ticket.ticketId, ticket.customer_id, payment.id,
+                                                   ticket.ticketPrice))
+
+        if already_paid:
+            return Response(
+                {
+                    "message": "Payment has already been made for this ticket.",
+                    "payment_id": payment.id,
+                    "payment_status": payment.paymentStatus,
+                    "ticket_details": {
+                        "ticket_id": ticket.ticketId,
+                        "bus_no": ticket.bus.busNo,
+                        "bus_company": ticket.bus.busCompany.busCompany,
+                        "seat_numbers": ticket.seatNumbers,
+                        "from_stop": ticket.fromStop,
+                        "to_stop": ticket.toStop,
+                        "journey_date": ticket.bus.date.strftime("%Y-%m-%d"),
+                        "price": ticket.ticketPrice,
+                    }
+                },
+                status=status.HTTP_200_OK
+            )
 
         return Response(
             {
@@ -419,7 +659,76 @@ def make_payment(request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def customer_view_tickets(request):
-    tickets = TicketModel.objects.filter(customer=request.user.profile)
-    serializer = TicketSerializer(tickets, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    profile_id = get_profile_id(request.user)
+    tickets = TicketModel.objects.filter(customer_id=profile_id)
+    archived_tickets = ArchivedTicketModel.objects.filter(customer_id=profile_id)
+    # Archived tickets keep their ticketId, so both tables page together on it.
+    paginator = KeysetPagination()
+    rows = paginator.paginate_rows(request, [(tickets, ticket_rows), (archived_tickets, archived_ticket_rows)],
+                                   "ticketId")
+    return paginator.get_rows_response(rows)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def customer_view_waitlist(request):
+    entries = WaitlistModel.objects.filter(customer_id=get_profile_id(request.user))
+    if request.GET.get("status"):
+        entries = entries.filter(status=request.GET["status"])
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(entries, request)
+    return paginator.get_paginated_response(WaitlistSerializer(page, many=True).data)
 
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BookingUserThrottle, BookingIPThrottle])
+def join_waitlist(request):
+    """Queue for seats on a sold-out journey; they are held automatically when a cancellation frees them."""
+    profile_id = get_profile_id(request.user)
+    if not profile_id:
+        return Response({"error": "Only registered customers can join a waitlist."}, status=status.HTTP_403_FORBIDDEN)
+
+    bus_id = request.data.get("bus_id")
+    from_stop = request.data.get("from_stop")
+    to_stop = request.data.get("to_stop")
+    try:
+        seat_count = int(request.data.get("seat_count", 1))
+    except (TypeError, ValueError):
+        return Response({"error": "seat_count must be a number."}, status=status.HTTP_400_BAD_REQUEST)
+    if not bus_id:
+        return Response({"error": "Bus ID is required."}, status=status.HTTP_400_BAD_REQUEST)
+    if not from_stop or not to_stop:
+        return Response({"error": "Both from_stop and to_stop are required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        entry = waitlist.join(profile_id, bus_id, from_stop, to_stop, seat_count)
+    except waitlist.WaitlistRejected as e:
+        return Response({"error": str(e)}, status=e.status_code)
+    return Response(WaitlistSerializer(entry).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def leave_waitlist(request):
+    entry_id = request.data.get("waitlist_id")
+    if not str(entry_id).isdigit():
+        return Response({"error": "waitlist_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+    if not waitlist.leave(get_profile_id(request.user), int(entry_id)):
+        return Response({"error": "No waiting entry found. Cancel a held seat like any other ticket."},
+                        status=status.HTTP_404_NOT_FOUND)
+    return Response({"message": "Left the waitlist."}, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def ticket_document(request, ticket_id):
+    """The customer's ticket as a text document, served from the cache the notification workers fill."""
+    if not TicketModel.objects.filter(ticketId=ticket_id, customer_id=get_profile_id(request.user)).exists():
+        return Response({"error": "Ticket not found."}, status=status.HTTP_404_NOT_FOUND)
+    document = notifications.ticket_document(ticket_id)
+    if document is None:
+        return Response({"error": "Ticket not found."}, status=status.HTTP_404_NOT_FOUND)
+    response = HttpResponse(document, content_type="text/plain; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="ticket-{ticket_id}.txt"'
+    return response
@@ -0,0 +1,219 @@
+"""
+Waitlist for sold-out journeys, filled automatically as seats free up.
+
+A customer queues for ``seatCount`` seats between two stops of a bus. When a
+cancellation or an expired hold frees seats, ``fill`` runs after the commit.
+It locks the bus and builds its per-segment seat bitmasks once. It then loads
+only the Waiting entries whose stop interval overlaps the freed one, because
+no other entry can have become satisfiable, and walks them oldest first. An
+entry fits when the free mask across its hops (one OR per hop) has enough
+bits; ``SeatInventory.allocate`` picks the seats. Fitting entries are booked
+into the in-memory inventory and written with one bulk insert of tickets with
+Pending payments. The scan stops as soon as the freed hops have no free seat
+left.
+
+Each holder is notified through the outbox on the channel layer group
+``customer_<profile id>`` and has ``WAITLIST_HOLD_MINUTES`` to pay.
+``expire_holds`` (run by the ``expire_waitlist_holds`` command) releases
+unpaid holds and refills them.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from GreenBus_App import outbox, rollups
+from GreenBus_App.booking_queue import create_tickets
+from GreenBus_App.inventory import SeatInventory, mask_to_seats
+from GreenBus_App.models import BusModel, PaymentModel, RouteModel, TicketModel, WaitlistModel
+
+
+class WaitlistRejected(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def hold_duration():
+    return timedelta(minutes=getattr(settings, "WAITLIST_HOLD_MINUTES", 15))
+
+
+def join(profile_id, bus_id, from_stop, to_stop, seat_count):
+    """Queue a customer for a journey that cannot be booked right now; raises ``WaitlistRejected``."""
+    with transaction.atomic():
+        # The bus lock orders this check against the fill that runs after each cancellation.
+        bus = BusModel.objects.select_for_update().filter(id=bus_id).first()
+        if bus is None:
+            raise WaitlistRejected("Bus not found.", 404)
+        if not 1 <= seat_count <= bus.totalSeats:
+            raise WaitlistRejected(f"seat_count must be between 1 and {bus.totalSeats}.")
+
+        route_stops = list(bus.routes.order_by("stopOrder"))
+        inventory = SeatInventory.for_routes(bus, route_stops)
+        if from_stop not in inventory.positions or to_stop not in inventory.positions:
+            raise WaitlistRejected("Invalid stops selected.")
+        interval = inventory.interval(from_stop, to_stop)
+        if interval is None:
+            raise WaitlistRejected("Invalid journey selection.")
+
+        free_seats = mask_to_seats(inventory.free(*interval))
+        if len(free_seats) >= seat_count:
+            raise WaitlistRejected(f"Seats {free_seats} are available on this journey. Book them directly.", 409)
+
+        start, end = interval
+        from_order, to_order = route_stops[start].stopOrder, route_stops[end].stopOrder
+        if WaitlistModel.objects.filter(customer_id=profile_id, bus=bus, status="Waiting",
+                                        fromStopOrder=from_order, toStopOrder=to_order).exists():
+            raise WaitlistRejected("You are already on the waitlist for this journey.", 409)
+        return WaitlistModel.objects.create(customer_id=profile_id, bus=bus, fromStop=from_stop, toStop=to_stop,
+                                            fromStopOrder=from_order, toStopOrder=to_order, seatCount=seat_count)
+
+
+def leave(profile_id, entry_id):
+    """Cancel a Waiting entry of the customer; returns whether there was one."""
+    return bool(WaitlistModel.objects.filter(id=entry_id, customer_id=profile_id, status="Waiting")
+                .update(status="Cancelled"))
+
+
+def confirm_hold(ticket):
+    """Called once a ticket is paid: a hold on it becomes a confirmed booking."""
+    WaitlistModel.objects.filter(ticket=ticket, status="Held").update(status="Confirmed")
+
+
+def hold_expired(ticket, now=None):
+    """Whether ``ticket`` was booked for a hold whose time to pay has run out."""
+    return WaitlistModel.objects.filter(ticket=ticket, status="Held", holdExpiresAt__lte=now or timezone.now()).exists()
+
+
+def release_ticket(ticket):
+    """Called inside the transaction that cancels ``ticket``; its seats go to the waitlist after the commit."""
+    WaitlistModel.objects.filter(ticket=ticket).exclude(status="Cancelled").update(status="Cancelled")
+    schedule_fill(ticket.bus_id, ticket.fromStopOrder, ticket.toStopOrder)
+
+
+def schedule_fill(bus_id, from_order, to_order):
+    if from_order is None or to_order is None:
+        return
+    # robust: the cancellation has committed, so a failed fill must not turn its response into an error.
+    transaction.on_commit(lambda: fill(bus_id, from_order, to_order), robust=True)
+
+
+def fill(bus_id, from_order, to_order):
+    """Hold seats for the Waiting entries that overlap the freed stops ``[from_order, to_order)``."""
+    with transaction.atomic():
+        bus = BusModel.objects.select_for_update().select_related("busCompany").filter(id=bus_id).first()
+        if bus is None:
+            return []
+        # skip_locked: an entry being left right now is not worth waiting for.
+        candidates = list(WaitlistModel.objects.select_for_update(skip_locked=True)
+                          .filter(bus_id=bus_id, status="Waiting", fromStopOrder__lt=to_order,
+                                  toStopOrder__gt=from_order)
+                          .order_by("id"))
+        if not candidates:
+            return []
+
+        route_stops = list(bus.routes.order_by("stopOrder"))
+        inventory = SeatInventory.for_routes(bus, route_stops)
+        freed = inventory.order_interval(from_order, to_order) or (0, len(inventory.segments))
+
+        held = []
+        for entry in candidates:
+            if not any(inventory.free(segment, segment + 1) for segment in range(*freed)):
+                break
+            interval = inventory.order_interval(entry.fromStopOrder, entry.toStopOrder)
+            if interval is None:
+                continue
+            mask = inventory.allocate(*interval, entry.seatCount)
+            if not mask:
+                continue
+            inventory.book(*interval, mask)
+            held.append((entry, interval, mask_to_seats(mask)))
+        if not held:
+            return []
+
+        tickets = create_tickets(bus, route_stops, inventory, [
+            (entry.customer_id, seats, entry.fromStop, entry.toStop, interval) for entry, interval, seats in held
+        ])
+        PaymentModel.objects.bulk_create(
+            PaymentModel(customer_id=ticket.customer_id, ticket=ticket, paymentStatus="Pending") for ticket in tickets
+        )
+        expires_at = timezone.now() + hold_duration()
+        entries = [entry for entry, _, _ in held]
+        for entry, ticket in zip(entries, tickets):
+            entry.status, entry.ticket, entry.holdExpiresAt = "Held", ticket, expires_at
+        WaitlistModel.objects.bulk_update(entries, ["status", "ticket", "holdExpiresAt"])
+
+        outbox.publish(*(
+            outbox.waitlist_update(outbox.WAITLIST_HELD, entry,
+                                   f"Seats {seats} are held for you until {expires_at:%H:%M %Z}. Pay to confirm.")
+            for entry, _, seats in held
+        ), *(
+            outbox.ticket_booked(ticket, mask_to_seats(inventory.occupied(start, end)), waitlist_hold=True)
+            for (_, (start, end), _), ticket in zip(held, tickets)
+        ))
+    return entries
+
+
+def expire_holds(now=None):
+    """Release holds left unpaid past their expiry and refill their seats; returns how many expired."""
+    now = now or timezone.now()
+    due = defaultdict(list)
+    for entry_id, bus_id in (WaitlistModel.objects.filter(status="Held", holdExpiresAt__lte=now)
+                             .values_list("id", "bus_id")):
+        due[bus_id].append(entry_id)
+    return sum(_expire_bus_holds(bus_id, entry_ids) for bus_id, entry_ids in due.items())
+
+
+def _expire_bus_holds(bus_id, entry_ids):
+    with transaction.atomic():
+        bus = BusModel.objects.select_for_update().filter(id=bus_id).first()
+        if bus is None:
+            return 0
+        # Tickets are locked before their payments and holds, in the order make_payment takes them, so a
+        # payment in flight either commits before this decision or finds the ticket gone.
+        ticket_ids = list(WaitlistModel.objects.filter(id__in=entry_ids, status="Held", ticket__isnull=False)
+                          .values_list("ticket_id", flat=True))
+        list(TicketModel.objects.select_for_update().filter(ticketId__in=ticket_ids).values_list("ticketId"))
+        unpaid = set(PaymentModel.objects.select_for_update()
+                     .filter(ticket_id__in=ticket_ids, paymentStatus="Pending").values_list("ticket_id", flat=True))
+        entries = list(WaitlistModel.objects.select_for_update(skip_locked=True, of=("self",))
+                       .filter(id__in=entry_ids, status="Held").select_related("ticket"))
+        expired = [entry for entry in entries if entry.ticket_id is None or entry.ticket_id in unpaid]
+        confirmed = [entry.id for entry in entries if entry not in expired]
+        if confirmed:
+            WaitlistModel.objects.filter(id__in=confirmed).update(status="Confirmed")
+        if not expired:
+            return 0
+
+        tickets = [entry.ticket for entry in expired if entry.ticket_id]
+        for ticket in tickets:
+            rollups.record_cancellation(ticket, was_paid=False)
+        WaitlistModel.objects.filter(id__in=[entry.id for entry in expired]).update(status="Expired", ticket=None)
+        TicketModel.objects.filter(ticketId__in=[ticket.ticketId for ticket in tickets]).delete()
+
+        events = []
+        if tickets:
+            route_stops = list(bus.routes.order_by("stopOrder"))
+            inventory = SeatInventory.for_routes(bus, route_stops)
+            for position, stop in enumerate(route_stops[:-1]):
+                stop.bookedSeats = mask_to_seats(inventory.segments[position])
+            RouteModel.objects.bulk_update(route_stops[:-1], ["bookedSeats"])
+            bus.update_seat_status()
+            for ticket in tickets:
+                interval = inventory.order_interval(ticket.fromStopOrder, ticket.toStopOrder)
+                booked = mask_to_seats(inventory.occupied(*interval)) if interval else []
+                events.append(outbox.ticket_cancelled(ticket, booked, reason="hold expired"))
+            schedule_fill(bus_id, min(ticket.fromStopOrder for ticket in tickets),
+                          max(ticket.toStopOrder for ticket in tickets))
+
+        for entry in expired:
+            entry.status, entry.holdExpiresAt = "Expired", None
+        outbox.publish(*(
+            outbox.waitlist_update(outbox.WAITLIST_EXPIRED, entry,
+                                   "Your seat hold expired before payment and the seats were released.")
+            for entry in expired
+        ), *events)
+    return len(expired)
+